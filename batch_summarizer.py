@@ -0,0 +1,421 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import sys
+import time
+from typing import Callable, Dict, Any, Iterable, List, Optional, TextIO
+
+import aiohttp
+
+from collections import deque
+
+from tools.yt_transcript import (get_transcript_with_segments, canonical_video_key, TranscriptPrefetcher,
+                                 TRANSCRIPT_PREFETCH_WORKERS)
+from llm_endpoint import (
+    LLMClient,
+    get_client,
+    call_model_async,
+    chunk_transcript,
+    count_tokens,
+    merge_batch_results_async,
+    build_summary_prompt,
+    build_notes_prompt,
+    summarize_notes_async,
+    process_extractive_transcript,
+    SUMMARY_MODE,
+    SUMMARY_MODES,
+    SUMMARY_EXTRACTIVE_FALLBACK,
+)
+from transcript_cleaning import reduce_transcript, TRANSCRIPT_REDUCTION_RATIO
+from metrics import get_metrics
+from chapters import SUMMARY_CHAPTERS, process_chapter_transcript_async
+from video_cache import VideoCache
+from request_coalescer import AsyncCoalescer
+
+class BatchSummarizer:
+    
+    def __init__(self, tone: str = "casual recap", fetch_concurrency: int = 4, map_concurrency: int = 16,
+                 merge_concurrency: int = 4, max_in_flight: int = 32, max_tokens: int = 3000,
+                 cache: Optional[VideoCache] = None, client: Optional[LLMClient] = None, skip_cached: bool = True,
+                 fetcher: Callable = get_transcript_with_segments, chapters: bool = SUMMARY_CHAPTERS,
+                 mode: str = SUMMARY_MODE, fallback: bool = SUMMARY_EXTRACTIVE_FALLBACK):
+        if mode not in SUMMARY_MODES:
+            raise ValueError(f"Unknown summary mode {mode!r}, expected one of {', '.join(SUMMARY_MODES)}")
+        
+        self.tone = tone
+        self.fetch_concurrency = fetch_concurrency
+        self.map_concurrency = map_concurrency
+        self.merge_concurrency = merge_concurrency
+        self.max_in_flight = max_in_flight
+        self.max_tokens = max_tokens
+        self.cache = cache or VideoCache()
+        self.client = client or get_client()
+        self.skip_cached = skip_cached
+        self.fetcher = fetcher
+        self.chapters = chapters
+        self.mode = mode
+        self.fallback = fallback
+        self.coalescer = AsyncCoalescer()
+    
+    def open(self):
+        
+        # Semaphores belong to the loop that runs the batch, so they are made once it is running
+        self.fetch_sem = asyncio.Semaphore(self.fetch_concurrency)
+        self.map_sem = asyncio.Semaphore(self.map_concurrency)
+        self.merge_sem = asyncio.Semaphore(self.merge_concurrency)
+        self.in_flight_sem = asyncio.Semaphore(self.max_in_flight)
+    
+    async def _fetch(self, url: str, cleaning_stats: Dict[str, Any]):
+        
+        async with self.fetch_sem:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.fetcher, url, cleaning_stats)
+    
+    async def _map_chunk(self, session: aiohttp.ClientSession, chunk: str, system_prompt: str) -> Dict[str, Any]:
+        
+        async with self.map_sem:
+            return await call_model_async(session, chunk, system_prompt, self.client)
+    
+    async def summarize(self, session: aiohttp.ClientSession, url: str, tone: Optional[str] = None) -> Dict[str, Any]:
+        
+        # Links to the same video that arrive together share one fetch and one summary
+        if self.mode == "extractive":
+            return await self.summarize_extractive(url)
+        
+        tone = tone or self.tone
+        key = (canonical_video_key(url), tone)
+        record = await self.coalescer.run(key, lambda: self._summarize(session, url, tone))
+        return dict(record, url=url)
+    
+    async def summarize_extractive(self, url: str) -> Dict[str, Any]:
+        
+        # No tone and no model call, so every style shares one result
+        key = (canonical_video_key(url), "extractive")
+        record = await self.coalescer.run(key, lambda: self._extractive(url, {"url": url}, time.time()))
+        return dict(record, url=url)
+    
+    async def _extractive(self, url: str, record: Dict[str, Any], start_time: float, transcript: Optional[str] = None,
+                          segments=None, llm_error: Optional[str] = None) -> Dict[str, Any]:
+        
+        # Also stands in for a failed model call; nothing is cached, so a later run still asks the model
+        loop = asyncio.get_running_loop()
+        if transcript is None:
+            cached_data = None
+            if await loop.run_in_executor(None, self.cache.is_cached, url):
+                cached_data = await loop.run_in_executor(None, self.cache.load_video_data, url)
+            if cached_data is not None:
+                transcript, segments = cached_data["transcript"], cached_data["segments"]
+            else:
+                transcript, segments = await self._fetch(url, {})
+                if transcript.startswith("Error"):
+                    record.update({"status": "error", "stage": "fetch", "error": transcript})
+                    return record
+        
+        boundaries = segments.boundaries() if segments is not None else None
+        result = await loop.run_in_executor(None, process_extractive_transcript, transcript, boundaries, None, llm_error)
+        if "error" in result:
+            record.update({"status": "error", "stage": "summarize", "error": result["error"]})
+            return record
+        
+        record.update({
+            "status": "ok",
+            "summary": result["choices"][0]["message"]["content"],
+            "mode": "extractive",
+            "seconds": round(time.time() - start_time, 3)
+        })
+        if llm_error is not None:
+            record.update({"degraded": True, "llm_error": llm_error})
+        return record
+    
+    async def _failed(self, url: str, record: Dict[str, Any], start_time: float, result: Dict[str, Any],
+                      transcript: Optional[str] = None, segments=None) -> Dict[str, Any]:
+        
+        error = result.get("error", "Empty model response")
+        if self.fallback:
+            return await self._extractive(url, record, start_time, transcript, segments, llm_error=error)
+        record.update({"status": "error", "stage": "summarize", "error": error})
+        return record
+    
+    async def _summarize(self, session: aiohttp.ClientSession, url: str, tone: str) -> Dict[str, Any]:
+        
+        start_time = time.time()
+        record = {"url": url}
+        
+        loop = asyncio.get_running_loop()
+        if self.skip_cached and await loop.run_in_executor(None, self.cache.is_cached, url):
+            if await loop.run_in_executor(None, self.cache.load_summary, url, tone) is not None:
+                record["status"] = "cached"
+                return record
+            
+            # Another style of a video we already took notes on is a single call
+            notes = await loop.run_in_executor(None, self.cache.load_notes, url)
+            if notes is not None:
+                return await self._summarize_from_notes(session, url, tone, notes, record, start_time)
+        
+        cleaning_stats = {}
+        transcript, segments = await self._fetch(url, cleaning_stats)
+        if transcript.startswith("Error"):
+            record.update({"status": "error", "stage": "fetch", "error": transcript})
+            return record
+        
+        if cleaning_stats:
+            record["compression"] = cleaning_stats
+        
+        # Token counting and chunking are CPU work on long transcripts, so they stay off the event loop
+        boundaries = segments.boundaries() if segments is not None else None
+        if self.chapters and await loop.run_in_executor(None, count_tokens, transcript) >= self.max_tokens:
+            return await self._summarize_chapters(session, url, tone, transcript, segments, record, start_time)
+        
+        model_transcript, model_boundaries = transcript, boundaries
+        if TRANSCRIPT_REDUCTION_RATIO < 1.0:
+            model_transcript, model_boundaries, reduction_stats = await loop.run_in_executor(
+                None, reduce_transcript, transcript, boundaries
+            )
+            record["reduction"] = reduction_stats
+        
+        chunks = None
+        if await loop.run_in_executor(None, count_tokens, model_transcript) < self.max_tokens:
+            result = await self._map_chunk(session, model_transcript, build_summary_prompt(tone))
+        else:
+            chunks = await loop.run_in_executor(None, functools.partial(
+                chunk_transcript, model_transcript, max_tokens=self.max_tokens, boundaries=model_boundaries
+            ))
+            results = await asyncio.gather(*[
+                self._map_chunk(session, chunk, build_notes_prompt(i + 1, len(chunks)))
+                for i, chunk in enumerate(chunks)
+            ])
+            
+            batch_summaries = [
+                {"batch_number": i + 1, "result": result}
+                for i, result in enumerate(results)
+                if "error" not in result
+            ]
+            # A summary merged without some parts is still written, but the record says which are missing
+            record["failed_batches"] = [
+                {"batch_number": i + 1, "error": result["error"]}
+                for i, result in enumerate(results)
+                if "error" in result
+            ]
+            
+            async with self.merge_sem:
+                result = await merge_batch_results_async(batch_summaries, tone, len(chunks), session=session,
+                                                         client=self.client)
+        
+        if "error" in result or not result.get("choices"):
+            return await self._failed(url, record, start_time, result, transcript, segments)
+        
+        summary = result["choices"][0]["message"]["content"]
+        
+        # Chat sections index into the stored transcript, so a reduced model input is re-cut from the full text
+        if model_transcript is not transcript:
+            chunks = None
+            if await loop.run_in_executor(None, count_tokens, transcript) >= self.max_tokens:
+                chunks = await loop.run_in_executor(None, functools.partial(
+                    chunk_transcript, transcript, max_tokens=self.max_tokens, boundaries=boundaries
+                ))
+        
+        notes = result.get("processing_info", {}).get("notes")
+        await loop.run_in_executor(None, self.cache.save_video_data, url, transcript, summary, chunks, segments,
+                                   tone, notes)
+        
+        record.update({
+            "status": "ok",
+            "summary": summary,
+            "parts": len(chunks) if chunks else 1,
+            "seconds": round(time.time() - start_time, 3)
+        })
+        return record
+    
+    async def _summarize_chapters(self, session: aiohttp.ClientSession, url: str, tone: str, transcript: str,
+                                  segments, record: Dict[str, Any], start_time: float) -> Dict[str, Any]:
+        
+        # Chapters summarized on an earlier run of this video are reused when their text has not changed
+        loop = asyncio.get_running_loop()
+        previous = await loop.run_in_executor(None, self.cache.load_chapters, url)
+        
+        result = await process_chapter_transcript_async(transcript, tone, segments, previous, session,
+                                                        client=self.client)
+        
+        if "error" in result or not result.get("choices"):
+            return await self._failed(url, record, start_time, result, transcript, segments)
+        
+        summary = result["choices"][0]["message"]["content"]
+        info = result["processing_info"]
+        chunks = await loop.run_in_executor(None, functools.partial(
+            chunk_transcript, transcript, max_tokens=self.max_tokens,
+            boundaries=segments.boundaries() if segments is not None else None
+        ))
+        # Saving a changed transcript drops the old chapters, so the new ones are stored after it
+        await loop.run_in_executor(None, self.cache.save_video_data, url, transcript, summary, chunks, segments,
+                                   tone, info.get("notes"))
+        await loop.run_in_executor(None, self.cache.save_chapters, url, info["chapters"])
+        
+        record.update({
+            "status": "ok",
+            "summary": summary,
+            "parts": len(info["chapters"]),
+            "chapters": [
+                {key: chapter[key] for key in ("index", "title", "start_time", "end_time", "summary")}
+                for chapter in info["chapters"]
+            ],
+            "reused_chapters": info["reused_chapters"],
+            "seconds": round(time.time() - start_time, 3)
+        })
+        return record
+    
+    async def _summarize_from_notes(self, session: aiohttp.ClientSession, url: str, tone: str, notes: Dict[str, Any],
+                                    record: Dict[str, Any], start_time: float) -> Dict[str, Any]:
+        
+        async with self.merge_sem:
+            result = await summarize_notes_async(notes, tone, session, client=self.client)
+        
+        if "error" in result or not result.get("choices"):
+            return await self._failed(url, record, start_time, result)
+        
+        summary = result["choices"][0]["message"]["content"]
+        await asyncio.get_running_loop().run_in_executor(None, self.cache.save_summary, url, tone, summary)
+        
+        record.update({
+            "status": "ok",
+            "summary": summary,
+            "parts": notes["total_parts"],
+            "from_notes": True,
+            "seconds": round(time.time() - start_time, 3)
+        })
+        return record
+    
+    async def _summarize_safe(self, session: aiohttp.ClientSession, url: str) -> Dict[str, Any]:
+        
+        try:
+            return await self.summarize(session, url)
+        except Exception as e:
+            return {"url": url, "status": "error", "stage": "pipeline", "error": str(e)}
+        finally:
+            self.in_flight_sem.release()
+    
+    async def run(self, urls: Iterable[str], out: TextIO) -> Dict[str, int]:
+        
+        self.open()
+        
+        counts = {"ok": 0, "cached": 0, "error": 0}
+        
+        def write_record(task: asyncio.Task):
+            record = task.result()
+            counts[record["status"]] += 1
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+        
+        session = self.client.async_session()
+        tasks = set()
+        
+        try:
+            for url in urls:
+                await self.in_flight_sem.acquire()
+                task = asyncio.create_task(self._summarize_safe(session, url))
+                task.add_done_callback(write_record)
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            await self.client.close_async_session()
+        
+        return counts
+
+def read_urls(source: TextIO) -> Iterable[str]:
+    
+    seen = set()
+    for line in source:
+        url = line.strip()
+        if not url or url.startswith("#"):
+            continue
+        
+        key = canonical_video_key(url)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield url
+
+def read_ahead(urls: Iterable[str], prefetcher: TranscriptPrefetcher, lookahead: int,
+               skip: Callable[[str], bool] = lambda url: False) -> Iterable[str]:
+    
+    # Transcripts for the next `lookahead` URLs download in the background while earlier ones are summarized
+    window = deque()
+    for url in urls:
+        if not skip(url):
+            prefetcher.submit(url)
+        window.append(url)
+        if len(window) > lookahead:
+            yield window.popleft()
+    yield from window
+
+def main(argv: Optional[List[str]] = None):
+    
+    parser = argparse.ArgumentParser(description="Summarize many YouTube videos and stream the results as JSONL.")
+    parser.add_argument("input", nargs="?", default="-", help="File with one URL per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file, or - for stdout")
+    parser.add_argument("--tone", default="casual recap")
+    parser.add_argument("--fetch-concurrency", type=int, default=4)
+    parser.add_argument("--map-concurrency", type=int, default=16)
+    parser.add_argument("--merge-concurrency", type=int, default=4)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--no-skip-cached", action="store_true", help="Summarize URLs even if they are already cached")
+    parser.add_argument("--prefetch-workers", type=int, default=TRANSCRIPT_PREFETCH_WORKERS,
+                        help="Threads that download upcoming transcripts ahead of summarization, 0 to disable")
+    parser.add_argument("--chapters", action="store_true", default=SUMMARY_CHAPTERS,
+                        help="Split long videos into topical chapters and summarize each one")
+    parser.add_argument("--mode", choices=SUMMARY_MODES, default=SUMMARY_MODE,
+                        help="llm for model summaries, extractive for key transcript passages picked locally")
+    parser.add_argument("--no-fallback", action="store_true",
+                        help="Report model failures as errors instead of falling back to an extractive summary")
+    parser.add_argument("--metrics-json", help="Write stage timings, token counts and cache hit ratios to this file")
+    args = parser.parse_args(argv)
+    
+    pool_size = args.map_concurrency + args.merge_concurrency
+    summarizer = BatchSummarizer(
+        tone=args.tone,
+        fetch_concurrency=args.fetch_concurrency,
+        map_concurrency=args.map_concurrency,
+        merge_concurrency=args.merge_concurrency,
+        max_in_flight=args.max_in_flight,
+        client=LLMClient(pool_size=pool_size, per_host_limit=pool_size),
+        skip_cached=not args.no_skip_cached,
+        chapters=args.chapters,
+        mode=args.mode,
+        fallback=SUMMARY_EXTRACTIVE_FALLBACK and not args.no_fallback
+    )
+    
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    
+    urls = read_urls(source)
+    prefetcher = None
+    if args.prefetch_workers > 0:
+        prefetcher = TranscriptPrefetcher(workers=args.prefetch_workers)
+        skip = summarizer.cache.is_cached if summarizer.skip_cached else (lambda url: False)
+        urls = read_ahead(urls, prefetcher, args.max_in_flight * 2, skip)
+    
+    start_time = time.time()
+    try:
+        # Progress messages from the pipeline go to stderr so stdout stays valid JSONL
+        with contextlib.redirect_stdout(sys.stderr):
+            counts = asyncio.run(summarizer.run(urls, out))
+    finally:
+        if prefetcher is not None:
+            prefetcher.close(wait=False)
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    
+    print(f"Done in {time.time() - start_time:.2f} seconds: "
+          f"{counts['ok']} summarized, {counts['cached']} cached, {counts['error']} failed", file=sys.stderr)
+    
+    if args.metrics_json:
+        get_metrics().dump(args.metrics_json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import time
+
+import aiohttp
+import requests
+
+from benchmarks.stub_llm_server import StubLLMServer
+from llm_endpoint import LLMClient, build_payload, headers
+
+def bench_sync(server: StubLLMServer, calls: int):
+    
+    payload = build_payload("Some transcript text. " * 50, "Summarize this.")
+    
+    server.reset_stats()
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        requests.post(server.url, headers=headers, json=payload, timeout=60).json()
+    fresh = (time.perf_counter() - start_time, len(server.connections))
+    
+    client = LLMClient(api_url=server.url, use_cache=False)
+    server.reset_stats()
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        client.post(payload)
+    pooled = (time.perf_counter() - start_time, len(server.connections))
+    client.close()
+    
+    return fresh, pooled
+
+async def bench_async(server: StubLLMServer, videos: int, chunks_per_video: int):
+    
+    payload = build_payload("Some transcript text. " * 50, "Summarize this.")
+    
+    # Old behaviour: one session for the chunk fan-out plus another one for the merge, per video
+    server.reset_stats()
+    start_time = time.perf_counter()
+    for _ in range(videos):
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=10)) as session:
+            await asyncio.gather(*[
+                session.post(server.url, headers=headers, json=payload) for _ in range(chunks_per_video)
+            ])
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=1)) as session:
+            async with session.post(server.url, headers=headers, json=payload) as response:
+                await response.json()
+    fresh = (time.perf_counter() - start_time, len(server.connections))
+    
+    client = LLMClient(api_url=server.url, use_cache=False)
+    server.reset_stats()
+    start_time = time.perf_counter()
+    for _ in range(videos):
+        await asyncio.gather(*[client.post_async(payload) for _ in range(chunks_per_video)])
+        await client.post_async(payload)
+    pooled = (time.perf_counter() - start_time, len(server.connections))
+    await client.close_async_session()
+    
+    return fresh, pooled
+
+def report(label: str, calls: int, fresh, pooled):
+    
+    print(f"\n{label} ({calls} requests)")
+    print(f"  fresh connections: {fresh[0]:.3f}s, {fresh[1]} TCP connections, {fresh[0] / calls * 1000:.2f} ms/request")
+    print(f"  shared pool:       {pooled[0]:.3f}s, {pooled[1]} TCP connections, {pooled[0] / calls * 1000:.2f} ms/request")
+
+async def main(args):
+    
+    server = StubLLMServer(latency=args.latency)
+    await server.start()
+    
+    try:
+        loop = asyncio.get_running_loop()
+        fresh, pooled = await loop.run_in_executor(None, bench_sync, server, args.calls)
+        report("Sync calls (call_model_single / chat turns)", args.calls, fresh, pooled)
+        
+        fresh, pooled = await bench_async(server, args.videos, args.chunks)
+        report(f"Async map + merge ({args.videos} videos x {args.chunks} chunks)",
+               args.videos * (args.chunks + 1), fresh, pooled)
+    finally:
+        await server.stop()
+    
+    print("\nEvery connection avoided is one TCP (and, against a real endpoint, TLS) handshake saved.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fresh HTTP connections with the shared LLMClient pool")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--videos", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from llm_endpoint import LLMClient, build_payload
+from rate_limiter import AdaptiveLimiter
+
+async def summarize_videos(client: LLMClient, videos: int, chunks_per_video: int):
+    
+    # Every video maps its chunks at once, like process_batched_transcript_async, and all videos run together
+    async def video(v: int):
+        return await asyncio.gather(*[
+            client.post_async(build_payload(f"Video {v} chunk {c}. " * 40, "Summarize this."))
+            for c in range(chunks_per_video)
+        ])
+    
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*[video(v) for v in range(videos)])
+    elapsed = time.perf_counter() - start_time
+    
+    failed = sum(1 for chunks in results for result in chunks if "error" in result)
+    return elapsed, failed
+
+async def run_case(server: StubLLMServer, label: str, client: LLMClient, videos: int, chunks: int):
+    
+    server.reset_stats()
+    elapsed, failed = await summarize_videos(client, videos, chunks)
+    await client.close_async_session()
+    
+    total = videos * chunks
+    print(f"\n{label}")
+    print(f"  {total - failed}/{total} chunks summarized, {failed} lost, {elapsed:.2f}s")
+    print(f"  {server.requests} requests sent, {server.rejected} answered 429, peak {server.peak_active} in flight")
+    print(f"  limiter: {client.limiter.stats()}")
+
+async def main(args):
+    
+    server = StubLLMServer(latency=args.latency, max_concurrent=args.max_concurrent,
+                           error_rate=args.error_rate, retry_after=args.retry_after)
+    await server.start()
+    
+    try:
+        # Old behaviour: fire everything, no retries, so every 429 drops a chunk from the merge
+        fixed = AdaptiveLimiter(initial=args.pool, min_limit=args.pool, max_limit=args.pool)
+        client = LLMClient(api_url=server.url, use_cache=False, limiter=fixed, max_retries=0, pool_size=args.pool)
+        await run_case(server, "Fixed concurrency, no retries", client, args.videos, args.chunks)
+        
+        adaptive = AdaptiveLimiter(initial=args.pool, max_limit=args.pool)
+        client = LLMClient(api_url=server.url, use_cache=False, limiter=adaptive, pool_size=args.pool)
+        await run_case(server, "AIMD limiter with Retry-After and jittered backoff", client, args.videos, args.chunks)
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize many chunks against a stub that rate limits with 429s")
+    parser.add_argument("--videos", type=int, default=6)
+    parser.add_argument("--chunks", type=int, default=12)
+    parser.add_argument("--pool", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--max-concurrent", type=int, default=8)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
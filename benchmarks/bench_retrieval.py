@@ -0,0 +1,86 @@
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from benchmarks.synthetic import make_snippets
+from lexical_index import BM25Index
+from semantic_index import SemanticIndex, fuse_rankings, get_embedder, semantic_available
+from transcript_segments import TranscriptSegments
+
+QUERIES = [
+    "how do they train the network",
+    "what does the index do for lookups",
+    "tips for getting more customers",
+    "what temperature should the oven be",
+    "is investing in funds risky",
+    "how should I play the solo",
+    "what happens to the oceans",
+    "how did the founders raise money",
+    "how can I sleep better",
+    "what tactics did the team use",
+]
+
+def latency(fn, repeats: int):
+    
+    samples = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            start_time = time.perf_counter()
+            fn(query)
+            samples.append((time.perf_counter() - start_time) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+def run(hours: float, repeats: int):
+    
+    transcript, segments = TranscriptSegments.from_snippets(make_snippets(hours * 3600))
+    print(f"\n{hours:g} hour transcript: {len(transcript)} characters, {len(segments)} caption snippets")
+    
+    start_time = time.perf_counter()
+    index = BM25Index.build(transcript, segments.boundaries())
+    print(f"  BM25 build:       {time.perf_counter() - start_time:.3f}s for {len(index)} passages, "
+          f"{len(index.to_bytes()) / 1024:.0f} KiB serialized")
+    
+    p50, p99 = latency(lambda query: index.search(query, 5), repeats)
+    print(f"  BM25 query:       p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+    
+    if not semantic_available():
+        print("  NumPy is not installed, skipping the semantic index")
+        return
+    
+    passages = [transcript[start:end] for start, end in (index.span(i) for i in range(len(index)))]
+    embedder = get_embedder()
+    
+    start_time = time.perf_counter()
+    semantic_index = SemanticIndex.build(passages, embedder)
+    build_time = time.perf_counter() - start_time
+    
+    # Measured on a second build so tracing overhead does not skew the timing above
+    tracemalloc.start()
+    SemanticIndex.build(passages, embedder)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    print(f"  Embedding build:  {build_time:.3f}s with {embedder.name}, "
+          f"vectors {semantic_index.vectors.nbytes / 1024:.0f} KiB, peak {peak / 1024 / 1024:.1f} MiB")
+    
+    p50, p99 = latency(lambda query: semantic_index.search(query, 5), repeats)
+    print(f"  Semantic query:   p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+    
+    start_time = time.perf_counter()
+    semantic_index.search_many(QUERIES * repeats, 5)
+    batched = (time.perf_counter() - start_time) * 1000 / (len(QUERIES) * repeats)
+    print(f"  Semantic batched: {batched:.3f} ms per query")
+    
+    p50, p99 = latency(lambda query: fuse_rankings([index.search(query, 10), semantic_index.search(query, 10)], 5), repeats)
+    print(f"  Hybrid query:     p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index build time, query latency and memory for chat retrieval")
+    parser.add_argument("--hours", default="1,4,10", help="Comma-separated transcript lengths in hours")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    
+    for hours in args.hours.split(","):
+        run(float(hours), args.repeats)
@@ -0,0 +1,101 @@
+import argparse
+import hashlib
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from video_cache import VideoCache
+
+def make_entry(i: int, transcript_chars: int):
+    
+    url = f"https://www.youtube.com/watch?v=bench{i:06d}"
+    transcript = ("word " * (transcript_chars // 5))[:transcript_chars]
+    timestamp = (datetime(2024, 1, 1) + timedelta(seconds=i)).isoformat()
+    return url, transcript, f"Summary for video {i}", timestamp
+
+def populate_pickles(cache_dir: str, entries: int, transcript_chars: int):
+    
+    # Same layout the pickle-per-file VideoCache used to write
+    for i in range(entries):
+        url, transcript, summary, timestamp = make_entry(i, transcript_chars)
+        video_data = {
+            "url": url,
+            "transcript": transcript,
+            "summary": summary,
+            "chunks": [],
+            "timestamp": timestamp,
+            "transcript_length": len(transcript)
+        }
+        video_hash = hashlib.md5(url.encode()).hexdigest()
+        with open(os.path.join(cache_dir, f"{video_hash}_data.pkl"), 'wb') as f:
+            pickle.dump(video_data, f)
+
+def legacy_list(cache_dir: str):
+    
+    cached_videos = []
+    for filename in os.listdir(cache_dir):
+        if filename.endswith("_data.pkl"):
+            with open(os.path.join(cache_dir, filename), 'rb') as f:
+                video_data = pickle.load(f)
+                cached_videos.append({
+                    "url": video_data["url"],
+                    "timestamp": video_data["timestamp"],
+                    "length": video_data["transcript_length"]
+                })
+    return sorted(cached_videos, key=lambda x: x["timestamp"], reverse=True)
+
+def legacy_is_cached(cache_dir: str, url: str) -> bool:
+    
+    cache_path = os.path.join(cache_dir, f"{hashlib.md5(url.encode()).hexdigest()}_data.pkl")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f) is not None
+    return False
+
+def timed(fn, *args):
+    
+    start_time = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start_time, result
+
+def run(entries: int, transcript_chars: int, lookups: int):
+    
+    cache_dir = tempfile.mkdtemp(prefix="bench_video_cache_")
+    try:
+        populate_pickles(cache_dir, entries, transcript_chars)
+        
+        migrate_time, cache = timed(VideoCache, cache_dir)
+        urls = [make_entry(random.randrange(entries), 0)[0] for _ in range(lookups)]
+        
+        legacy_list_time, _ = timed(legacy_list, cache_dir)
+        sqlite_list_time, _ = timed(cache.list_cached_videos)
+        sqlite_page_time, _ = timed(cache.list_cached_videos, 50, entries // 2)
+        
+        legacy_lookup_time, _ = timed(lambda: [legacy_is_cached(cache_dir, url) for url in urls])
+        sqlite_lookup_time, _ = timed(lambda: [cache.is_cached(url) for url in urls])
+        sqlite_load_time, _ = timed(lambda: [cache.load_video_data(url) for url in urls])
+        
+        print(f"\n{entries} cached videos ({transcript_chars} character transcripts)")
+        print(f"  one-shot pickle migration:       {migrate_time:.2f}s")
+        print(f"  list all, pickle files:          {legacy_list_time * 1000:.1f} ms")
+        print(f"  list all, SQLite:                {sqlite_list_time * 1000:.1f} ms")
+        print(f"  list one page of 50, SQLite:     {sqlite_page_time * 1000:.2f} ms")
+        print(f"  is_cached x{lookups}, pickle files: {legacy_lookup_time / lookups * 1e6:.1f} us/lookup")
+        print(f"  is_cached x{lookups}, SQLite:       {sqlite_lookup_time / lookups * 1e6:.1f} us/lookup")
+        print(f"  load_video_data x{lookups}, SQLite: {sqlite_load_time / lookups * 1e6:.1f} us/lookup")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare pickle-per-file and SQLite VideoCache listing and lookups")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated numbers of cached videos")
+    parser.add_argument("--transcript-chars", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+    
+    for size in args.sizes.split(","):
+        run(int(size), args.transcript_chars, args.lookups)
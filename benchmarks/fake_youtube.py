@@ -0,0 +1,54 @@
+import contextlib
+import re
+import time
+from typing import Iterator, List
+
+import tools.yt_transcript as yt_transcript
+from benchmarks.synthetic import make_snippets
+
+_VIDEO_ID_RE = re.compile(r"^s(\d{6})(\d{4})$")
+
+class FakeSnippet:
+    
+    __slots__ = ("text", "start", "duration")
+    
+    def __init__(self, text: str, start: float, duration: float):
+        self.text = text
+        self.start = start
+        self.duration = duration
+
+class FakeTranscriptApi:
+    
+    # Stands in for YouTubeTranscriptApi: every ID made by video_url() carries its own length and seed
+    fetch_latency = 0.0
+    fetches = 0
+    
+    def fetch(self, video_id: str, languages=("en",)) -> List[FakeSnippet]:
+        
+        match = _VIDEO_ID_RE.match(video_id)
+        if match is None:
+            raise ValueError(f"No synthetic transcript for video {video_id}")
+        
+        FakeTranscriptApi.fetches += 1
+        if self.fetch_latency:
+            time.sleep(self.fetch_latency)
+        
+        minutes = int(match.group(1)) / 10
+        return [FakeSnippet(*snippet) for snippet in make_snippets(minutes * 60, seed=int(match.group(2)))]
+
+def video_url(minutes: float, variant: int = 0) -> str:
+    
+    # Eleven characters like a real ID: "s", the length in tenths of a minute, then a variant that seeds the text
+    return f"https://www.youtube.com/watch?v=s{round(minutes * 10):06d}{variant % 10000:04d}"
+
+@contextlib.contextmanager
+def fake_youtube(fetch_latency: float = 0.0) -> Iterator[type]:
+    
+    original = yt_transcript.YouTubeTranscriptApi
+    FakeTranscriptApi.fetch_latency = fetch_latency
+    FakeTranscriptApi.fetches = 0
+    yt_transcript.YouTubeTranscriptApi = FakeTranscriptApi
+    try:
+        yield FakeTranscriptApi
+    finally:
+        yt_transcript.YouTubeTranscriptApi = original
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from batch_summarizer import BatchSummarizer
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.synthetic import make_snippets
+from llm_endpoint import LLMClient
+from metrics import get_metrics
+from server import SummaryService, create_app
+from tools.yt_transcript import extract_video_id
+from transcript_segments import TranscriptSegments
+from video_cache import VideoCache
+
+def synthetic_fetcher(minutes: float):
+    
+    # Stands in for YouTube: every video ID gets its own deterministic transcript
+    def fetch(url: str, cleaning_stats=None):
+        seed = sum(ord(c) for c in extract_video_id(url))
+        return TranscriptSegments.from_snippets(make_snippets(minutes * 60, seed=seed))
+    
+    return fetch
+
+def percentile(samples, fraction: float) -> float:
+    
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def run_load(base_url: str, requests: int, concurrency: int, videos: int):
+    
+    urls = [f"https://youtu.be/load{v:07d}" for v in range(videos)]
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async with aiohttp.ClientSession() as session:
+        async def one(i: int):
+            async with semaphore:
+                start_time = time.perf_counter()
+                async with session.post(f"{base_url}/summarize", json={"url": urls[i % videos], "wait": True}) as response:
+                    await response.read()
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                latencies.append(time.perf_counter() - start_time)
+        
+        start_time = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(requests)])
+        elapsed = time.perf_counter() - start_time
+    
+    return latencies, statuses, elapsed
+
+async def main(args):
+    
+    llm = StubLLMServer(latency=args.llm_latency)
+    await llm.start()
+    
+    cache_dir = tempfile.mkdtemp(prefix="load_test_cache_")
+    cache = VideoCache(cache_dir)
+    summarizer = BatchSummarizer(cache=cache, client=LLMClient(api_url=llm.url, use_cache=False),
+                                 fetcher=synthetic_fetcher(args.video_minutes))
+    service = SummaryService(workers=args.workers, queue_size=args.queue_size, summarizer=summarizer, cache=cache)
+    
+    runner = web.AppRunner(create_app(service), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    
+    try:
+        latencies, statuses, elapsed = await run_load(base_url, args.requests, args.concurrency, args.videos)
+    finally:
+        await runner.cleanup()
+        await llm.stop()
+    
+    print(f"\n{args.requests} summarize requests for {args.videos} distinct videos, {args.concurrency} concurrent clients")
+    print(f"  statuses:   {statuses}")
+    print(f"  throughput: {args.requests / elapsed:.1f} requests/s over {elapsed:.2f}s")
+    print(f"  latency:    p50 {statistics.median(latencies) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+    print(f"  LLM calls:  {llm.requests} (identical requests were coalesced or served from the cache)")
+    
+    snapshot = get_metrics().snapshot()
+    for histogram in snapshot["histograms"]:
+        if histogram["name"] == "stage_seconds":
+            label = ",".join(f"{k}={v}" for k, v in sorted(histogram["labels"].items()))
+            print(f"  {label:<32} n={histogram['count']:<5} mean {histogram['mean'] * 1000:.1f} ms, "
+                  f"p99 <= {histogram['p99'] * 1000:.0f} ms")
+    print(f"  cache hit ratios: {snapshot['cache_hit_ratio']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the HTTP server against a stub LLM and synthetic transcripts")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--videos", type=int, default=40)
+    parser.add_argument("--video-minutes", type=float, default=30)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-size", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
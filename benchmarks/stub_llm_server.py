@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+from aiohttp import web
+
+class StubLLMServer:
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 max_concurrent: int = 0, error_rate: float = 0.0, retry_after: float = 0.5, seed: int = 0,
+                 tokens_per_second: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.max_concurrent = max_concurrent
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.rejected = 0
+        self.active = 0
+        self.peak_active = 0
+        self.connections = set()
+        self._runner = None
+        self._loop = None
+        self._thread = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1/chat/completions"
+    
+    async def stream_completion(self, request: web.Request, payload: dict, reply: str) -> web.StreamResponse:
+        
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i, word in enumerate(reply.split()):
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            chunk = {"choices": [{"index": 0, "delta": {"content": (" " if i else "") + word}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        
+        usage = {"prompt_tokens": len(payload["messages"][-1]["content"]) // 4, "completion_tokens": len(reply.split())}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        await response.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+    
+    async def handle_completion(self, request: web.Request) -> web.Response:
+        
+        # Every new TCP connection shows up with a fresh client port
+        self.connections.add(request.transport.get_extra_info("peername"))
+        self.requests += 1
+        
+        payload = await request.json()
+        
+        # Behave like a provider at its quota: over the concurrency cap, or at random, answer 429
+        if (self.max_concurrent and self.active >= self.max_concurrent) or self.random.random() < self.error_rate:
+            self.rejected += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return await self.completion_response(request, payload)
+        finally:
+            self.active -= 1
+    
+    async def completion_response(self, request: web.Request, payload: dict) -> web.StreamResponse:
+        
+        content = payload["messages"][-1]["content"]
+        words = content.split()
+        if payload.get("stream"):
+            return await self.stream_completion(request, payload, " ".join(words[:50]) or "Nothing to summarize.")
+        
+        # Decoding speed: a non-streamed answer arrives once all of its tokens would have been generated
+        if self.tokens_per_second:
+            await asyncio.sleep(min(len(words), 50) / self.tokens_per_second)
+        
+        return web.json_response({
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words[:50]) or "Nothing to summarize."},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": len(content) // 4,
+                "completion_tokens": min(len(words), 50),
+                "total_tokens": len(content) // 4 + min(len(words), 50)
+            }
+        })
+    
+    def reset_stats(self):
+        self.requests = 0
+        self.rejected = 0
+        self.peak_active = 0
+        self.connections = set()
+    
+    async def start(self):
+        
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_completion)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    def start_background(self) -> "StubLLMServer":
+        
+        # Serves from its own loop thread so synchronous code under test can call it
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="stub-llm-server", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self._loop).result()
+        return self
+    
+    def stop_background(self):
+        
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+async def serve(host: str, port: int, latency: float, max_concurrent: int, error_rate: float,
+                tokens_per_second: float):
+    
+    server = StubLLMServer(host, port, latency, max_concurrent, error_rate, tokens_per_second=tokens_per_second)
+    await server.start()
+    print(f"Stub LLM server listening on {server.url}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-style chat completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="Answer 429 above this many requests in flight")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Simulated decoding speed, 0 for instant")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.latency, args.max_concurrent, args.error_rate,
+                      args.tokens_per_second))
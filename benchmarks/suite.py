@@ -0,0 +1,296 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.bench_retrieval import QUERIES
+from benchmarks.fake_youtube import fake_youtube, video_url
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.synthetic import make_snippets
+from chapters import detect_chapters
+from extractive import extractive_summary
+from llm_endpoint import LLMClient, chunk_transcript, count_tokens, set_client
+from main import summarize_youtube_video
+from transcript_cache import TranscriptCache, set_transcript_cache
+from transcript_segments import TranscriptSegments
+from video_cache import VideoCache
+from video_chatbot import VideoDetailBot
+
+DURATIONS_MINUTES = (1, 10, 60, 180, 600)
+QUICK_DURATIONS_MINUTES = (1, 10, 60)
+
+def case_label(minutes: float) -> str:
+    return f"{minutes / 60:g}h" if minutes >= 60 else f"{minutes:g}m"
+
+def measure(fn: Callable[[], Any], repeats: int) -> Dict[str, float]:
+    
+    samples = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start_time) * 1000)
+    return latency_stats(samples)
+
+def latency_stats(samples_ms: List[float]) -> Dict[str, float]:
+    
+    ordered = sorted(samples_ms)
+    return {
+        "runs": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))], 3),
+        "min_ms": round(ordered[0], 3)
+    }
+
+def synthetic_transcript(minutes: float, seed: int = 0):
+    return TranscriptSegments.from_snippets(make_snippets(minutes * 60, seed=seed))
+
+def bench_chunking(durations, repeats: int) -> List[Dict[str, Any]]:
+    
+    results = []
+    for minutes in durations:
+        transcript, segments = synthetic_transcript(minutes)
+        boundaries = segments.boundaries()
+        tokens = count_tokens(transcript)
+        chunks = chunk_transcript(transcript, max_tokens=3000, boundaries=boundaries)
+        
+        stats = measure(lambda: chunk_transcript(transcript, max_tokens=3000, boundaries=boundaries), repeats)
+        results.append(dict(stats, benchmark="chunk_transcript", case=case_label(minutes), tokens=tokens,
+                            chunks=len(chunks), tokens_per_second=round(tokens / (stats["mean_ms"] / 1000))))
+    return results
+
+def bench_chapters(durations, repeats: int) -> List[Dict[str, Any]]:
+    
+    results = []
+    for minutes in durations:
+        transcript, segments = synthetic_transcript(minutes)
+        boundaries = segments.boundaries()
+        chapters = detect_chapters(transcript, boundaries, segments)
+        
+        stats = measure(lambda: detect_chapters(transcript, boundaries, segments), repeats)
+        results.append(dict(stats, benchmark="detect_chapters", case=case_label(minutes), chapters=len(chapters)))
+    return results
+
+def bench_extractive(durations, repeats: int) -> List[Dict[str, Any]]:
+    
+    results = []
+    for minutes in durations:
+        transcript, segments = synthetic_transcript(minutes)
+        boundaries = segments.boundaries()
+        _, stats = extractive_summary(transcript, boundaries)
+        
+        timing = measure(lambda: extractive_summary(transcript, boundaries), repeats)
+        results.append(dict(timing, benchmark="extractive_summary", case=case_label(minutes),
+                            passages=stats["passages"], kept_passages=stats["kept_passages"]))
+    return results
+
+def bench_summarize(stub: StubLLMServer, durations, repeats: int, progressive: bool) -> List[Dict[str, Any]]:
+    
+    # Each run gets its own video so nothing is answered by a cache or a coalesced call
+    results = []
+    on_partial = (lambda part, text: None) if progressive else None
+    for minutes in durations:
+        samples = []
+        failures = 0
+        stub.reset_stats()
+        for repeat in range(repeats):
+            url = video_url(minutes, variant=repeat + (5000 if progressive else 0))
+            start_time = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                summary, transcript, _, _ = summarize_youtube_video(url, use_batching=True, on_partial=on_partial)
+            samples.append((time.perf_counter() - start_time) * 1000)
+            if transcript is None:
+                failures += 1
+        
+        results.append(dict(latency_stats(samples), benchmark="summarize_youtube_video",
+                            case=f"{case_label(minutes)}{' progressive' if progressive else ''}",
+                            llm_requests=stub.requests, failures=failures))
+    return results
+
+def bench_retrieval(cache: VideoCache, durations, repeats: int) -> List[Dict[str, Any]]:
+    
+    results = []
+    for minutes in durations:
+        url = video_url(minutes, variant=9000)
+        transcript, segments = synthetic_transcript(minutes, seed=9000)
+        chunks = chunk_transcript(transcript, max_tokens=3000, boundaries=segments.boundaries())
+        
+        bot = VideoDetailBot(retrieval="lexical", cache=cache)
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            bot.load_video(url, transcript, "Synthetic summary.", chunks, segments)
+        load_ms = (time.perf_counter() - start_time) * 1000
+        
+        samples = []
+        for _ in range(repeats):
+            for query in QUERIES:
+                start_time = time.perf_counter()
+                bot.find_relevant_parts(query)
+                samples.append((time.perf_counter() - start_time) * 1000)
+        
+        results.append(dict(latency_stats(samples), benchmark="find_relevant_parts", case=case_label(minutes),
+                            load_video_ms=round(load_ms, 3)))
+    return results
+
+def bench_video_cache(cache: VideoCache, entries: int, minutes: float) -> List[Dict[str, Any]]:
+    
+    transcript, segments = synthetic_transcript(minutes)
+    urls = [video_url(minutes, variant=i) for i in range(entries)]
+    disk = VideoCache(cache.cache_dir, memory_bytes=0)
+    
+    def ops(label: str, fn: Callable[[str], Any]) -> Dict[str, Any]:
+        samples = []
+        for url in urls:
+            start_time = time.perf_counter()
+            fn(url)
+            samples.append((time.perf_counter() - start_time) * 1000)
+        stats = latency_stats(samples)
+        return dict(stats, benchmark="video_cache", case=label,
+                    ops_per_second=round(len(samples) / (sum(samples) / 1000)))
+    
+    results = [
+        ops(f"save {case_label(minutes)}", lambda url: cache.save_video_data(url, transcript, "Summary", [], segments))
+    ]
+    # Saving drops the memory entry, so one untimed load puts every video back in the tier before it is measured
+    for url in urls:
+        cache.load_video_data(url)
+    return results + [
+        ops(f"load {case_label(minutes)} memory", cache.load_video_data),
+        ops(f"load {case_label(minutes)} disk", disk.load_video_data),
+        ops("is_cached", cache.is_cached),
+        ops("list 50", lambda url: cache.list_cached_videos(50)),
+        dict(measure(lambda: cache.compact(max_bytes=0, dry_run=True), 3), benchmark="video_cache",
+             case=f"compact scan {entries}")
+    ]
+
+def bench_transcript_cache(cache: TranscriptCache, durations, repeats: int) -> List[Dict[str, Any]]:
+    
+    results = []
+    for minutes in durations:
+        snippets = make_snippets(minutes * 60, seed=7000)
+        video_id = video_url(minutes, variant=7000).split("v=")[1]
+        cache.set(video_id, "en", snippets)
+        raw_bytes = len(json.dumps(snippets))
+        
+        stats = measure(lambda: cache.get(video_id, ("en",)), repeats * 10)
+        stored = cache._conn.execute(
+            "SELECT LENGTH(data) FROM transcripts WHERE video_id = ?", (video_id,)
+        ).fetchone()[0]
+        results.append(dict(stats, benchmark="transcript_cache", case=f"get {case_label(minutes)}",
+                            snippets=len(snippets), compression_ratio=round(stored / raw_bytes, 3)))
+    return results
+
+def git_revision() -> Optional[str]:
+    
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float,
+            min_delta_ms: float = 1.0) -> List[str]:
+    
+    # A case regresses when its median is more than `tolerance` slower than in the baseline file,
+    # ignoring sub-millisecond jitter on the fastest cases
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["benchmark"], r["case"]): r for r in json.load(f)["results"]}
+    
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["benchmark"], result["case"]))
+        if (previous and result["p50_ms"] > previous["p50_ms"] * (1 + tolerance)
+                and result["p50_ms"] - previous["p50_ms"] > min_delta_ms):
+            regressions.append(f"{result['benchmark']} [{result['case']}]: p50 {previous['p50_ms']:.2f} ms -> "
+                               f"{result['p50_ms']:.2f} ms")
+    return regressions
+
+def print_results(results: List[Dict[str, Any]]):
+    
+    for result in results:
+        extra = {k: v for k, v in result.items()
+                 if k not in ("benchmark", "case", "runs", "mean_ms", "p50_ms", "p99_ms", "min_ms")}
+        print(f"  {result['benchmark']:<24} {result['case']:<16} p50 {result['p50_ms']:>10.2f} ms  "
+              f"p99 {result['p99_ms']:>10.2f} ms  {extra}")
+
+def main(argv: Optional[List[str]] = None):
+    
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a stub LLM and synthetic transcripts")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--quick", action="store_true", help="Only transcripts up to one hour")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--cache-entries", type=int, default=200)
+    parser.add_argument("--compare", help="Baseline results file; exit non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+    
+    durations = QUICK_DURATIONS_MINUTES if args.quick else DURATIONS_MINUTES
+    stub = StubLLMServer(latency=args.llm_latency, tokens_per_second=args.tokens_per_second,
+                         error_rate=args.error_rate).start_background()
+    previous_client = set_client(LLMClient(api_url=stub.url, use_cache=False))
+    cache_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    transcript_cache = TranscriptCache(os.path.join(cache_dir, "transcripts.db"))
+    previous_transcript_cache = set_transcript_cache(transcript_cache)
+    
+    results = []
+    try:
+        cache = VideoCache(cache_dir)
+        print("chunk_transcript...")
+        results += bench_chunking(durations, args.repeats)
+        results += bench_chapters(durations, args.repeats)
+        results += bench_extractive(durations, args.repeats)
+        print("summarize_youtube_video...")
+        with fake_youtube():
+            results += bench_summarize(stub, durations, args.repeats, progressive=False)
+            results += bench_summarize(stub, durations, args.repeats, progressive=True)
+        print("find_relevant_parts...")
+        results += bench_retrieval(cache, durations, args.repeats)
+        print("VideoCache...")
+        results += bench_video_cache(cache, args.cache_entries, 60)
+        results += bench_transcript_cache(transcript_cache, durations, args.repeats)
+    finally:
+        set_client(previous_client).close()
+        set_transcript_cache(previous_transcript_cache)
+        transcript_cache.close()
+        stub.stop_background()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args)
+        },
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    
+    print_results(results)
+    print(f"\nResults written to {args.output}")
+    
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import random
+from typing import List, Tuple
+
+TOPICS = [
+    "neural networks learn weights with gradient descent and backpropagation through every layer",
+    "the database stores rows in pages and an index speeds up lookups by primary key",
+    "marketing teams generate leads with email campaigns landing pages and paid advertising",
+    "the recipe needs flour butter sugar eggs and the oven preheated to two hundred degrees",
+    "investors compare stocks bonds and index funds by looking at risk return and fees",
+    "the guitar solo uses a pentatonic scale with bends slides and vibrato on the high strings",
+    "climate models simulate ocean currents cloud cover and carbon dioxide over decades",
+    "the startup founders talk about hiring fundraising product market fit and burn rate",
+    "sleep hygiene means a dark room a regular schedule and no screens before bed",
+    "the football team changed formation pressing higher and passing through the midfield",
+]
+
+FILLER = "so um you know like basically i mean right okay yeah and then we".split()
+
+def make_snippets(duration_seconds: float, seed: int = 0, seconds_per_snippet: float = 3.0,
+                  topic_minutes: float = 8.0) -> List[Tuple[str, float, float]]:
+    
+    # Period-free, auto-caption style text that drifts from topic to topic every few minutes
+    rng = random.Random(seed)
+    snippets = []
+    topic = rng.randrange(len(TOPICS))
+    next_switch = topic_minutes * 60
+    start = 0.0
+    
+    while start < duration_seconds:
+        if start >= next_switch:
+            topic = rng.randrange(len(TOPICS))
+            next_switch += topic_minutes * 60 * rng.uniform(0.5, 1.5)
+        
+        topic_words = TOPICS[topic].split()
+        words = [rng.choice(topic_words) if rng.random() < 0.7 else rng.choice(FILLER) for _ in range(rng.randint(6, 12))]
+        snippets.append((" ".join(words), round(start, 2), seconds_per_snippet - 0.1))
+        start += seconds_per_snippet
+    
+    return snippets
+
+def make_transcript(duration_seconds: float, seed: int = 0) -> str:
+    return " ".join(text for text, _, _ in make_snippets(duration_seconds, seed))
@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import math
+import os
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from chunking import TranscriptChunker, count_tokens
+from extractive import tfidf_matrix
+from lexical_index import tokenize
+from llm_endpoint import (LLMClient, build_chapter_prompt, call_model_async, get_client,
+                          merge_batch_results_async)
+from metrics import get_metrics, timed
+from transcript_segments import TranscriptSegments, format_timestamp
+
+SUMMARY_CHAPTERS = os.getenv("SUMMARY_CHAPTERS", "0") not in ("0", "false", "False", "")
+CHAPTER_PASSAGE_TOKENS = int(os.getenv("CHAPTER_PASSAGE_TOKENS", "120"))
+CHAPTER_WINDOW = int(os.getenv("CHAPTER_WINDOW", "4"))
+CHAPTER_MIN_TOKENS = int(os.getenv("CHAPTER_MIN_TOKENS", "600"))
+CHAPTER_MAX_TOKENS = int(os.getenv("CHAPTER_MAX_TOKENS", "3000"))
+CHAPTER_TITLE_TERMS = 3
+
+def _gap_similarities(texts: Sequence[str], window: int) -> List[float]:
+    
+    # Cosine between the `window` passages before each gap and the `window` after it
+    if np is not None:
+        matrix = tfidf_matrix(texts)
+        totals = np.vstack([np.zeros((1, matrix.shape[1]), dtype=matrix.dtype), np.cumsum(matrix, axis=0)])
+        gaps = np.arange(1, len(texts))
+        left = totals[gaps] - totals[np.maximum(gaps - window, 0)]
+        right = totals[np.minimum(gaps + window, len(texts))] - totals[gaps]
+        norms = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+        norms[norms == 0] = 1.0
+        return ((left * right).sum(axis=1) / norms).tolist()
+    
+    counts = [Counter(tokenize(text)) for text in texts]
+    similarities = []
+    for gap in range(1, len(texts)):
+        left = sum(counts[max(0, gap - window):gap], Counter())
+        right = sum(counts[gap:gap + window], Counter())
+        dot = sum(count * right[term] for term, count in left.items())
+        norm = math.sqrt(sum(c * c for c in left.values())) * math.sqrt(sum(c * c for c in right.values()))
+        similarities.append(dot / norm if norm else 0.0)
+    return similarities
+
+def depth_scores(similarities: Sequence[float]) -> List[float]:
+    
+    # TextTiling: how far similarity dips at a gap below the peaks on either side of it
+    depths = []
+    for i, similarity in enumerate(similarities):
+        left = similarity
+        j = i
+        while j > 0 and similarities[j - 1] >= left:
+            left = similarities[j - 1]
+            j -= 1
+        
+        right = similarity
+        j = i
+        while j < len(similarities) - 1 and similarities[j + 1] >= right:
+            right = similarities[j + 1]
+            j += 1
+        
+        depths.append(left + right - 2 * similarity)
+    return depths
+
+def _choose_cuts(depths: Sequence[float], tokens: Sequence[int], min_tokens: int, max_tokens: int) -> List[int]:
+    
+    # Cut positions are passage indexes; gap g sits between passage g and g + 1
+    prefix = [0]
+    for count in tokens:
+        prefix.append(prefix[-1] + count)
+    
+    def size(first: int, last: int) -> int:
+        return prefix[last] - prefix[first]
+    
+    cuts = [0, len(tokens)]
+    if depths:
+        mean = sum(depths) / len(depths)
+        deviation = math.sqrt(sum((d - mean) ** 2 for d in depths) / len(depths))
+        cutoff = max(mean + deviation / 2, 1e-6)
+        
+        # Deepest valleys first, as long as every chapter keeps at least min_tokens
+        for gap in sorted(range(len(depths)), key=lambda g: -depths[g]):
+            if depths[gap] < cutoff:
+                break
+            position = gap + 1
+            index = next(i for i, cut in enumerate(cuts) if cut > position)
+            if size(cuts[index - 1], position) >= min_tokens and size(position, cuts[index]) >= min_tokens:
+                cuts.insert(index, position)
+    
+    # Chapters too long for one call are split at their deepest valley, or in the middle when flat
+    i = 0
+    while i < len(cuts) - 1:
+        first, last = cuts[i], cuts[i + 1]
+        if size(first, last) <= max_tokens or last - first < 2:
+            i += 1
+            continue
+        
+        inside = [position for position in range(first + 1, last)
+                  if size(first, position) >= min_tokens and size(position, last) >= min_tokens]
+        if inside and depths:
+            position = max(inside, key=lambda p: depths[p - 1])
+        else:
+            position = min(range(first + 1, last), key=lambda p: abs(size(first, p) - size(p, last)))
+        cuts.insert(i + 1, position)
+    
+    return cuts
+
+def _titles(texts: Sequence[str], terms: int = CHAPTER_TITLE_TERMS) -> List[str]:
+    
+    # The words that set each chapter apart from the rest of the video
+    counts = [Counter(tokenize(text)) for text in texts]
+    doc_freq = Counter(term for count in counts for term in count)
+    titles = []
+    for count in counts:
+        scored = sorted(count.items(), key=lambda item: (-item[1] * math.log((1 + len(texts)) / doc_freq[item[0]]),
+                                                         item[0]))
+        titles.append(", ".join(term for term, _ in scored[:terms] if len(term) > 2) or "untitled")
+    return titles
+
+@timed("chapter_segmentation")
+def detect_chapters(transcript: str, boundaries: Optional[Sequence[int]] = None,
+                    segments: Optional[TranscriptSegments] = None, min_tokens: int = CHAPTER_MIN_TOKENS,
+                    max_tokens: int = CHAPTER_MAX_TOKENS, passage_tokens: int = CHAPTER_PASSAGE_TOKENS,
+                    window: int = CHAPTER_WINDOW) -> List[Dict[str, Any]]:
+    
+    # Topic boundaries from shifts in vocabulary, all local: no model call is spent on structure
+    chunker = TranscriptChunker(max_tokens=passage_tokens, overlap_tokens=0, max_unit_tokens=max(1, passage_tokens // 4))
+    passages = chunker.split_spans(transcript, boundaries)
+    if not passages:
+        return []
+    
+    texts = [transcript[start:end] for start, end in passages]
+    tokens = [count_tokens(text) for text in texts]
+    depths = depth_scores(_gap_similarities(texts, window)) if len(passages) > 1 else []
+    cuts = _choose_cuts(depths, tokens, min_tokens, max_tokens)
+    
+    spans = [(passages[cuts[i]][0], passages[cuts[i + 1] - 1][1]) for i in range(len(cuts) - 1)]
+    titles = _titles([transcript[start:end] for start, end in spans])
+    
+    chapters = []
+    for i, ((start, end), title) in enumerate(zip(spans, titles)):
+        text = transcript[start:end]
+        start_time, end_time = (segments.time_span(start, end) if segments is not None and len(segments)
+                                else (None, None))
+        chapters.append({
+            "index": i + 1,
+            "title": title,
+            "start_offset": start,
+            "end_offset": end,
+            "start_time": start_time,
+            "end_time": end_time,
+            "tokens": sum(tokens[cuts[i]:cuts[i + 1]]),
+            # Identifies the text, not its position, so an unchanged chapter is found again on a later run
+            "key": hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+        })
+    return chapters
+
+def chapter_label(chapter: Dict[str, Any]) -> str:
+    
+    label = f"Chapter {chapter['index']}: {chapter['title']}"
+    if chapter.get("start_time") is not None:
+        label += f" ({format_timestamp(chapter['start_time'])}-{format_timestamp(chapter['end_time'])})"
+    return label
+
+def chapter_at_offset(chapters: Sequence[Dict[str, Any]], offset: int) -> Optional[Dict[str, Any]]:
+    
+    for chapter in chapters:
+        if chapter["start_offset"] <= offset < chapter["end_offset"]:
+            return chapter
+    return None
+
+async def summarize_chapters_async(transcript: str, chapters: List[Dict[str, Any]],
+                                   previous: Optional[Sequence[Dict[str, Any]]] = None,
+                                   session: Optional[aiohttp.ClientSession] = None,
+                                   client: Optional[LLMClient] = None) -> Tuple[List[Dict[str, Any]], int]:
+    
+    # Chapter summaries carry no tone, so any chapter already summarized on an earlier run is reused
+    known = {chapter["key"]: chapter["summary"] for chapter in previous or [] if chapter.get("summary")}
+    pending = [chapter for chapter in chapters if chapter["key"] not in known]
+    
+    results = await asyncio.gather(*[
+        call_model_async(session, transcript[chapter["start_offset"]:chapter["end_offset"]],
+                         build_chapter_prompt(chapter_label(chapter), chapter["index"], len(chapters)), client)
+        for chapter in pending
+    ], return_exceptions=True)
+    
+    fresh = {}
+    for chapter, result in zip(pending, results):
+        if isinstance(result, Exception):
+            print(f"Error summarizing chapter {chapter['index']}: {result}")
+        elif "error" in result or not result.get("choices"):
+            print(f"Error summarizing chapter {chapter['index']}: {result.get('error', 'empty response')}")
+        else:
+            fresh[chapter["key"]] = result["choices"][0]["message"]["content"]
+    
+    summarized = [dict(chapter, summary=known.get(chapter["key"]) or fresh.get(chapter["key"])) for chapter in chapters]
+    return summarized, len(chapters) - len(pending)
+
+async def process_chapter_transcript_async(transcript: str, tone: str, segments: Optional[TranscriptSegments] = None,
+                                           previous: Optional[Sequence[Dict[str, Any]]] = None,
+                                           session: Optional[aiohttp.ClientSession] = None,
+                                           on_delta: Optional[Callable[[str], None]] = None,
+                                           client: Optional[LLMClient] = None) -> Dict[str, Any]:
+    
+    boundaries = segments.boundaries() if segments is not None else None
+    chapters = detect_chapters(transcript, boundaries, segments)
+    print(f"Summarizing {len(chapters)} chapters simultaneously...")
+    
+    start_time = time.time()
+    chapters, reused = await summarize_chapters_async(transcript, chapters, previous, session, client)
+    map_seconds = time.time() - start_time
+    get_metrics().observe("stage_seconds", map_seconds, stage="chapters")
+    get_metrics().inc("chapters_reused_total", reused)
+    
+    # Chapter summaries are the notes the tone-specific write-up is built from
+    batch_summaries = [
+        {
+            "batch_number": chapter["index"],
+            "label": chapter_label(chapter),
+            "result": {"choices": [{"message": {"role": "assistant", "content": chapter["summary"]}}]}
+        }
+        for chapter in chapters if chapter["summary"]
+    ]
+    
+    result = await merge_batch_results_async(batch_summaries, tone, len(chapters), session=session,
+                                             on_delta=on_delta, client=client)
+    if "processing_info" in result:
+        result["processing_info"].update({
+            "processing_method": "chapters",
+            "chapters": chapters,
+            "reused_chapters": reused,
+            "map_seconds": round(map_seconds, 3)
+        })
+    return result
+
+def process_chapter_transcript(transcript: str, tone: str, segments: Optional[TranscriptSegments] = None,
+                               previous: Optional[Sequence[Dict[str, Any]]] = None,
+                               on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    
+    return get_client().run(process_chapter_transcript_async(transcript, tone, segments, previous, on_delta=on_delta))
@@ -0,0 +1,243 @@
+import bisect
+import math
+import os
+import re
+from typing import Callable, List, Optional, Sequence, Tuple
+
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "auto")
+CHUNK_TOKENIZER_ENCODING = os.getenv("CHUNK_TOKENIZER_ENCODING", "cl100k_base")
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\S+")
+
+def estimate_tokens(text: str) -> int:
+    
+    # Calibrated against BPE tokenizers on English captions: short words are one token,
+    # longer words split roughly every 6 characters and punctuation is its own token
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        tokens += 1 + (len(piece) - 1) // 6
+    return tokens
+
+def _load_tiktoken_counter() -> Optional[Callable[[str], int]]:
+    
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(CHUNK_TOKENIZER_ENCODING)
+    except Exception:
+        return None
+    
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+_token_counter = None
+
+def get_token_counter() -> Callable[[str], int]:
+    
+    global _token_counter
+    if _token_counter is None:
+        counter = None
+        if CHUNK_TOKENIZER in ("auto", "tiktoken"):
+            counter = _load_tiktoken_counter()
+            if counter is None and CHUNK_TOKENIZER == "tiktoken":
+                print("tiktoken is not available, falling back to the token estimator")
+        _token_counter = counter or estimate_tokens
+    return _token_counter
+
+def count_tokens(text: str) -> int:
+    return get_token_counter()(text)
+
+class TranscriptChunker:
+    
+    def __init__(self, max_tokens: int = 3000, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 counter: Optional[Callable[[str], int]] = None, max_unit_tokens: Optional[int] = None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.counter = counter or get_token_counter()
+        self.max_unit_tokens = max_unit_tokens or max(16, max_tokens // 32)
+    
+    def _split_units(self, text: str, boundaries: Optional[Sequence[int]]) -> List[Tuple[int, int]]:
+        
+        # Caption segment boundaries when we have them, sentences otherwise
+        if boundaries:
+            starts = sorted(set(b for b in boundaries if 0 < b < len(text)))
+            edges = [0] + starts + [len(text)]
+            spans = [(edges[i], edges[i + 1]) for i in range(len(edges) - 1)]
+        else:
+            spans = []
+            start = 0
+            for match in _SENTENCE_END_RE.finditer(text):
+                spans.append((start, match.start()))
+                start = match.end()
+            spans.append((start, len(text)))
+        
+        # Auto-generated captions rarely have periods, so oversized units are cut into word windows
+        words_per_window = max(8, int(self.max_unit_tokens / 1.3))
+        units = []
+        for start, end in spans:
+            if not text[start:end].strip():
+                continue
+            if self.counter(text[start:end]) <= self.max_unit_tokens:
+                units.append((start, end))
+                continue
+            
+            words = [m.span() for m in _WORD_RE.finditer(text, start, end)]
+            for i in range(0, len(words), words_per_window):
+                window = words[i:i + words_per_window]
+                units.append((window[0][0], window[-1][1]))
+        
+        return units
+    
+    def _balanced_cuts(self, counts: List[int], budget: int) -> List[int]:
+        
+        prefix = [0]
+        for count in counts:
+            prefix.append(prefix[-1] + count)
+        total = prefix[-1]
+        
+        def cuts_for(parts: int) -> Optional[List[int]]:
+            
+            # Cut at the unit boundary closest to each multiple of an even share
+            target = total / parts
+            cuts = [0]
+            for k in range(1, parts):
+                goal = k * target
+                position = bisect.bisect_left(prefix, goal)
+                if position > 0 and goal - prefix[position - 1] < prefix[position] - goal:
+                    position -= 1
+                position = min(max(position, cuts[-1] + 1), len(counts) - (parts - k))
+                cuts.append(position)
+            cuts.append(len(counts))
+            
+            fits = all(prefix[cuts[i + 1]] - prefix[cuts[i]] <= budget for i in range(parts))
+            return cuts if fits or parts == len(counts) else None
+        
+        # Fewest parts that fit the budget, found by stepping up one part at a time. Uneven units can need
+        # far more parts than total / budget, and every step recomputes every cut, so a long search switches
+        # to doubling the count until it fits and narrowing it down
+        low = min(len(counts), max(1, math.ceil(total / budget)))
+        for parts in range(low, min(len(counts), low + 64) + 1):
+            cuts = cuts_for(parts)
+            if cuts is not None:
+                return cuts
+        
+        low = high = parts
+        while True:
+            high = min(len(counts), high * 2)
+            cuts = cuts_for(high)
+            if cuts is not None:
+                break
+            low = high
+        
+        while high - low > 1:
+            middle = (low + high) // 2
+            candidate = cuts_for(middle)
+            if candidate is not None:
+                high, cuts = middle, candidate
+            else:
+                low = middle
+        return cuts
+    
+    def split_spans(self, text: str, boundaries: Optional[Sequence[int]] = None) -> List[Tuple[int, int]]:
+        
+        units = self._split_units(text, boundaries)
+        if not units:
+            return []
+        
+        counts = [self.counter(text[start:end]) for start, end in units]
+        cuts = self._balanced_cuts(counts, self.max_tokens - self.overlap_tokens)
+        
+        spans = []
+        for i in range(len(cuts) - 1):
+            first, last = cuts[i], cuts[i + 1] - 1
+            
+            # Carry the tail of the previous chunk forward so context survives the cut
+            overlap = 0
+            while i > 0 and first - 1 > cuts[i - 1] and overlap + counts[first - 1] <= self.overlap_tokens:
+                first -= 1
+                overlap += counts[first]
+            
+            spans.append((units[first][0], units[last][1]))
+        
+        return spans
+    
+    def split(self, text: str, boundaries: Optional[Sequence[int]] = None) -> List[str]:
+        return [text[start:end].strip() for start, end in self.split_spans(text, boundaries)]
+
+class IncrementalChunker:
+    
+    # Cuts chunks while caption text is still arriving. Without the total length it cannot balance
+    # sizes like TranscriptChunker, so each chunk is filled greedily and the last one takes the rest
+    def __init__(self, max_tokens: int = 3000, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 counter: Optional[Callable[[str], int]] = None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.counter = counter or get_token_counter()
+        
+        self._units: List[Tuple[str, int]] = []
+        self._tokens = 0
+        self._fresh = False
+    
+    def add(self, text: str) -> List[str]:
+        
+        text = text.strip()
+        if not text:
+            return []
+        
+        tokens = self.counter(text)
+        chunks = []
+        if self._fresh and self._tokens + tokens > self.max_tokens:
+            chunks.append(self._cut())
+        
+        self._units.append((text, tokens))
+        self._tokens += tokens
+        self._fresh = True
+        return chunks
+    
+    def _cut(self) -> str:
+        
+        # Same " " join as the full transcript, so every chunk is a substring of it
+        chunk = " ".join(text for text, _ in self._units)
+        
+        carried = []
+        carried_tokens = 0
+        for text, tokens in reversed(self._units):
+            if carried_tokens + tokens > self.overlap_tokens:
+                break
+            carried.append((text, tokens))
+            carried_tokens += tokens
+        
+        self._units = carried[::-1]
+        self._tokens = carried_tokens
+        self._fresh = False
+        return chunk
+    
+    def flush(self) -> List[str]:
+        
+        if not self._fresh:
+            return []
+        chunk = self._cut()
+        self._units = []
+        self._tokens = 0
+        return [chunk]
+
+def truncate_to_tokens(text: str, max_tokens: int, counter: Optional[Callable[[str], int]] = None) -> str:
+    
+    counter = counter or get_token_counter()
+    tokens = counter(text)
+    if tokens <= max_tokens:
+        return text
+    
+    # Cut proportionally, then back off word by word until it fits
+    cut = text[:int(len(text) * max_tokens / tokens)]
+    cut = cut[:cut.rfind(" ")] if " " in cut else cut
+    while cut and counter(cut) > max_tokens:
+        cut = cut[:cut.rfind(" ")] if " " in cut else ""
+    return cut + "..." if cut else ""
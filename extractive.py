@@ -0,0 +1,156 @@
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from chunking import TranscriptChunker, count_tokens
+from lexical_index import tokenize
+from metrics import timed
+
+TFIDF_DIM = 4096
+TEXTRANK_MAX_UNITS = 4000
+EXTRACTIVE_SUMMARY_TOKENS = int(os.getenv("EXTRACTIVE_SUMMARY_TOKENS", "350"))
+EXTRACTIVE_PASSAGE_TOKENS = int(os.getenv("EXTRACTIVE_PASSAGE_TOKENS", "40"))
+EXTRACTIVE_DIVERSITY = 0.3
+
+def extractive_available() -> bool:
+    return np is not None
+
+def tfidf_matrix(texts: Sequence[str], dim: int = TFIDF_DIM) -> "np.ndarray":
+    
+    # Hashed columns keep the matrix a fixed width however large the vocabulary of a 10 hour stream gets
+    rows = []
+    columns = []
+    for row, text in enumerate(texts):
+        for term in tokenize(text):
+            rows.append(row)
+            columns.append(zlib.crc32(term.encode()) % dim)
+    
+    counts = np.zeros((len(texts), dim), dtype=np.float32)
+    if rows:
+        np.add.at(counts, (np.array(rows), np.array(columns)), 1.0)
+    
+    doc_freq = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + doc_freq)).astype(np.float32) + 1.0
+    
+    matrix = np.log1p(counts) * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def textrank_scores(matrix: "np.ndarray", damping: float = 0.85, iterations: int = 30) -> "np.ndarray":
+    
+    count = matrix.shape[0]
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    
+    # The similarity graph is quadratic, so very long inputs fall back to closeness to the centroid
+    if count > TEXTRANK_MAX_UNITS:
+        return centroid_scores(matrix)
+    
+    similarity = matrix @ matrix.T
+    np.fill_diagonal(similarity, 0.0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    out_weight[out_weight == 0] = 1.0
+    transition = similarity / out_weight
+    
+    scores = np.full(count, 1.0 / count, dtype=np.float32)
+    for _ in range(iterations):
+        updated = (1 - damping) / count + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < 1e-6:
+            scores = updated
+            break
+        scores = updated
+    return scores
+
+def centroid_scores(matrix: "np.ndarray") -> "np.ndarray":
+    
+    centroid = matrix.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    return matrix @ (centroid / norm) if norm else np.zeros(matrix.shape[0], dtype=np.float32)
+
+def select_within_budget(scores: Sequence[float], costs: Sequence[int], budget: int) -> List[int]:
+    
+    # Best units first until the budget is spent, handed back in their original order
+    chosen = []
+    spent = 0
+    for index in np.argsort(-np.asarray(scores), kind="stable"):
+        if spent + costs[index] > budget and chosen:
+            continue
+        chosen.append(int(index))
+        spent += costs[index]
+    return sorted(chosen)
+
+def select_diverse(matrix: "np.ndarray", scores: Sequence[float], costs: Sequence[int], budget: int,
+                   diversity: float = EXTRACTIVE_DIVERSITY) -> List[int]:
+    
+    # Maximal marginal relevance: each pick trades centrality against overlap with the passages already
+    # chosen, so one topic that is repeated all video long does not fill the whole summary
+    scores = np.asarray(scores, dtype=np.float32)
+    scores = scores / (scores.max() or 1.0)
+    costs = np.asarray(costs)
+    overlap = np.zeros(len(scores), dtype=np.float32)
+    available = costs <= budget
+    if not available.any():
+        available[np.argmin(costs)] = True
+    
+    chosen = []
+    spent = 0
+    while available.any():
+        gain = np.where(available, (1 - diversity) * scores - diversity * overlap, -np.inf)
+        index = int(np.argmax(gain))
+        chosen.append(index)
+        spent += int(costs[index])
+        overlap = np.maximum(overlap, matrix @ matrix[index])
+        available &= costs <= budget - spent
+        available[index] = False
+    return sorted(chosen)
+
+def _spread(count: int, picks: int) -> List[int]:
+    
+    # Evenly spaced passages, for when numpy is missing and nothing can be scored
+    picks = max(1, min(count, picks))
+    return sorted({i * count // picks for i in range(picks)})
+
+@timed("extractive_summary")
+def extractive_summary(transcript: str, boundaries: Optional[Sequence[int]] = None,
+                       max_tokens: int = EXTRACTIVE_SUMMARY_TOKENS,
+                       passage_tokens: int = EXTRACTIVE_PASSAGE_TOKENS) -> Tuple[str, Dict[str, Any]]:
+    
+    # A summary made of the transcript's own most central passages, in video order, without a model call
+    chunker = TranscriptChunker(max_tokens=passage_tokens, overlap_tokens=0, max_unit_tokens=max(1, passage_tokens // 2))
+    spans = chunker.split_spans(transcript, boundaries)
+    texts = [transcript[start:end].strip() for start, end in spans]
+    costs = [count_tokens(text) for text in texts]
+    total = sum(costs)
+    budget = min(max_tokens, max(total // 4, passage_tokens))
+    
+    if not spans:
+        kept = []
+    elif extractive_available() and len(spans) > 1:
+        matrix = tfidf_matrix(texts)
+        kept = select_diverse(matrix, textrank_scores(matrix), costs, budget)
+    else:
+        kept = _spread(len(spans), budget * len(spans) // max(total, 1))
+    
+    # Neighbouring passages read on as one paragraph; a gap in the video starts a new one
+    paragraphs = []
+    previous = None
+    for index in kept:
+        if previous is not None and index == previous + 1:
+            paragraphs[-1] += " " + texts[index]
+        else:
+            paragraphs.append(texts[index])
+        previous = index
+    
+    summary = "\n\n".join(paragraph[:1].upper() + paragraph[1:] for paragraph in paragraphs)
+    return summary, {
+        "passages": len(spans),
+        "kept_passages": len(kept),
+        "tokens_before": total,
+        "tokens_after": sum(costs[i] for i in kept)
+    }
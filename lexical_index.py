@@ -0,0 +1,117 @@
+import math
+import pickle
+import re
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from chunking import TranscriptChunker
+
+PASSAGE_TOKENS = 200
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are aren't as at be because been before being below
+between both but by can can't cannot could couldn't did didn't do does doesn't doing don't down during each
+few for from further gonna got had hadn't has hasn't have haven't having he he'd he'll he's her here here's
+hers herself him himself his how how's i i'd i'll i'm i've if in into is isn't it it's its itself just kind
+know let's like me more most mustn't my myself no nor not now of off oh okay on once only or other ought our
+ours ourselves out over own really right said same say says shan't she she'd she'll she's should shouldn't so
+some such than that that's the their theirs them themselves then there there's these they they'd they'll
+they're they've thing things this those through to too uh um under until up us very video want was wasn't we
+we'd we'll we're we've well were weren't what what's when when's where where's which while who who's whom why
+why's will with won't would wouldn't yeah you you'd you'll you're you've your yours yourself yourselves
+tell explain talk talked talking mean part section
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+def _stem(term: str) -> str:
+    
+    # Just enough folding that "models" finds "model" without a stemmer dependency
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+class BM25Index:
+    
+    def __init__(self, spans: array, doc_lengths: array, postings: Dict[str, Tuple[array, array]],
+                 k1: float = 1.5, b: float = 0.75):
+        self.spans = spans
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        
+        self.avg_length = (sum(doc_lengths) / len(doc_lengths)) if len(doc_lengths) else 0.0
+        doc_count = len(doc_lengths)
+        self.idf = {
+            term: math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, (docs, _) in postings.items()
+        }
+    
+    @classmethod
+    def build(cls, transcript: str, boundaries: Optional[Sequence[int]] = None,
+              passage_tokens: int = PASSAGE_TOKENS) -> "BM25Index":
+        
+        chunker = TranscriptChunker(max_tokens=passage_tokens, overlap_tokens=0, max_unit_tokens=passage_tokens // 4)
+        passages = chunker.split_spans(transcript, boundaries)
+        
+        spans = array("q")
+        doc_lengths = array("i")
+        term_docs: Dict[str, Tuple[array, array]] = {}
+        
+        for doc_id, (start, end) in enumerate(passages):
+            spans.extend((start, end))
+            terms = tokenize(transcript[start:end])
+            doc_lengths.append(len(terms))
+            
+            counts: Dict[str, int] = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            
+            for term, tf in counts.items():
+                posting = term_docs.get(term)
+                if posting is None:
+                    posting = term_docs[term] = (array("i"), array("i"))
+                posting[0].append(doc_id)
+                posting[1].append(tf)
+        
+        return cls(spans, doc_lengths, term_docs)
+    
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+    
+    def span(self, doc_id: int) -> Tuple[int, int]:
+        return self.spans[2 * doc_id], self.spans[2 * doc_id + 1]
+    
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        
+        scores: Dict[int, float] = {}
+        norm = self.k1 * (1 - self.b)
+        length_weight = self.k1 * self.b / self.avg_length if self.avg_length else 0.0
+        
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            
+            idf = self.idf[term]
+            docs, tfs = posting
+            for doc_id, tf in zip(docs, tfs):
+                denominator = tf + norm + length_weight * self.doc_lengths[doc_id]
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / denominator
+        
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    
+    def to_bytes(self) -> bytes:
+        return pickle.dumps((self.spans, self.doc_lengths, self.postings, self.k1, self.b),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BM25Index":
+        spans, doc_lengths, postings, k1, b = pickle.loads(data)
+        return cls(spans, doc_lengths, postings, k1, b)
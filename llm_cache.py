@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join("video_cache", "llm_responses.db"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "100000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    
+    messages = payload.get("messages", [])
+    system_prompt = "".join(m["content"] for m in messages if m.get("role") == "system")
+    content = [(m.get("role"), m["content"]) for m in messages if m.get("role") != "system"]
+    
+    key_parts = [
+        payload.get("model"),
+        system_prompt,
+        content,
+        payload.get("temperature"),
+        payload.get("max_tokens")
+    ]
+    return hashlib.sha256(json.dumps(key_parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 max_disk_entries: int = LLM_CACHE_MAX_DISK_ENTRIES, ttl: float = LLM_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_prune = 0
+        
+        self.hits = 0
+        self.misses = 0
+        
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+    
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl > 0 and now - created > self.ttl
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        
+        now = time.time()
+        
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, response = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(response)
+                del self._memory[key]
+            
+            if self._conn is not None:
+                row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    response, created = row
+                    if not self._expired(created, now):
+                        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                        self._remember(key, created, response)
+                        self.hits += 1
+                        return json.loads(response)
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            
+            self.misses += 1
+            return None
+    
+    def set(self, key: str, response: Dict[str, Any]):
+        
+        now = time.time()
+        serialized = json.dumps(response, ensure_ascii=False)
+        
+        with self._lock:
+            self._remember(key, now, serialized)
+            
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created, last_access) VALUES (?, ?, ?, ?)",
+                    (key, serialized, now, now)
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 100:
+                    self._prune_disk(now)
+    
+    def _remember(self, key: str, created: float, response: str):
+        
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def _prune_disk(self, now: float):
+        
+        self._writes_since_prune = 0
+        if self.ttl > 0:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_disk_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (count - self.max_disk_entries,)
+            )
+    
+    def clear(self):
+        
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+    
+    def stats(self) -> Dict[str, Any]:
+        
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory)
+        }
+    
+    def close(self):
+        
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    
+    global _response_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
@@ -1,11 +1,20 @@
 import requests
+import requests.adapters
 import aiohttp
 import asyncio
+import atexit
+import json
 import os
+import threading
 from dotenv import load_dotenv
-from typing import List, Dict, Any
-import math
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator, AsyncIterator, Tuple
 import time
+from llm_cache import ResponseCache, get_response_cache, make_cache_key
+from chunking import TranscriptChunker, IncrementalChunker, count_tokens, CHUNK_OVERLAP_TOKENS
+from metrics import get_metrics, timed
+from extractive import extractive_summary
+from rate_limiter import (AdaptiveLimiter, get_rate_limiter, retry_delay, backoff_delay, RETRYABLE_STATUSES,
+                          LLM_MAX_RETRIES, LLM_REQUEST_DEADLINE)
 
 load_dotenv()
 
@@ -18,30 +27,490 @@ headers = {
     "Content-Type": "application/json"
 }
 
-def chunk_transcript(transcript: str, max_tokens: int = 3000) -> List[str]:
+@timed("chunking")
+def chunk_transcript(transcript: str, max_tokens: int = 3000, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                     boundaries: Optional[List[int]] = None) -> List[str]:
     
-    chars_per_token = 4
-    max_chars = max_tokens * chars_per_token
+    return TranscriptChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens).split(transcript, boundaries)
+
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+LLM_POOL_PER_HOST = int(os.getenv("LLM_POOL_PER_HOST", "32"))
+LLM_DNS_CACHE_TTL = int(os.getenv("LLM_DNS_CACHE_TTL", "300"))
+LLM_KEEPALIVE_TIMEOUT = float(os.getenv("LLM_KEEPALIVE_TIMEOUT", "60"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+MERGE_FAN_IN = int(os.getenv("MERGE_FAN_IN", "8"))
+MERGE_MAX_TOKENS = int(os.getenv("MERGE_MAX_TOKENS", "12000"))
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "llm")
+SUMMARY_EXTRACTIVE_FALLBACK = os.getenv("SUMMARY_EXTRACTIVE_FALLBACK", "1") not in ("0", "false", "False", "")
+SUMMARY_MODES = ("llm", "extractive")
+
+class LLMClient:
     
-    sentences = transcript.split('. ')
-    chunks = []
-    current_chunk = ""
+    def __init__(self, api_url: str = API_URL, pool_size: int = LLM_POOL_SIZE, per_host_limit: int = LLM_POOL_PER_HOST,
+                 dns_cache_ttl: int = LLM_DNS_CACHE_TTL, keepalive_timeout: float = LLM_KEEPALIVE_TIMEOUT,
+                 request_timeout: float = LLM_REQUEST_TIMEOUT, response_cache: Optional[ResponseCache] = None,
+                 use_cache: bool = True, limiter: Optional[AdaptiveLimiter] = None, max_retries: int = LLM_MAX_RETRIES,
+                 deadline: float = LLM_REQUEST_DEADLINE):
+        self.api_url = api_url
+        self.headers = headers
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.response_cache = response_cache or (get_response_cache() if use_cache else None)
+        self.limiter = limiter or get_rate_limiter()
+        self.max_retries = max_retries
+        self.deadline = deadline
+        
+        self._lock = threading.Lock()
+        self._sync_session = None
+        self._async_sessions = {}
+        self._loop = None
+        self._loop_thread = None
+    
+    @property
+    def session(self) -> requests.Session:
+        
+        with self._lock:
+            if self._sync_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=10,
+                    pool_maxsize=min(self.pool_size, self.per_host_limit or self.pool_size)
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(self.headers)
+                self._sync_session = session
+            return self._sync_session
+    
+    def async_session(self) -> aiohttp.ClientSession:
+        
+        # aiohttp sessions are bound to the loop that created them, so keep one per running loop
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.per_host_limit,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+            self._async_sessions[loop] = session
+        
+        return session
+    
+    def run(self, coro):
+        
+        # Sync callers share one background loop so its async session (and its open
+        # connections) survive between calls instead of dying with each asyncio.run()
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name="llm-client-loop", daemon=True)
+                self._loop_thread.start()
+        
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def _cache_lookup(self, payload: Dict[str, Any]):
+        
+        if self.response_cache is None:
+            return None, None
+        
+        key = make_cache_key(payload)
+        cached = self.response_cache.get(key)
+        get_metrics().cache_access("llm_response", cached is not None)
+        return key, cached
+    
+    def _cache_store(self, key: Optional[str], result: Dict[str, Any]):
+        
+        if key is not None and "error" not in result and result.get("choices"):
+            self.response_cache.set(key, result)
+    
+    def _budget_tokens(self, payload: Dict[str, Any]) -> int:
+        
+        if not self.limiter.tokens_per_minute:
+            return 0
+        prompt = "".join(m.get("content", "") for m in payload.get("messages", []))
+        return count_tokens(prompt) + payload.get("max_tokens", 0)
+    
+    def _retry_wait(self, attempt: int, deadline: float, retry_after: Optional[float]) -> Optional[float]:
+        
+        # None when the request should give up: out of attempts or the wait would pass its deadline
+        if attempt > self.max_retries:
+            return None
+        delay = max(retry_after or 0.0, backoff_delay(attempt - 1))
+        if time.monotonic() + delay >= deadline:
+            return None
+        get_metrics().inc("llm_retries_total")
+        return delay
     
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) + 2 > max_chars and current_chunk:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence + ". "
+    def post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        
+        key, cached = self._cache_lookup(payload)
+        if cached is not None:
+            return cached
+        
+        deadline = time.monotonic() + self.deadline
+        tokens = self._budget_tokens(payload)
+        attempt = 0
+        
+        while True:
+            if not self.limiter.acquire(tokens, deadline):
+                return {"error": "Request deadline exceeded while waiting for rate limit capacity.", "attempts": attempt}
+            
+            attempt += 1
+            started = time.monotonic()
+            overloaded = False
+            retry_after = None
+            
+            try:
+                response = self.session.post(self.api_url, json=payload,
+                                             timeout=max(0.001, min(self.request_timeout, deadline - started)))
+                retry_after = retry_delay(response.headers)
+                
+                if response.status_code in RETRYABLE_STATUSES:
+                    overloaded = True
+                    error = {"error": f"HTTP Error: {response.status_code} - {response.text}"}
+                else:
+                    response.raise_for_status()
+                    result = response.json()
+                    self.limiter.release(started, retry_after=retry_after)
+                    self._cache_store(key, result)
+                    get_metrics().record_usage(result.get("usage"))
+                    return result
+            
+            except requests.exceptions.Timeout:
+                overloaded = True
+                error = {"error": "Request timed out."}
+            
+            except requests.exceptions.ConnectionError as e:
+                error = {"error": str(e)}
+            
+            except requests.exceptions.HTTPError as e:
+                self.limiter.release(started)
+                return {"error": f"HTTP Error: {e.response.status_code} - {e.response.text}"}
+            
+            except Exception as e:
+                self.limiter.release(started)
+                return {"error": str(e)}
+            
+            self.limiter.release(started, overloaded, retry_after)
+            wait = self._retry_wait(attempt, deadline, retry_after)
+            if wait is None:
+                error["attempts"] = attempt
+                return error
+            time.sleep(wait)
+    
+    async def post_async(self, payload: Dict[str, Any], session: Optional[aiohttp.ClientSession] = None) -> Dict[str, Any]:
+        
+        key, cached = self._cache_lookup(payload)
+        if cached is not None:
+            return cached
+        
+        session = session or self.async_session()
+        deadline = time.monotonic() + self.deadline
+        tokens = self._budget_tokens(payload)
+        attempt = 0
+        
+        while True:
+            if not await self.limiter.acquire_async(tokens, deadline):
+                return {"error": "Request deadline exceeded while waiting for rate limit capacity.", "attempts": attempt}
+            
+            attempt += 1
+            started = time.monotonic()
+            overloaded = False
+            retry_after = None
+            
+            try:
+                timeout = aiohttp.ClientTimeout(total=max(0.001, min(self.request_timeout, deadline - started)))
+                async with session.post(self.api_url, headers=self.headers, json=payload, timeout=timeout) as response:
+                    retry_after = retry_delay(response.headers)
+                    
+                    if response.status == 200:
+                        result = await response.json()
+                        self.limiter.release(started, retry_after=retry_after)
+                        self._cache_store(key, result)
+                        get_metrics().record_usage(result.get("usage"))
+                        return result
+                    
+                    error_text = await response.text()
+                    error = {"error": f"HTTP Error: {response.status} - {error_text}"}
+                    if response.status not in RETRYABLE_STATUSES:
+                        self.limiter.release(started)
+                        return error
+                    overloaded = True
+            
+            except asyncio.CancelledError:
+                self.limiter.release(started)
+                raise
+            except asyncio.TimeoutError:
+                overloaded = True
+                error = {"error": "Request timed out."}
+            except aiohttp.ClientConnectionError as e:
+                error = {"error": str(e)}
+            except Exception as e:
+                self.limiter.release(started)
+                return {"error": str(e)}
+            
+            self.limiter.release(started, overloaded, retry_after)
+            wait = self._retry_wait(attempt, deadline, retry_after)
+            if wait is None:
+                error["attempts"] = attempt
+                return error
+            await asyncio.sleep(wait)
+    
+    def _stream_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        
+        return dict(payload, stream=True, stream_options={"include_usage": True})
+    
+    def _read_sse_line(self, line: str, state: Dict[str, Any]) -> Optional[str]:
+        
+        line = line.strip()
+        if not line.startswith("data:"):
+            return None
+        
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return None
+        
+        event = json.loads(data)
+        if event.get("usage"):
+            state["usage"] = event["usage"]
+        if event.get("error"):
+            state["error"] = str(event["error"])
+        
+        choices = event.get("choices") or []
+        if not choices:
+            return None
+        
+        if choices[0].get("finish_reason"):
+            state["finish_reason"] = choices[0]["finish_reason"]
+        
+        delta = (choices[0].get("delta") or {}).get("content")
+        if delta:
+            if "time_to_first_token" not in state:
+                state["time_to_first_token"] = time.perf_counter() - state["started"]
+            state["parts"].append(delta)
+        return delta
+    
+    def _finish_stream(self, key: Optional[str], state: Dict[str, Any], result: Optional[Dict[str, Any]]):
+        
+        content = "".join(state["parts"])
+        final = {
+            "choices": [{
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": state.get("finish_reason")
+            }],
+            "usage": state.get("usage", {}),
+            "timing": {
+                "time_to_first_token": state.get("time_to_first_token"),
+                "total_time": time.perf_counter() - state["started"]
+            }
+        }
+        
+        if state.get("error"):
+            final = {"error": state["error"]}
+        elif not content:
+            final = {"error": "Empty streamed response."}
         else:
-            current_chunk += sentence + ". "
+            self._cache_store(key, final)
+            get_metrics().record_usage(final["usage"])
+        
+        if result is not None:
+            result.clear()
+            result.update(final)
     
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+    def stream(self, payload: Dict[str, Any], result: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        
+        # Yields text deltas as they arrive; the assembled response, usage and timing land in `result`
+        state = {"parts": [], "started": time.perf_counter()}
+        key, cached = self._cache_lookup(payload)
+        
+        if cached is not None:
+            content = cached["choices"][0]["message"]["content"]
+            if result is not None:
+                result.clear()
+                result.update(cached)
+            yield content
+            return
+        
+        deadline = time.monotonic() + self.deadline
+        tokens = self._budget_tokens(payload)
+        attempt = 0
+        
+        while True:
+            if not self.limiter.acquire(tokens, deadline):
+                state["error"] = "Request deadline exceeded while waiting for rate limit capacity."
+                break
+            
+            attempt += 1
+            started = time.monotonic()
+            overloaded = False
+            retryable = False
+            retry_after = None
+            state.pop("error", None)
+            
+            try:
+                with self.session.post(self.api_url, json=self._stream_payload(payload), stream=True,
+                                       timeout=max(0.001, min(self.request_timeout, deadline - started)),
+                                       headers={"Accept": "text/event-stream"}) as response:
+                    retry_after = retry_delay(response.headers)
+                    if response.status_code in RETRYABLE_STATUSES:
+                        overloaded = retryable = True
+                        state["error"] = f"HTTP Error: {response.status_code} - {response.text}"
+                    else:
+                        response.raise_for_status()
+                        for line in response.iter_lines(decode_unicode=True):
+                            delta = self._read_sse_line(line or "", state)
+                            if delta:
+                                yield delta
+            
+            except GeneratorExit:
+                self.limiter.release(started)
+                raise
+            except requests.exceptions.Timeout:
+                overloaded = retryable = True
+                state["error"] = "Request timed out."
+            except requests.exceptions.ConnectionError as e:
+                retryable = True
+                state["error"] = str(e)
+            except requests.exceptions.HTTPError as e:
+                state["error"] = f"HTTP Error: {e.response.status_code} - {e.response.text}"
+            except Exception as e:
+                state["error"] = str(e)
+            
+            self.limiter.release(started, overloaded, retry_after)
+            
+            # Once text has been shown a retry would repeat it, so only retry before the first delta
+            if not state.get("error") or not retryable or state["parts"]:
+                break
+            wait = self._retry_wait(attempt, deadline, retry_after)
+            if wait is None:
+                break
+            time.sleep(wait)
+        
+        self._finish_stream(key, state, result)
+    
+    async def stream_async(self, payload: Dict[str, Any], result: Optional[Dict[str, Any]] = None,
+                           session: Optional[aiohttp.ClientSession] = None) -> AsyncIterator[str]:
+        
+        state = {"parts": [], "started": time.perf_counter()}
+        key, cached = self._cache_lookup(payload)
+        
+        if cached is not None:
+            content = cached["choices"][0]["message"]["content"]
+            if result is not None:
+                result.clear()
+                result.update(cached)
+            yield content
+            return
+        
+        session = session or self.async_session()
+        deadline = time.monotonic() + self.deadline
+        tokens = self._budget_tokens(payload)
+        attempt = 0
+        
+        while True:
+            if not await self.limiter.acquire_async(tokens, deadline):
+                state["error"] = "Request deadline exceeded while waiting for rate limit capacity."
+                break
+            
+            attempt += 1
+            started = time.monotonic()
+            overloaded = False
+            retryable = False
+            retry_after = None
+            state.pop("error", None)
+            
+            try:
+                timeout = aiohttp.ClientTimeout(total=max(0.001, min(self.request_timeout, deadline - started)))
+                async with session.post(self.api_url, json=self._stream_payload(payload), timeout=timeout,
+                                        headers=dict(self.headers, Accept="text/event-stream")) as response:
+                    retry_after = retry_delay(response.headers)
+                    if response.status != 200:
+                        error_text = await response.text()
+                        state["error"] = f"HTTP Error: {response.status} - {error_text}"
+                        overloaded = retryable = response.status in RETRYABLE_STATUSES
+                    else:
+                        async for line in response.content:
+                            delta = self._read_sse_line(line.decode("utf-8", errors="replace"), state)
+                            if delta:
+                                yield delta
+            
+            except (GeneratorExit, asyncio.CancelledError):
+                self.limiter.release(started)
+                raise
+            except asyncio.TimeoutError:
+                overloaded = retryable = True
+                state["error"] = "Request timed out."
+            except aiohttp.ClientConnectionError as e:
+                retryable = True
+                state["error"] = str(e)
+            except Exception as e:
+                state["error"] = str(e)
+            
+            self.limiter.release(started, overloaded, retry_after)
+            
+            if not state.get("error") or not retryable or state["parts"]:
+                break
+            wait = self._retry_wait(attempt, deadline, retry_after)
+            if wait is None:
+                break
+            await asyncio.sleep(wait)
+        
+        self._finish_stream(key, state, result)
+    
+    async def close_async_session(self):
+        
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+    
+    def close(self):
+        
+        with self._lock:
+            if self._sync_session is not None:
+                self._sync_session.close()
+                self._sync_session = None
+        
+        if self._loop is not None and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.close_async_session(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> LLMClient:
     
-    return chunks
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+            atexit.register(_client.close)
+        return _client
 
-async def call_model_async(session: aiohttp.ClientSession, content: str, system_prompt: str) -> Dict[str, Any]:
+def set_client(client: LLMClient) -> Optional[LLMClient]:
     
-    payload = {
+    # Points every module-level helper at another endpoint, e.g. a local stub; returns the previous client
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+        return previous
+
+def build_payload(content: str, system_prompt: str) -> Dict[str, Any]:
+    
+    return {
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": content}
@@ -51,57 +520,85 @@ async def call_model_async(session: aiohttp.ClientSession, content: str, system_
         "model": MODEL_NAME
     }
 
-    try:
-        async with session.post(API_URL, headers=headers, json=payload, timeout=60) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                error_text = await response.text()
-                return {"error": f"HTTP Error: {response.status} - {error_text}"}
-
-    except asyncio.TimeoutError:
-        return {"error": "Request timed out."}
-    except Exception as e:
-        return {"error": str(e)}
+@timed("llm_call")
+async def call_model_async(session: Optional[aiohttp.ClientSession], content: str, system_prompt: str,
+                           client: Optional[LLMClient] = None) -> Dict[str, Any]:
+    
+    return await (client or get_client()).post_async(build_payload(content, system_prompt), session=session)
 
+@timed("llm_call")
 def call_model_single(content: str, system_prompt: str) -> Dict[str, Any]:
     
-    payload = {
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": content}
-        ],
-        "temperature": 0.5,
-        "max_tokens": 2048,
-        "model": MODEL_NAME
-    }
+    return get_client().post(build_payload(content, system_prompt))
 
-    try:
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
-        return response.json()
+@timed("llm_stream")
+def call_model_stream(content: str, system_prompt: str, on_delta: Callable[[str], None]) -> Dict[str, Any]:
+    
+    result = {}
+    for delta in get_client().stream(build_payload(content, system_prompt), result):
+        on_delta(delta)
+    return result
 
-    except requests.exceptions.Timeout:
-        return {"error": "Request timed out."}
+@timed("llm_stream")
+async def call_model_stream_async(session: Optional[aiohttp.ClientSession], content: str, system_prompt: str,
+                                  on_delta: Callable[[str], None], client: Optional[LLMClient] = None) -> Dict[str, Any]:
+    
+    result = {}
+    async for delta in (client or get_client()).stream_async(build_payload(content, system_prompt), result, session=session):
+        on_delta(delta)
+    return result
 
-    except requests.exceptions.HTTPError as e:
-        return {"error": f"HTTP Error: {e.response.status_code} - {e.response.text}"}
+def process_extractive_transcript(transcript: str, boundaries: Optional[List[int]] = None,
+                                  on_delta: Optional[Callable[[str], None]] = None,
+                                  llm_error: Optional[str] = None) -> Dict[str, Any]:
+    
+    # Passages of the transcript itself, picked locally: no tone, no endpoint, milliseconds
+    start_time = time.time()
+    summary, stats = extractive_summary(transcript, boundaries)
+    if not summary:
+        return {"error": llm_error or "Transcript is empty"}
+    
+    if on_delta is not None:
+        on_delta(summary)
+    get_metrics().inc("extractive_summaries_total", reason="requested" if llm_error is None else "fallback")
+    
+    info = dict(stats, processing_method="extractive", processing_time=round(time.time() - start_time, 3))
+    if llm_error is not None:
+        info.update({"degraded": True, "llm_error": llm_error})
+    return {"choices": [{"message": {"role": "assistant", "content": summary}}], "processing_info": info}
 
-    except Exception as e:
-        return {"error": str(e)}
+def with_extractive_fallback(result: Dict[str, Any], transcript: str, boundaries: Optional[List[int]] = None,
+                             on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    
+    # When the model fails the caller still gets something to show, flagged so it is not cached as the summary
+    if not SUMMARY_EXTRACTIVE_FALLBACK or ("error" not in result and result.get("choices")):
+        return result
+    
+    error = result.get("error", "Empty model response")
+    print(f"Model unavailable ({error}), falling back to an extractive summary")
+    fallback = process_extractive_transcript(transcript, boundaries, on_delta, llm_error=error)
+    return result if "error" in fallback else fallback
 
-def call_model(transcript: str, tone: str = "student notes", use_batching: bool = True) -> Dict[str, Any]:
+def call_model(transcript: str, tone: str = "student notes", use_batching: bool = True,
+               boundaries: Optional[List[int]] = None,
+               on_delta: Optional[Callable[[str], None]] = None, mode: str = SUMMARY_MODE) -> Dict[str, Any]:
+    
+    if mode not in SUMMARY_MODES:
+        raise ValueError(f"Unknown summary mode {mode!r}, expected one of {', '.join(SUMMARY_MODES)}")
+    if mode == "extractive":
+        return process_extractive_transcript(transcript, boundaries, on_delta)
     
-    estimated_tokens = len(transcript) // 4
+    estimated_tokens = count_tokens(transcript)
     
     if not use_batching or estimated_tokens < 3000:
-        return process_single_transcript(transcript, tone)
+        result = process_single_transcript(transcript, tone, on_delta)
     else:
-        return process_batched_transcript(transcript, tone)
+        result = process_batched_transcript(transcript, tone, boundaries, on_delta)
+    return with_extractive_fallback(result, transcript, boundaries, on_delta)
 
-def process_single_transcript(transcript: str, tone: str) -> Dict[str, Any]:
+def build_summary_prompt(tone: str) -> str:
     
-    system_prompt = f"""
+    return f"""
 You are a helpful assistant that summarizes YouTube videos. Write a natural, detailed summary that a human would write.
 
 User prefers: "{tone}" style.
@@ -114,138 +611,422 @@ Write a comprehensive summary that covers:
 
 Write in a natural, conversational way. Don't use JSON format or bullet points. Just write a flowing, detailed summary that someone could read to understand what the video was about.
 """
-    
-    return call_model_single(transcript, system_prompt)
 
-async def process_batched_transcript_async(transcript: str, tone: str) -> Dict[str, Any]:
+def build_notes_prompt(part: int, total_parts: Optional[int]) -> str:
     
-    chunks = chunk_transcript(transcript, max_tokens=3000)
+    # No style here: the same notes feed every tone, so the chunk fan-out runs once per video.
+    # The total is unknown while a transcript is still arriving
+    position = f"part {part} of {total_parts}" if total_parts else f"part {part}"
     
-    print(f"Processing long video in {len(chunks)} parts simultaneously...")
-    start_time = time.time()
+    return f"""
+You are taking notes on {position} from a long video transcript.
+
+Write dense, neutral notes that capture everything a summary of any style might need: the topics in the order
+they come up, every main point and argument, names, numbers, examples, tools and recommendations.
+Don't add opinions or a writing style, and don't use JSON. Short plain sentences are best.
+"""
+
+def build_chapter_prompt(label: str, index: int, total_chapters: int) -> str:
     
-    connector = aiohttp.TCPConnector(limit=10)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        
-        tasks = []
-        for i, chunk in enumerate(chunks):
-            batch_system_prompt = f"""
-You are summarizing part {i+1} of {len(chunks)} from a long video transcript.
+    return f"""
+You are summarizing chapter {index} of {total_chapters} of a long video. The chapter is about: {label}.
+
+Write a short, neutral summary of this chapter: what it covers, its main points, and any names, numbers, examples
+or recommendations that matter. The same summary is shown next to the chapter and reused for every summary style,
+so don't add a writing style, opinions or JSON.
+"""
+
+def build_merge_prompt(total_batches: int, tone: str) -> str:
+    
+    return f"""
+You have notes on {total_batches} parts of a long video.
 
 User prefers: "{tone}" style.
 
-Write a natural summary of this segment covering the key points discussed. Don't use JSON or bullet points. 
-Write in a flowing, conversational way that captures what this part of the video covered.
+Write a comprehensive, detailed summary that combines all the parts into one flowing narrative. 
+Write it like a human would - naturally and conversationally. Cover all the main points from the entire video.
+Don't use JSON, bullet points, or structured formats. Just write a complete, detailed summary that captures everything important from the video.
+"""
+
+def build_group_merge_prompt(first_part: int, last_part: int, total_parts: int) -> str:
+    
+    return f"""
+You have notes on parts {first_part} to {last_part} out of {total_parts} parts of a long video.
+
+Combine them into one set of dense, neutral notes on this stretch of the video, keeping the order in which things happen.
+Keep every main point, example and important detail, since these notes will be merged again with the other stretches
+and later written up in different styles. Don't add a writing style and don't use JSON.
 """
-            
-            task = call_model_async(session, chunk, batch_system_prompt)
-            tasks.append((i + 1, task))
+
+def batch_label(batch: Dict) -> str:
+    
+    if "label" in batch:
+        return batch["label"]
+    first_part = batch.get("first_part", batch["batch_number"])
+    last_part = batch.get("last_part", batch["batch_number"])
+    if first_part == last_part:
+        return f"Part {first_part}"
+    return f"Parts {first_part}-{last_part}"
+
+def batch_content(batch: Dict) -> str:
+    
+    result = batch["result"]
+    if "choices" in result and len(result["choices"]) > 0:
+        return result["choices"][0]["message"]["content"]
+    return ""
+
+def combine_batch_summaries(batch_summaries: List[Dict], total_batches: int) -> str:
+    
+    combined_content = f"Here are summaries from {total_batches} parts of a long video:\n\n"
+    
+    for batch in batch_summaries:
+        content = batch_content(batch)
+        if content:
+            combined_content += f"{batch_label(batch)}:\n{content}\n\n"
+    
+    return combined_content
+
+def group_batch_summaries(batch_summaries: List[Dict], fan_in: int = MERGE_FAN_IN,
+                          max_tokens: int = MERGE_MAX_TOKENS) -> List[List[Dict]]:
+    
+    # Consecutive runs that fit one merge prompt; a group always takes at least two
+    # summaries so every level shrinks even when single summaries are oversized
+    groups = []
+    current = []
+    current_tokens = 0
+    for batch in batch_summaries:
+        tokens = count_tokens(batch_content(batch))
+        if len(current) >= 2 and (len(current) >= fan_in or current_tokens + tokens > max_tokens):
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(batch)
+        current_tokens += tokens
+    
+    if current:
+        groups.append(current)
+    return groups
+
+def process_single_transcript(transcript: str, tone: str,
+                              on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    
+    if on_delta is not None:
+        return call_model_stream(transcript, build_summary_prompt(tone), on_delta)
+    return call_model_single(transcript, build_summary_prompt(tone))
+
+async def process_batched_transcript_async(transcript: str, tone: str, boundaries: Optional[List[int]] = None,
+                                           on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    
+    chunks = chunk_transcript(transcript, max_tokens=3000, boundaries=boundaries)
+    
+    print(f"Processing long video in {len(chunks)} parts simultaneously...")
+    start_time = time.time()
+    
+    session = get_client().async_session()
+    
+    tasks = []
+    for i, chunk in enumerate(chunks):
+        batch_system_prompt = build_notes_prompt(i + 1, len(chunks))
         
-        print("Running parallel processing...")
-        results = await asyncio.gather(*[task for _, task in tasks], return_exceptions=True)
+        task = call_model_async(session, chunk, batch_system_prompt)
+        tasks.append((i + 1, task))
+    
+    print("Running parallel processing...")
+    results = await asyncio.gather(*[task for _, task in tasks], return_exceptions=True)
+    
+    batch_summaries = []
+    failed_batches = []
+    for i, result in enumerate(results):
+        batch_num = tasks[i][0]
         
-        batch_summaries = []
-        for i, result in enumerate(results):
-            batch_num = tasks[i][0]
-            
-            if isinstance(result, Exception):
-                print(f"Error processing part {batch_num}: {str(result)}")
-            elif "error" in result:
-                print(f"Error processing part {batch_num}: {result['error']}")
-            else:
-                batch_summaries.append({
-                    "batch_number": batch_num,
-                    "result": result
-                })
+        if isinstance(result, Exception):
+            print(f"Error processing part {batch_num}: {str(result)}")
+            failed_batches.append({"batch_number": batch_num, "error": str(result)})
+        elif "error" in result:
+            print(f"Error processing part {batch_num}: {result['error']}")
+            failed_batches.append({"batch_number": batch_num, "error": result["error"]})
+        else:
+            batch_summaries.append({
+                "batch_number": batch_num,
+                "result": result
+            })
     
     end_time = time.time()
     processing_time = end_time - start_time
     print(f"Parallel processing completed in {processing_time:.2f} seconds")
+    get_metrics().observe("stage_seconds", processing_time, stage="map")
     
-    return await merge_batch_results_async(batch_summaries, tone, len(chunks))
+    final_result = await merge_batch_results_async(batch_summaries, tone, len(chunks), session=session, on_delta=on_delta)
+    if "processing_info" in final_result:
+        final_result["processing_info"]["map_seconds"] = round(processing_time, 3)
+        final_result["processing_info"]["failed_batches"] = failed_batches
+    elif failed_batches:
+        final_result["failed_batches"] = failed_batches
+    return final_result
 
-def process_batched_transcript(transcript: str, tone: str) -> Dict[str, Any]:
+def process_batched_transcript(transcript: str, tone: str, boundaries: Optional[List[int]] = None,
+                               on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     
-    return asyncio.run(process_batched_transcript_async(transcript, tone))
+    return get_client().run(process_batched_transcript_async(transcript, tone, boundaries, on_delta))
 
-async def merge_batch_results_async(batch_summaries: List[Dict], tone: str, total_batches: int) -> Dict[str, Any]:
+async def process_progressive_transcript_async(snippets: Iterable[Tuple[str, float, float]], tone: str,
+                                               max_tokens: int = 3000,
+                                               on_partial: Optional[Callable[[int, str], None]] = None,
+                                               on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     
-    if not batch_summaries:
-        return {"error": "No successful batch processing results to merge"}
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    finished = object()
     
-    combined_content = f"Here are summaries from {total_batches} parts of a long video:\n\n"
+    # The snippet source may block on the network, so chunking runs in a worker thread
+    # that hands each full chunk to the loop the moment it is cut
+    def produce():
+        chunker = IncrementalChunker(max_tokens=max_tokens)
+        try:
+            for text, _, _ in snippets:
+                for chunk in chunker.add(text):
+                    loop.call_soon_threadsafe(queue.put_nowait, (chunk, False))
+            for chunk in chunker.flush():
+                loop.call_soon_threadsafe(queue.put_nowait, (chunk, True))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
     
-    for batch in batch_summaries:
-        batch_num = batch["batch_number"]
-        result = batch["result"]
+    start_time = time.time()
+    first_partial = []
+    session = get_client().async_session()
+    producer = loop.run_in_executor(None, produce)
+    
+    async def summarize_part(part: int, chunk: str) -> Dict[str, Any]:
         
-        if "choices" in result and len(result["choices"]) > 0:
-            content = result["choices"][0]["message"]["content"]
-            combined_content += f"Part {batch_num}:\n{content}\n\n"
+        result = await call_model_async(session, chunk, build_notes_prompt(part, None))
+        if "error" not in result and result.get("choices"):
+            if not first_partial:
+                first_partial.append(time.time() - start_time)
+            if on_partial is not None:
+                on_partial(part, result["choices"][0]["message"]["content"])
+        return result
+    
+    chunks = []
+    tasks = []
+    fetch_error = None
+    while True:
+        item = await queue.get()
+        if item is finished:
+            break
+        if isinstance(item, Exception):
+            fetch_error = item
+            continue
+        
+        chunk, is_last = item
+        chunks.append(chunk)
+        
+        # Chunks only come out early once the transcript has outgrown one, so a lone final
+        # chunk is a short video and gets the single-call summary below instead
+        if is_last and len(chunks) == 1:
+            break
+        tasks.append(asyncio.ensure_future(summarize_part(len(chunks), chunk)))
+    
+    await producer
+    
+    if fetch_error is not None:
+        for task in tasks:
+            task.cancel()
+        return {"error": f"Error fetching transcript: {fetch_error}"}
+    
+    if not chunks:
+        return {"error": "Transcript is empty"}
+    
+    if len(chunks) == 1:
+        if on_delta is not None:
+            return await call_model_stream_async(session, chunks[0], build_summary_prompt(tone), on_delta)
+        return await call_model_async(session, chunks[0], build_summary_prompt(tone))
     
-    final_system_prompt = f"""
-You have summaries from {total_batches} parts of a long video.
+    print(f"Transcript arrived in {len(chunks)} parts, waiting for the last summaries...")
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    batch_summaries = []
+    failed_batches = []
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            failed_batches.append({"batch_number": i + 1, "error": str(result)})
+        elif "error" in result:
+            failed_batches.append({"batch_number": i + 1, "error": result["error"]})
+        else:
+            batch_summaries.append({"batch_number": i + 1, "result": result})
+    
+    map_seconds = time.time() - start_time
+    get_metrics().observe("stage_seconds", map_seconds, stage="map")
+    final_result = await merge_batch_results_async(batch_summaries, tone, len(chunks), session=session, on_delta=on_delta)
+    
+    if "processing_info" in final_result:
+        final_result["processing_info"].update({
+            "processing_method": "progressive_batched",
+            "map_seconds": round(map_seconds, 3),
+            "first_partial_seconds": round(first_partial[0], 3) if first_partial else None,
+            "failed_batches": failed_batches
+        })
+    elif failed_batches:
+        final_result["failed_batches"] = failed_batches
+    
+    return final_result
 
-User prefers: "{tone}" style.
+def process_progressive_transcript(snippets: Iterable[Tuple[str, float, float]], tone: str, max_tokens: int = 3000,
+                                   on_partial: Optional[Callable[[int, str], None]] = None,
+                                   on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    
+    return get_client().run(process_progressive_transcript_async(snippets, tone, max_tokens, on_partial, on_delta))
 
-Write a comprehensive, detailed summary that combines all the parts into one flowing narrative. 
-Write it like a human would - naturally and conversationally. Cover all the main points from the entire video.
-Don't use JSON, bullet points, or structured formats. Just write a complete, detailed summary that captures everything important from the video.
-"""
+async def merge_group_async(group: List[Dict], total_batches: int, level: int, index: int,
+                            session: Optional[aiohttp.ClientSession] = None,
+                            client: Optional[LLMClient] = None) -> Dict:
+    
+    if len(group) == 1:
+        return group[0]
+    
+    first_part = group[0].get("first_part", group[0]["batch_number"])
+    last_part = group[-1].get("last_part", group[-1]["batch_number"])
+    result = await call_model_async(session, combine_batch_summaries(group, total_batches),
+                                    build_group_merge_prompt(first_part, last_part, total_batches), client)
+    
+    if "error" in result or not result.get("choices"):
+        print(f"Error merging parts {first_part}-{last_part} at level {level}: {result.get('error', 'empty response')}")
+        return {}
+    
+    return {"batch_number": index, "first_part": first_part, "last_part": last_part, "result": result}
+
+@timed("merge")
+async def merge_batch_results_async(batch_summaries: List[Dict], tone: str, total_batches: int,
+                                    session: Optional[aiohttp.ClientSession] = None,
+                                    on_delta: Optional[Callable[[str], None]] = None,
+                                    fan_in: int = MERGE_FAN_IN, max_tokens: int = MERGE_MAX_TOKENS,
+                                    client: Optional[LLMClient] = None) -> Dict[str, Any]:
+    
+    if not batch_summaries:
+        return {"error": "No successful batch processing results to merge"}
+    
+    # Reduce level by level, merging each level's groups in parallel, until one prompt holds everything
+    merge_levels = []
+    level_summaries = batch_summaries
+    groups = group_batch_summaries(level_summaries, fan_in, max_tokens)
+    while len(groups) > 1:
+        level = len(merge_levels) + 1
+        print(f"Merging {len(level_summaries)} summaries in {len(groups)} groups (level {level})...")
+        level_start = time.time()
+        
+        merged = await asyncio.gather(*[
+            merge_group_async(group, total_batches, level, i + 1, session, client)
+            for i, group in enumerate(groups)
+        ])
+        
+        level_summaries = [batch for batch in merged if batch]
+        merge_levels.append({
+            "level": level,
+            "inputs": sum(len(group) for group in groups),
+            "groups": len(groups),
+            "failed_groups": len(groups) - len(level_summaries),
+            "seconds": round(time.time() - level_start, 3)
+        })
+        
+        if not level_summaries:
+            return {"error": f"Every merge at level {level} failed"}
+        groups = group_batch_summaries(level_summaries, fan_in, max_tokens)
+    
+    combined_content = combine_batch_summaries(level_summaries, total_batches)
+    final_system_prompt = build_merge_prompt(total_batches, tone)
     
     print("Creating final merged summary...")
+    final_start = time.time()
     
-    connector = aiohttp.TCPConnector(limit=1)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        final_result = await call_model_async(session, combined_content, final_system_prompt)
+    if on_delta is not None:
+        final_result = await call_model_stream_async(session, combined_content, final_system_prompt, on_delta, client)
+    else:
+        final_result = await call_model_async(session, combined_content, final_system_prompt, client)
     
     if "error" in final_result:
         return final_result
     
     if "choices" in final_result and len(final_result["choices"]) > 0:
+        merge_levels.append({
+            "level": len(merge_levels) + 1,
+            "inputs": len(level_summaries),
+            "groups": 1,
+            "failed_groups": 0,
+            "seconds": round(time.time() - final_start, 3)
+        })
         final_result["processing_info"] = {
             "total_batches": total_batches,
             "successful_batches": len(batch_summaries),
-            "processing_method": "parallel_batched"
+            "processing_method": "parallel_batched",
+            "merge_depth": len(merge_levels),
+            "merge_levels": merge_levels,
+            # Parts lost to a failed map call or a failed merge group leave the notes incomplete
+            "notes": notes_record(level_summaries, total_batches,
+                                  complete=len(batch_summaries) == total_batches
+                                  and not any(level["failed_groups"] for level in merge_levels))
         }
     
     return final_result
 
-def merge_batch_results(batch_summaries: List[Dict], tone: str, total_batches: int) -> Dict[str, Any]:
+def notes_record(batch_summaries: List[Dict], total_parts: int, complete: bool = True) -> Dict[str, Any]:
     
-    if not batch_summaries:
-        return {"error": "No successful batch processing results to merge"}
+    # The notes that went into the final call, in a form VideoCache can keep and summarize_notes can reuse
+    return {
+        "total_parts": total_parts,
+        "complete": complete,
+        "parts": [
+            {
+                "first_part": batch.get("first_part", batch["batch_number"]),
+                "last_part": batch.get("last_part", batch["batch_number"]),
+                "text": batch_content(batch)
+            }
+            for batch in batch_summaries
+        ]
+    }
+
+def notes_batches(notes: Dict[str, Any]) -> List[Dict]:
     
-    combined_content = f"Here are summaries from {total_batches} parts of a long video:\n\n"
+    return [
+        {
+            "batch_number": i + 1,
+            "first_part": part["first_part"],
+            "last_part": part["last_part"],
+            "result": {"choices": [{"message": {"role": "assistant", "content": part["text"]}}]}
+        }
+        for i, part in enumerate(notes["parts"])
+    ]
+
+async def summarize_notes_async(notes: Dict[str, Any], tone: str, session: Optional[aiohttp.ClientSession] = None,
+                                on_delta: Optional[Callable[[str], None]] = None,
+                                client: Optional[LLMClient] = None) -> Dict[str, Any]:
     
-    for batch in batch_summaries:
-        batch_num = batch["batch_number"]
-        result = batch["result"]
-        
-        if "choices" in result and len(result["choices"]) > 0:
-            content = result["choices"][0]["message"]["content"]
-            combined_content += f"Part {batch_num}:\n{content}\n\n"
+    # Another style for a video whose notes are cached is a single call
+    total_parts = notes["total_parts"]
+    content = combine_batch_summaries(notes_batches(notes), total_parts)
     
-    final_system_prompt = f"""
-You have summaries from {total_batches} parts of a long video.
-
-User prefers: "{tone}" style.
+    if on_delta is not None:
+        result = await call_model_stream_async(session, content, build_merge_prompt(total_parts, tone), on_delta, client)
+    else:
+        result = await call_model_async(session, content, build_merge_prompt(total_parts, tone), client)
+    
+    if "error" not in result and result.get("choices"):
+        result["processing_info"] = {
+            "total_batches": total_parts,
+            "processing_method": "from_notes",
+            "notes": notes
+        }
+    return result
 
-Write a comprehensive, detailed summary that combines all the parts into one flowing narrative. 
-Write it like a human would - naturally and conversationally. Cover all the main points from the entire video.
-Don't use JSON, bullet points, or structured formats. Just write a complete, detailed summary that captures everything important from the video.
-"""
+def summarize_notes(notes: Dict[str, Any], tone: str, on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     
-    final_result = call_model_single(combined_content, final_system_prompt)
+    return get_client().run(summarize_notes_async(notes, tone, on_delta=on_delta))
+
+def merge_batch_results(batch_summaries: List[Dict], tone: str, total_batches: int) -> Dict[str, Any]:
     
-    if "error" in final_result:
-        return final_result
+    final_result = get_client().run(merge_batch_results_async(batch_summaries, tone, total_batches))
     
-    if "choices" in final_result and len(final_result["choices"]) > 0:
-        final_result["processing_info"] = {
-            "total_batches": total_batches,
-            "successful_batches": len(batch_summaries),
-            "processing_method": "batched"
-        }
+    if "processing_info" in final_result:
+        final_result["processing_info"]["processing_method"] = "batched"
     
     return final_result
@@ -1,33 +1,182 @@
-import json
-from tools.yt_transcript import get_transcript_simple
-from llm_endpoint import call_model, chunk_transcript
+from typing import Any, Callable, Dict, List, Optional
+from tools.yt_transcript import get_transcript_with_segments, iter_transcript_snippets, canonical_video_key
+from llm_endpoint import (call_model, process_progressive_transcript, chunk_transcript, count_tokens, summarize_notes,
+                          with_extractive_fallback, SUMMARY_MODE)
+from transcript_segments import TranscriptSegments
+from chapters import SUMMARY_CHAPTERS, chapter_label, process_chapter_transcript
+from transcript_cleaning import reduce_transcript, TRANSCRIPT_REDUCTION_RATIO
 from video_chatbot import VideoDetailBot
 from video_cache import VideoCache
+from request_coalescer import Coalescer
 
-def summarize_youtube_video(url: str, tone: str = "casual recap", use_batching: bool = True) -> tuple:
+_summary_coalescer = Coalescer()
+
+class ConsoleStream:
+    
+    def __init__(self, header: str = ""):
+        self.header = header
+        self.started = False
+    
+    def __call__(self, delta: str):
+        if not self.started:
+            print(self.header, end="", flush=True)
+            self.started = True
+        print(delta, end="", flush=True)
+
+def print_partial_summary(part: int, text: str):
+    
+    preview = " ".join(text.split())
+    if len(preview) > 160:
+        preview = preview[:157] + "..."
+    print(f"\n[Part {part}] {preview}", flush=True)
+
+def report_compression(label: str, stats: Dict[str, Any]):
+    
+    if stats.get("tokens_before"):
+        saved = 1 - stats["compression_ratio"]
+        print(f"{label}: {stats['tokens_before']:,} -> {stats['tokens_after']:,} tokens ({saved:.0%} smaller)")
+
+def summarize_youtube_video(url: str, tone: str = "casual recap", use_batching: bool = True,
+                            on_delta: Optional[Callable[[str], None]] = None,
+                            on_partial: Optional[Callable[[int, str], None]] = None,
+                            notes_out: Optional[Dict[str, Any]] = None, chapters: bool = SUMMARY_CHAPTERS,
+                            chapters_out: Optional[List[Dict[str, Any]]] = None, mode: str = SUMMARY_MODE,
+                            info_out: Optional[Dict[str, Any]] = None) -> tuple:
+    
+    # Concurrent callers asking for the same video and style share one run. Only the caller that starts it
+    # streams deltas and partial summaries; every caller gets the finished summary, notes, chapters and info
+    key = (canonical_video_key(url), tone, use_batching, chapters, mode)
+    run = _summary_coalescer.run(key, lambda: _summarize_youtube_video(url, tone, use_batching, on_delta, on_partial,
+                                                                       chapters, mode))
+    
+    if notes_out is not None and run["notes"]:
+        notes_out.update(run["notes"])
+    if chapters_out is not None and run["chapters"]:
+        chapters_out.extend(run["chapters"])
+    if info_out is not None:
+        info_out.update(run["info"])
+    return run["summary"], run["transcript"], run["chunks"], run["segments"]
+
+def summarize_cached_video(cache: VideoCache, url: str, tone: str,
+                           on_delta: Optional[Callable[[str], None]] = None, mode: str = SUMMARY_MODE) -> str:
+    
+    # A style not asked for before costs one call over the cached notes, or over the transcript of a short video
+    if mode == "llm":
+        summary = cache.load_summary(url, tone)
+        if summary is not None:
+            return summary
+    
+    def cached_transcript():
+        cached_data = cache.load_video_data(url)
+        segments = cached_data["segments"]
+        return cached_data["transcript"], segments.boundaries() if segments is not None else None
+    
+    notes = cache.load_notes(url) if mode == "llm" else None
+    if notes is not None:
+        print("Writing this style from the cached notes...")
+        result = summarize_notes(notes, tone, on_delta)
+        if "error" in result or not result.get("choices"):
+            result = with_extractive_fallback(result, *cached_transcript(), on_delta)
+    else:
+        transcript, boundaries = cached_transcript()
+        result = call_model(transcript, tone=tone, boundaries=boundaries, on_delta=on_delta, mode=mode)
     
-    print("Getting video transcript...")
-    transcript = get_transcript_simple(url)
+    if "error" in result or not result.get("choices"):
+        return f"Sorry, couldn't create summary: {result.get('error', 'empty response')}"
     
-    if transcript.startswith("Error"):
-        return f"Sorry, couldn't get the transcript: {transcript}", None, None
+    # Extractive text is not a summary in this style, so the next request still asks the model
+    summary = result["choices"][0]["message"]["content"]
+    if result.get("processing_info", {}).get("processing_method") == "extractive":
+        return summary
+    cache.save_summary(url, tone, summary)
+    if notes is None and result.get("processing_info", {}).get("notes"):
+        cache.save_notes(url, result["processing_info"]["notes"])
+    return summary
+
+def _summarize_progressively(url: str, tone: str, on_delta: Optional[Callable[[str], None]],
+                             on_partial: Callable[[int, str], None]) -> tuple:
+    
+    # Parts are summarized while the transcript is still being read; the full text is rebuilt afterwards
+    snippets = []
+    cleaning_stats = {}
+    
+    def recorded_snippets():
+        for snippet in iter_transcript_snippets(url, cleaning_stats):
+            snippets.append(snippet)
+            yield snippet
+    
+    result = process_progressive_transcript(recorded_snippets(), tone, on_partial=on_partial, on_delta=on_delta)
+    report_compression("Transcript cleaned", cleaning_stats)
+    
+    transcript, segments = TranscriptSegments.from_snippets(snippets)
+    return result, transcript, segments
+
+def _summarize_youtube_video(url: str, tone: str, use_batching: bool,
+                             on_delta: Optional[Callable[[str], None]] = None,
+                             on_partial: Optional[Callable[[int, str], None]] = None, chapters: bool = False,
+                             mode: str = SUMMARY_MODE) -> Dict[str, Any]:
+    
+    def outcome(summary: str, transcript: Optional[str] = None, chunks: Optional[List[str]] = None,
+                segments: Optional[TranscriptSegments] = None, notes: Optional[Dict[str, Any]] = None,
+                chapter_list: Optional[List[Dict[str, Any]]] = None, info: Optional[Dict[str, Any]] = None):
+        return {"summary": summary, "transcript": transcript, "chunks": chunks, "segments": segments,
+                "notes": notes, "chapters": chapter_list or [], "info": info or {}}
+    
+    found_chapters = []
     
-    print("Creating summary...")
-    result = call_model(transcript, tone=tone, use_batching=use_batching)
+    # Chapters need the whole transcript before the first boundary can be placed
+    if use_batching and on_partial is not None and not chapters and mode == "llm":
+        print("Reading transcript and summarizing parts as they arrive...")
+        result, transcript, segments = _summarize_progressively(url, tone, on_delta, on_partial)
+        
+        if result.get("error", "").startswith("Error fetching transcript"):
+            return outcome(f"Sorry, couldn't get the transcript: {result['error']}")
+        
+        boundaries = segments.boundaries()
+        result = with_extractive_fallback(result, transcript, boundaries, on_delta)
+    else:
+        print("Getting video transcript...")
+        cleaning_stats = {}
+        transcript, segments = get_transcript_with_segments(url, cleaning_stats)
+        
+        if transcript.startswith("Error"):
+            return outcome(f"Sorry, couldn't get the transcript: {transcript}")
+        
+        report_compression("Transcript cleaned", cleaning_stats)
+        boundaries = segments.boundaries() if segments is not None else None
+        
+        if chapters and use_batching and mode == "llm":
+            print("Finding chapters and summarizing them...")
+            result = process_chapter_transcript(transcript, tone, segments, on_delta=on_delta)
+            # Kept even if the final write-up fails, since each chapter has its own summary
+            found_chapters = result.get("processing_info", {}).get("chapters") or []
+            result = with_extractive_fallback(result, transcript, boundaries, on_delta)
+        else:
+            # The model may get a shortened transcript; the cache and the chat bot keep the full one
+            model_transcript, model_boundaries = transcript, boundaries
+            if TRANSCRIPT_REDUCTION_RATIO < 1.0 and mode == "llm":
+                model_transcript, model_boundaries, reduction_stats = reduce_transcript(transcript, boundaries)
+                report_compression("Extractive reduction", reduction_stats)
+            
+            print("Creating summary...")
+            result = call_model(model_transcript, tone=tone, use_batching=use_batching, boundaries=model_boundaries,
+                                on_delta=on_delta, mode=mode)
     
     if "error" in result:
-        return f"Sorry, couldn't create summary: {result['error']}", None, None
+        return outcome(f"Sorry, couldn't create summary: {result['error']}", chapter_list=found_chapters)
     
     if "choices" in result and len(result["choices"]) > 0:
         summary = result["choices"][0]["message"]["content"]
+        processing_info = result.get("processing_info", {})
         
         chunks = None
-        if use_batching and len(transcript) // 4 >= 3000:
-            chunks = chunk_transcript(transcript, max_tokens=3000)
+        if use_batching and count_tokens(transcript) >= 3000:
+            chunks = chunk_transcript(transcript, max_tokens=3000, boundaries=boundaries)
         
-        return summary, transcript, chunks
+        return outcome(summary, transcript, chunks, segments, processing_info.get("notes"), found_chapters,
+                       {key: value for key, value in processing_info.items() if key not in ("notes", "chapters")})
     else:
-        return "Sorry, couldn't understand the AI response.", None, None
+        return outcome("Sorry, couldn't understand the AI response.")
 
 def chat_with_video(bot: VideoDetailBot):
     
@@ -40,24 +189,51 @@ def chat_with_video(bot: VideoDetailBot):
             if not user_input:
                 continue
             
-            response = bot.handle_user_input(user_input)
+            stream = ConsoleStream("\nBot: ")
+            response = bot.handle_user_input(user_input, on_delta=stream)
             
             if response == "chat_exit":
                 print("\nExiting chat...")
                 break
             
-            print(f"\nBot: {response}")
+            if stream.started:
+                print()
+            else:
+                print(f"\nBot: {response}")
+            
+            prompt_tokens = bot.last_turn_stats.get("prompt_tokens")
+            if prompt_tokens:
+                print(f"(prompt: {prompt_tokens:,} tokens)")
             
         except KeyboardInterrupt:
             print("\nChat interrupted. Exiting...")
             break
 
+def show_summary(summary: str, stream: ConsoleStream):
+    
+    if stream.started:
+        print("\n" + "=" * 60)
+    else:
+        print("\n" + "=" * 60)
+        print("VIDEO SUMMARY:")
+        print("=" * 60)
+        print(summary)
+        print("=" * 60)
+
+def show_chapters(chapters: List[Dict[str, Any]]):
+    
+    print("\nCHAPTERS:")
+    for chapter in chapters:
+        print(f"\n{chapter_label(chapter)}")
+        if chapter.get("summary"):
+            print(chapter["summary"])
+
 def main():
     print("YouTube Video Summarizer with Detail Bot")
     print("=" * 50)
     
     cache = VideoCache()
-    bot = VideoDetailBot()
+    bot = VideoDetailBot(cache=cache)
     
     url = input("\nEnter YouTube URL: ").strip()
     
@@ -65,21 +241,6 @@ def main():
         print("Please enter a valid YouTube URL")
         return
     
-    if cache.is_cached(url):
-        bot.load_video(url)
-        cached_data = cache.load_video_data(url)
-        
-        print("\n" + "=" * 60)
-        print("VIDEO SUMMARY:")
-        print("=" * 60)
-        print(cached_data["summary"])
-        print("=" * 60)
-        
-        chat_choice = input("\nWant to ask detailed questions about this video? (Y/n): ").strip().lower()
-        if chat_choice != 'n':
-            chat_with_video(bot)
-        return
-    
     print("\nChoose style:")
     print("1. Casual (easy to read)")
     print("2. Academic (detailed)")
@@ -94,17 +255,42 @@ def main():
     }
     tone = tone_map.get(choice, "casual recap")
     
-    print(f"\nProcessing video...")
-    summary, transcript, chunks = summarize_youtube_video(url, tone, use_batching=True)
+    stream = ConsoleStream("\n" + "=" * 60 + "\nVIDEO SUMMARY:\n" + "=" * 60 + "\n")
     
-    print("\n" + "=" * 60)
-    print("VIDEO SUMMARY:")
-    print("=" * 60)
-    print(summary)
-    print("=" * 60)
+    # The bot's load and any re-summary are then answered from the cache's memory tier
+    if cache.load_video_data(url) is not None:
+        bot.load_video(url)
+        summary = summarize_cached_video(cache, url, tone, on_delta=stream)
+        show_summary(summary, stream)
+        if bot.chapters:
+            show_chapters(bot.chapters)
+        
+        chat_choice = input("\nWant to ask detailed questions about this video? (Y/n): ").strip().lower()
+        if chat_choice != 'n':
+            chat_with_video(bot)
+        return
+    
+    print(f"\nProcessing video...")
+    notes = {}
+    chapters = []
+    info = {}
+    summary, transcript, chunks, segments = summarize_youtube_video(url, tone, use_batching=True, on_delta=stream,
+                                                                    on_partial=print_partial_summary, notes_out=notes,
+                                                                    chapters_out=chapters, info_out=info)
+    show_summary(summary, stream)
+    if chapters:
+        show_chapters(chapters)
     
     if transcript:
-        bot.load_video(url, transcript, summary, chunks)
+        bot.load_video(url, transcript, summary, chunks, segments)
+        # Saved after the video, which drops chapters of a transcript that has changed since
+        if chapters:
+            cache.save_chapters(url, chapters)
+            bot.chapters = chapters
+        if info.get("processing_method") != "extractive":
+            cache.save_summary(url, tone, summary)
+        if notes:
+            cache.save_notes(url, notes)
         
         chat_choice = input("\nWant to ask detailed questions about this video? (Y/n): ").strip().lower()
         if chat_choice != 'n':
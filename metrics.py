@@ -0,0 +1,250 @@
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False", "")
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "yt_summarizer_")
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKEN_KINDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Histogram:
+    
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def quantile(self, fraction: float) -> float:
+        
+        # Upper bound of the bucket holding the quantile, which is as close as fixed buckets get
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99)
+        }
+
+class _Timer:
+    
+    __slots__ = ("metrics", "name", "labels", "start")
+    
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, Any]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.name, elapsed, **self.labels)
+        if exc_type is not None:
+            self.metrics.inc("stage_errors_total", **self.labels)
+        return False
+
+class _NullTimer:
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class Metrics:
+    
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, **labels):
+        
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+    
+    def timer(self, stage: str, **labels):
+        
+        # `with metrics.timer("merge"):` records into stage_seconds{stage="merge"}
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, "stage_seconds", dict(labels, stage=stage))
+    
+    def record_usage(self, usage: Optional[Dict[str, Any]], **labels):
+        
+        if not self.enabled or not usage:
+            return
+        for kind in TOKEN_KINDS:
+            if usage.get(kind):
+                self.inc("llm_tokens_total", usage[kind], kind=kind.replace("_tokens", ""), **labels)
+    
+    def cache_access(self, cache: str, hit: bool):
+        self.inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+    
+    def reset(self):
+        
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: histogram.snapshot() for key, histogram in self._histograms.items()}
+        
+        cache_totals: Dict[str, Dict[str, float]] = {}
+        for (name, labels), value in counters.items():
+            if name == "cache_requests_total":
+                label_map = dict(labels)
+                totals = cache_totals.setdefault(label_map["cache"], {"hit": 0, "miss": 0})
+                totals[label_map["result"]] += value
+        
+        return {
+            "enabled": self.enabled,
+            "uptime_seconds": round(time.time() - self.started, 3),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters.items())],
+            "histograms": [dict(histogram, name=name, labels=dict(labels))
+                           for (name, labels), histogram in sorted(histograms.items())],
+            "cache_hit_ratio": {
+                cache: round(totals["hit"] / (totals["hit"] + totals["miss"]), 4)
+                for cache, totals in sorted(cache_totals.items())
+            }
+        }
+    
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+    
+    def dump(self, path: str):
+        
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+    
+    def to_prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (histogram.buckets, list(histogram.counts), histogram.count, histogram.sum))
+                for key, histogram in self._histograms.items()
+            )
+        
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {prefix}{name} counter")
+                declared.add(name)
+            lines.append(f"{prefix}{name}{_format_labels(labels)} {value:g}")
+        
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(labels, 'le="%g"' % bound)
+                lines.append(f"{prefix}{name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels(labels, 'le="+Inf"')
+            lines.append(f"{prefix}{name}_bucket{inf_labels} {count}")
+            lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{prefix}{name}_count{_format_labels(labels)} {count}")
+        
+        return "\n".join(lines) + "\n"
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics() -> Metrics:
+    
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+def timed(stage: str, **labels) -> Callable:
+    
+    # With metrics disabled the function is returned untouched, so instrumented code costs nothing
+    def decorate(func: Callable) -> Callable:
+        if not METRICS_ENABLED:
+            return func
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with get_metrics().timer(stage, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timer(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    
+    return decorate
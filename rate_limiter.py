@@ -0,0 +1,220 @@
+import asyncio
+import email.utils
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Mapping, Optional
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", os.getenv("LLM_POOL_SIZE", "32")))
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+LLM_REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", "300"))
+
+RETRYABLE_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    
+    # Retry-After is seconds or an HTTP date; x-ratelimit-reset-* uses Go-style "1m30s" or "250ms"
+    if not value:
+        return None
+    value = value.strip()
+    
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    
+    matches = _DURATION_RE.findall(value)
+    if matches:
+        scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+        return sum(float(amount) * scale[unit] for amount, unit in matches)
+    
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(headers: Mapping[str, str]) -> Optional[float]:
+    
+    delay = parse_duration(headers.get("Retry-After") or headers.get("retry-after"))
+    if delay is not None:
+        return delay
+    
+    # OpenAI-style budget headers: when a bucket is empty, wait for its reset
+    for bucket in ("requests", "tokens"):
+        remaining = headers.get(f"x-ratelimit-remaining-{bucket}")
+        if remaining is not None and remaining.strip() in ("0", "0.0"):
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{bucket}"))
+            if reset is not None:
+                delay = max(delay or 0.0, reset)
+    return delay
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE_DELAY, cap: float = LLM_RETRY_MAX_DELAY) -> float:
+    
+    # Full jitter keeps retries from a burst of failures from arriving together again
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class AdaptiveLimiter:
+    
+    # One AIMD window and one rolling per-minute budget shared by every thread and event loop,
+    # so concurrent videos draw on the same allowance instead of each assuming the whole quota
+    def __init__(self, initial: int = LLM_INITIAL_CONCURRENCY, min_limit: int = 1, max_limit: int = LLM_MAX_CONCURRENCY,
+                 requests_per_minute: int = LLM_REQUESTS_PER_MINUTE, tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+                 decrease_factor: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.decrease_factor = decrease_factor
+        
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.throttled = 0
+        
+        self._window = deque()
+        self._window_tokens = 0
+        self._lock = threading.Lock()
+        self._waiters: List[Callable[[], None]] = []
+    
+    def _wait_time(self, tokens: int, now: float) -> Optional[float]:
+        
+        # None means there is room now; otherwise how long before it is worth checking again
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        
+        while self._window and now - self._window[0][0] >= 60:
+            self._window_tokens -= self._window.popleft()[1]
+        
+        if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+            return 60 - (now - self._window[0][0])
+        if self.tokens_per_minute and self._window and self._window_tokens + tokens > self.tokens_per_minute:
+            return 60 - (now - self._window[0][0])
+        
+        if self.in_flight >= int(self.limit):
+            return 1.0
+        return None
+    
+    def _try_acquire(self, tokens: int) -> Optional[float]:
+        
+        now = time.monotonic()
+        with self._lock:
+            wait = self._wait_time(tokens, now)
+            if wait is None:
+                self.in_flight += 1
+                self._window.append((now, tokens))
+                self._window_tokens += tokens
+            return wait
+    
+    def _add_waiter(self, wake: Callable[[], None]):
+        with self._lock:
+            self._waiters.append(wake)
+    
+    def _remove_waiter(self, wake: Callable[[], None]):
+        with self._lock:
+            if wake in self._waiters:
+                self._waiters.remove(wake)
+    
+    def _wake_all(self):
+        
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for wake in waiters:
+            wake()
+    
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None) -> bool:
+        
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait is None:
+                return True
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    return False
+                wait = min(wait, deadline - time.monotonic())
+            
+            event = threading.Event()
+            self._add_waiter(event.set)
+            event.wait(max(wait, 0.001))
+            self._remove_waiter(event.set)
+    
+    async def acquire_async(self, tokens: int = 0, deadline: Optional[float] = None) -> bool:
+        
+        loop = asyncio.get_running_loop()
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait is None:
+                return True
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    return False
+                wait = min(wait, deadline - time.monotonic())
+            
+            # Releases can come from another thread's loop, so wake this one thread-safely
+            future = loop.create_future()
+            
+            def wake(future=future):
+                try:
+                    loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+                except RuntimeError:
+                    pass
+            
+            self._add_waiter(wake)
+            try:
+                await asyncio.wait_for(future, timeout=max(wait, 0.001))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._remove_waiter(wake)
+    
+    def release(self, started: float, overloaded: bool = False, retry_after: Optional[float] = None):
+        
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            
+            if overloaded:
+                self.throttled += 1
+                # Only requests sent after the last cut count, so one burst of 429s halves the window once
+                if started >= self.last_decrease:
+                    self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                    self.last_decrease = now
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / max(self.limit, 1.0))
+            
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+        
+        self._wake_all()
+    
+    def stats(self) -> dict:
+        
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "window_requests": len(self._window),
+                "window_tokens": self._window_tokens
+            }
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> AdaptiveLimiter:
+    
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter()
+        return _limiter
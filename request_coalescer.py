@@ -0,0 +1,67 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class AsyncCoalescer:
+    
+    def __init__(self):
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+    
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._pending
+    
+    async def run(self, key: Hashable, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        
+        task = self._pending.get(key)
+        
+        if task is None:
+            task = asyncio.ensure_future(coro_factory())
+            self._pending[key] = task
+            
+            def forget(done: asyncio.Future):
+                if self._pending.get(key) is done:
+                    del self._pending[key]
+            
+            task.add_done_callback(forget)
+        
+        # A cancelled caller must not cancel the shared work the other callers are waiting on
+        return await asyncio.shield(task)
+
+class _Call:
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Coalescer:
+    
+    def __init__(self):
+        self._pending: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+    
+    def run(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        
+        with self._lock:
+            call = self._pending.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._pending[key] = call
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            call.done.set()
@@ -0,0 +1,139 @@
+import os
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from lexical_index import tokenize
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+def semantic_available() -> bool:
+    return np is not None
+
+class HashingEmbedder:
+    
+    # Feature-hashed words, word pairs and character trigrams: no model download, fully offline,
+    # and the trigrams let "trained" and "training" land close to each other
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing{dim}"
+    
+    def _features(self, text: str) -> List[int]:
+        
+        words = tokenize(text)
+        features = []
+        for i, word in enumerate(words):
+            features.append(zlib.crc32(word.encode()))
+            if i:
+                features.append(zlib.crc32(f"{words[i - 1]} {word}".encode()))
+            padded = f"<{word}>"
+            for j in range(len(padded) - 2):
+                features.append(zlib.crc32(padded[j:j + 3].encode()) ^ 0x5bd1e995)
+        return features
+    
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = np.array(self._features(text), dtype=np.uint32)
+            if not len(features):
+                continue
+            signs = np.where(features & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], features % self.dim, signs)
+        
+        # Sublinear term weighting, then unit length so a dot product is the cosine
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        return vectors
+
+class SentenceTransformerEmbedder:
+    
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+    
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        return self.model.encode(list(texts), batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                                 normalize_embeddings=True).astype(np.float32)
+
+_embedder = None
+
+def get_embedder():
+    
+    global _embedder
+    if _embedder is None:
+        if EMBEDDING_MODEL:
+            try:
+                _embedder = SentenceTransformerEmbedder(EMBEDDING_MODEL)
+            except Exception as e:
+                print(f"Could not load embedding model {EMBEDDING_MODEL} ({e}), using hashed features instead")
+        if _embedder is None:
+            _embedder = HashingEmbedder()
+    return _embedder
+
+class SemanticIndex:
+    
+    def __init__(self, vectors: "np.ndarray", embedder):
+        self.vectors = vectors
+        self.embedder = embedder
+    
+    @classmethod
+    def build(cls, passages: Sequence[str], embedder=None, batch_size: int = EMBEDDING_BATCH_SIZE) -> "SemanticIndex":
+        
+        embedder = embedder or get_embedder()
+        batches = [embedder.embed(passages[i:i + batch_size]) for i in range(0, len(passages), batch_size)]
+        vectors = np.vstack(batches) if batches else np.zeros((0, getattr(embedder, "dim", 1)), dtype=np.float32)
+        return cls(vectors, embedder)
+    
+    @classmethod
+    def load(cls, path: str, embedder=None) -> "SemanticIndex":
+        return cls(np.load(path, mmap_mode="r"), embedder or get_embedder())
+    
+    def save(self, path: str):
+        
+        # Write then rename so a reader never maps a half-written file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        os.replace(temp_path, path)
+    
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+    
+    def search_many(self, queries: Sequence[str], k: int = 5) -> List[List[Tuple[int, float]]]:
+        
+        if not len(self):
+            return [[] for _ in queries]
+        
+        scores = self.embedder.embed(queries) @ self.vectors.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([(int(doc_id), float(scores[row, doc_id])) for doc_id in ordered if scores[row, doc_id] > 0])
+        return results
+    
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        return self.search_many([query], k)[0]
+
+def fuse_rankings(rankings: Sequence[List[Tuple[int, float]]], k: int = 5, smoothing: int = 60) -> List[Tuple[int, float]]:
+    
+    # Reciprocal rank fusion: BM25 and cosine scores live on different scales, ranks do not
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (smoothing + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+from batch_summarizer import BatchSummarizer
+from llm_endpoint import SUMMARY_MODES
+from metrics import get_metrics
+from tools.yt_transcript import canonical_video_key, TranscriptPrefetcher
+from video_cache import VideoCache, VIDEO_CACHE_COMPACT_INTERVAL
+from video_chatbot import VideoDetailBot
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "4"))
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "100"))
+SERVER_JOB_TTL = float(os.getenv("SERVER_JOB_TTL", "3600"))
+SERVER_MAX_BOTS = int(os.getenv("SERVER_MAX_BOTS", "32"))
+
+class SummaryService:
+    
+    def __init__(self, workers: int = SERVER_WORKERS, queue_size: int = SERVER_QUEUE_SIZE,
+                 summarizer: Optional[BatchSummarizer] = None, cache: Optional[VideoCache] = None,
+                 job_ttl: float = SERVER_JOB_TTL, max_bots: int = SERVER_MAX_BOTS,
+                 prefetcher: Optional[TranscriptPrefetcher] = None,
+                 compact_interval: float = VIDEO_CACHE_COMPACT_INTERVAL):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.cache = cache or VideoCache()
+        self.summarizer = summarizer or BatchSummarizer(cache=self.cache)
+        self.job_ttl = job_ttl
+        self.max_bots = max_bots
+        self.prefetcher = prefetcher
+        self.compact_interval = compact_interval
+        
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._active_jobs: Dict[Any, str] = {}
+        self._done: Dict[str, asyncio.Future] = {}
+        self._bots = OrderedDict()
+        self._bot_locks: Dict[str, asyncio.Lock] = {}
+        self._bot_lock_users: Dict[str, int] = {}
+        self._video_versions: Dict[str, int] = {}
+        self._worker_tasks = []
+        self.queue = None
+    
+    async def start(self):
+        
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.summarizer.open()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.compact_interval > 0:
+            self.cache.start_compaction(self.compact_interval)
+    
+    async def stop(self):
+        
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self.cache.stop_compaction(timeout=5)
+        self.cache.flush_access()
+        await self.summarizer.client.close_async_session()
+        if self.prefetcher is not None:
+            self.prefetcher.close(wait=False)
+    
+    def _prune_jobs(self):
+        
+        cutoff = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.get("finished", time.time()) < cutoff]:
+            del self.jobs[job_id]
+            self._done.pop(job_id, None)
+    
+    def submit(self, url: str, tone: str) -> Dict[str, Any]:
+        
+        # The same video and tone already waiting or running is answered by that job
+        key = (canonical_video_key(url), tone)
+        job_id = self._active_jobs.get(key)
+        if job_id is not None:
+            get_metrics().inc("jobs_coalesced_total")
+            return self.jobs[job_id]
+        
+        self._prune_jobs()
+        job = {"id": uuid.uuid4().hex, "url": url, "tone": tone, "status": "queued", "submitted": time.time()}
+        self.queue.put_nowait((key, job))
+        
+        self.jobs[job["id"]] = job
+        self._active_jobs[key] = job["id"]
+        self._done[job["id"]] = asyncio.get_running_loop().create_future()
+        
+        # The transcript downloads while the job waits for a worker; the job is already queued,
+        # so a prefetch that cannot start must not fail the request
+        if self.prefetcher is not None:
+            try:
+                self.prefetcher.submit(url)
+            except Exception as e:
+                print(f"Prefetching transcript for {url} failed: {e}")
+        return job
+    
+    async def wait(self, job_id: str) -> Dict[str, Any]:
+        
+        await asyncio.shield(self._done[job_id])
+        return self.jobs[job_id]
+    
+    async def _worker(self):
+        
+        session = self.summarizer.client.async_session()
+        while True:
+            key, job = await self.queue.get()
+            job["status"] = "running"
+            job["started"] = time.time()
+            get_metrics().observe("job_queue_seconds", job["started"] - job["submitted"])
+            
+            try:
+                record = await self.summarizer.summarize(session, job["url"], job["tone"])
+                if record["status"] == "cached":
+                    loop = asyncio.get_running_loop()
+                    record["summary"] = await loop.run_in_executor(None, self.cache.load_summary, job["url"], job["tone"])
+                    chapters = await loop.run_in_executor(None, self.cache.load_chapters, job["url"])
+                    if chapters:
+                        record["chapters"] = [
+                            {key: chapter[key] for key in ("index", "title", "start_time", "end_time", "summary")}
+                            for chapter in chapters
+                        ]
+            except Exception as e:
+                record = {"url": job["url"], "status": "error", "stage": "pipeline", "error": str(e)}
+            
+            # A fresh summary may have re-saved the video with a new transcript, so its bot is reloaded on the next turn
+            if record["status"] == "ok":
+                self._forget_bot(key[0])
+            
+            job["status"] = "error" if record["status"] == "error" else "done"
+            job["result"] = record
+            job["finished"] = time.time()
+            get_metrics().observe("job_seconds", job["finished"] - job["started"])
+            get_metrics().inc("jobs_total", status=record["status"])
+            
+            self._active_jobs.pop(key, None)
+            done = self._done.get(job["id"])
+            if done is not None and not done.done():
+                done.set_result(None)
+            self.queue.task_done()
+    
+    def _forget_bot(self, key: str):
+        
+        # Bots only load inside a chat turn, so the version is only tracked while one is running
+        self._bots.pop(key, None)
+        if key in self._bot_locks:
+            self._video_versions[key] = self._video_versions.get(key, 0) + 1
+    
+    async def _bot_for(self, url: str) -> Optional[VideoDetailBot]:
+        
+        key = canonical_video_key(url)
+        bot = self._bots.get(key)
+        if bot is not None:
+            self._bots.move_to_end(key)
+            return bot
+        
+        version = self._video_versions.get(key, 0)
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self.cache.is_cached, url):
+            return None
+        
+        bot = VideoDetailBot(cache=self.cache)
+        await loop.run_in_executor(None, bot.load_video, url)
+        
+        # Not kept if the video was re-saved while it loaded; this turn still uses what it read
+        if self._video_versions.get(key, 0) == version:
+            self._bots[key] = bot
+            while len(self._bots) > self.max_bots:
+                self._bots.popitem(last=False)
+        return bot
+    
+    async def chat(self, url: str, message: str) -> Optional[Dict[str, Any]]:
+        
+        # Turns about one video run one at a time so its history stays in order. The lock lives as long as
+        # some turn holds or waits for it, independent of whether the bot itself is still cached
+        key = canonical_video_key(url)
+        lock = self._bot_locks.setdefault(key, asyncio.Lock())
+        self._bot_lock_users[key] = self._bot_lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                bot = await self._bot_for(url)
+                if bot is None:
+                    return None
+                
+                reply = await asyncio.get_running_loop().run_in_executor(None, bot.handle_user_input, message)
+                return {"reply": reply, "stats": bot.last_turn_stats}
+        finally:
+            self._bot_lock_users[key] -= 1
+            if not self._bot_lock_users[key]:
+                del self._bot_lock_users[key]
+                del self._bot_locks[key]
+                self._video_versions.pop(key, None)
+
+async def _read_json(request: web.Request) -> Dict[str, Any]:
+    
+    try:
+        body = await request.json()
+    except Exception:
+        raise web.HTTPBadRequest(text='{"error": "Body must be JSON"}', content_type="application/json")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text='{"error": "Body must be a JSON object"}', content_type="application/json")
+    return body
+
+async def handle_summarize(request: web.Request) -> web.Response:
+    
+    service: SummaryService = request.app["service"]
+    body = await _read_json(request)
+    
+    url = str(body.get("url", "")).strip()
+    if not url or ("youtube.com" not in url and "youtu.be" not in url):
+        return web.json_response({"error": "A YouTube URL is required"}, status=400)
+    
+    mode = body.get("mode") or "llm"
+    if mode not in SUMMARY_MODES:
+        return web.json_response({"error": f"mode must be one of {', '.join(SUMMARY_MODES)}"}, status=400)
+    
+    # Extractive summaries are made locally in milliseconds, so they are answered inline instead of queued
+    if mode == "extractive":
+        record = await service.summarizer.summarize_extractive(url)
+        return web.json_response({"url": url, "mode": mode, "status": "error" if record["status"] == "error" else "done",
+                                  "result": record}, status=502 if record["status"] == "error" else 200)
+    
+    try:
+        job = service.submit(url, body.get("tone") or service.summarizer.tone)
+    except asyncio.QueueFull:
+        get_metrics().inc("jobs_rejected_total")
+        return web.json_response({"error": "Too many queued jobs, try again later"}, status=503,
+                                 headers={"Retry-After": "5"})
+    
+    if not body.get("wait"):
+        return web.json_response(job, status=202)
+    
+    job = await service.wait(job["id"])
+    return web.json_response(job, status=200 if job["status"] == "done" else 502)
+
+async def handle_job(request: web.Request) -> web.Response:
+    
+    job = request.app["service"].jobs.get(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"error": "Unknown job"}, status=404)
+    return web.json_response(job)
+
+async def handle_chat(request: web.Request) -> web.Response:
+    
+    body = await _read_json(request)
+    url = str(body.get("url", "")).strip()
+    message = str(body.get("message", "")).strip()
+    if not url or not message:
+        return web.json_response({"error": "Both url and message are required"}, status=400)
+    
+    answer = await request.app["service"].chat(url, message)
+    if answer is None:
+        return web.json_response({"error": "Video is not cached, summarize it first"}, status=404)
+    return web.json_response(answer)
+
+async def handle_videos(request: web.Request) -> web.Response:
+    
+    service: SummaryService = request.app["service"]
+    try:
+        limit = int(request.query.get("limit", "50"))
+        offset = int(request.query.get("offset", "0"))
+    except ValueError:
+        return web.json_response({"error": "limit and offset must be integers"}, status=400)
+    
+    loop = asyncio.get_running_loop()
+    videos = await loop.run_in_executor(None, service.cache.list_cached_videos, limit, offset)
+    total = await loop.run_in_executor(None, service.cache.count_cached_videos)
+    return web.json_response({"total": total, "limit": limit, "offset": offset, "videos": videos})
+
+async def handle_health(request: web.Request) -> web.Response:
+    
+    service: SummaryService = request.app["service"]
+    return web.json_response({
+        "status": "ok",
+        "queued": service.queue.qsize(),
+        "queue_size": service.queue_size,
+        "workers": service.workers,
+        "limiter": service.summarizer.client.limiter.stats(),
+        "video_memory": service.cache.memory_stats()
+    })
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    
+    metrics = get_metrics()
+    if request.query.get("format") == "json":
+        return web.json_response(metrics.snapshot())
+    return web.Response(text=metrics.to_prometheus(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+def create_app(service: Optional[SummaryService] = None) -> web.Application:
+    
+    app = web.Application()
+    app["service"] = service or SummaryService()
+    
+    async def on_startup(app: web.Application):
+        await app["service"].start()
+    
+    async def on_cleanup(app: web.Application):
+        await app["service"].stop()
+    
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    
+    app.router.add_post("/summarize", handle_summarize)
+    app.router.add_get("/jobs/{job_id}", handle_job)
+    app.router.add_post("/chat", handle_chat)
+    app.router.add_get("/videos", handle_videos)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+def main():
+    
+    parser = argparse.ArgumentParser(description="Serve summaries and video chat over HTTP")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE)
+    args = parser.parse_args()
+    
+    service = SummaryService(workers=args.workers, queue_size=args.queue_size, prefetcher=TranscriptPrefetcher())
+    web.run_app(create_app(service), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from chunking import TranscriptChunker, estimate_tokens
+
+WORDS = ("so", "basically", "the", "model", "learns", "weights", "from", "data", "and", "then", "we", "evaluate",
+         "gradient", "descent", "backpropagation", "you", "know", "right", "layer", "network")
+
+def caption_text(words: int, seed: int = 0) -> str:
+    
+    # Auto-generated captions: lower case, no punctuation, one long run of words
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def caption_boundaries(text: str, words_per_caption: int = 8):
+    
+    boundaries = []
+    position = 0
+    for i, word in enumerate(text.split(" ")):
+        if i and i % words_per_caption == 0:
+            boundaries.append(position)
+        position += len(word) + 1
+    return boundaries
+
+def chunker(max_tokens: int, overlap_tokens: int = 0, **kwargs) -> TranscriptChunker:
+    return TranscriptChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens, counter=estimate_tokens, **kwargs)
+
+@pytest.mark.parametrize("use_boundaries", [False, True])
+def test_period_free_text_is_split_within_budget(use_boundaries):
+    
+    text = caption_text(20000)
+    boundaries = caption_boundaries(text) if use_boundaries else None
+    chunks = chunker(3000).split(text, boundaries)
+    
+    assert estimate_tokens(text) > 3000 * 5
+    assert len(chunks) > 5
+    assert all(estimate_tokens(chunk) <= 3000 for chunk in chunks)
+
+def test_period_free_chunks_cover_the_text_in_order():
+    
+    text = caption_text(8000, seed=1)
+    chunks = chunker(1000).split(text)
+    
+    assert " ".join(chunks).split() == text.split()
+
+def test_chunks_are_balanced():
+    
+    text = caption_text(20000, seed=2)
+    sizes = [estimate_tokens(chunk) for chunk in chunker(3000).split(text, caption_boundaries(text))]
+    
+    # Even shares of the total, not full chunks followed by a small remainder
+    assert min(sizes) >= 0.9 * max(sizes)
+
+def test_overlap_repeats_the_tail_of_the_previous_chunk():
+    
+    text = caption_text(8000, seed=3)
+    spans = chunker(1000, overlap_tokens=100).split_spans(text, caption_boundaries(text))
+    
+    assert len(spans) > 2
+    for (_, previous_end), (start, end) in zip(spans, spans[1:]):
+        assert start < previous_end
+        assert 0 < estimate_tokens(text[start:previous_end]) <= 100
+        assert estimate_tokens(text[start:end]) <= 1000
+
+def test_overlap_must_be_smaller_than_the_budget():
+    
+    with pytest.raises(ValueError):
+        chunker(100, overlap_tokens=100)
+
+def test_small_budgets_stay_within_budget_on_long_text():
+    
+    text = caption_text(60000, seed=4)
+    spans = chunker(40, max_unit_tokens=20).split_spans(text, caption_boundaries(text))
+    
+    assert all(estimate_tokens(text[start:end]) <= 40 for start, end in spans)
+    assert " ".join(text[start:end] for start, end in spans).split() == text.split()
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from benchmarks.stub_llm_server import StubLLMServer
+from llm_endpoint import LLMClient
+from rate_limiter import AdaptiveLimiter
+
+@pytest.fixture
+def stub():
+    
+    # A provider that answers 429 with Retry-After once more than two requests are in flight
+    server = StubLLMServer(latency=0.02, max_concurrent=2, retry_after=0.05).start_background()
+    yield server
+    server.stop_background()
+
+def payload(text: str) -> dict:
+    return {"model": "stub", "messages": [{"role": "user", "content": text}]}
+
+async def post_all(client: LLMClient, texts):
+    
+    try:
+        return await asyncio.gather(*[client.post_async(payload(text)) for text in texts])
+    finally:
+        await client.close_async_session()
+
+def test_throttled_chunks_are_retried_and_the_window_recovers(stub):
+    
+    limiter = AdaptiveLimiter(initial=16, max_limit=16)
+    client = LLMClient(api_url=stub.url, use_cache=False, limiter=limiter, max_retries=8, deadline=60)
+    
+    chunks = [f"chunk {i}" for i in range(24)]
+    results = asyncio.run(post_all(client, chunks))
+    
+    # Every chunk comes back with its own answer even though the burst was throttled
+    assert [result.get("choices", [{}])[0].get("message", {}).get("content") for result in results] == chunks
+    assert stub.rejected > 0
+    assert limiter.throttled > 0
+    shrunk = limiter.limit
+    assert shrunk < 16
+    
+    # Once the provider stops throttling, successful requests widen the window again
+    stub.max_concurrent = 0
+    results = asyncio.run(post_all(client, [f"more {i}" for i in range(40)]))
+    assert all("choices" in result for result in results)
+    assert limiter.limit > shrunk
@@ -1,19 +1,42 @@
-from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api import (YouTubeTranscriptApi, InvalidVideoId, NoTranscriptFound, TranscriptsDisabled,
+                                    VideoUnavailable)
+import os
 import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from metrics import timed
+from request_coalescer import Coalescer
+from transcript_cache import get_transcript_cache
+from transcript_segments import TranscriptSegments
+from transcript_cleaning import CaptionCleaner, clean_snippets, TRANSCRIPT_CLEANING
+
+TRANSCRIPT_LANGUAGES = tuple(l.strip() for l in os.getenv("TRANSCRIPT_LANGUAGES", "en").split(",") if l.strip())
+TRANSCRIPT_PREFETCH_WORKERS = int(os.getenv("TRANSCRIPT_PREFETCH_WORKERS", "2"))
+
+# YouTube keeps giving the same answer to these for a while, so they are remembered rather than retried
+_PERMANENT_ERRORS = (InvalidVideoId, NoTranscriptFound, TranscriptsDisabled, VideoUnavailable)
+
+_transcript_coalescer = Coalescer()
+_api = None
+_api_lock = threading.Lock()
 
 def extract_video_id(url: str) -> str:
     
+    url = url.strip()
+    
     if "youtu.be/" in url:
-        video_id = url.split("youtu.be/")[-1].split("?")[0]
+        video_id = re.split(r"[?#&/]", url.split("youtu.be/")[-1])[0]
         return video_id
     
     if "youtube.com" in url:
         if "v=" in url:
-            video_id = url.split("v=")[-1].split("&")[0]
-            return video_id
-        elif "embed/" in url:
-            video_id = url.split("embed/")[-1].split("?")[0]
+            video_id = re.split(r"[&#]", url.split("v=")[-1])[0]
             return video_id
+        for marker in ("embed/", "shorts/", "live/", "/v/"):
+            if marker in url:
+                video_id = re.split(r"[?#&/]", url.split(marker)[-1])[0]
+                return video_id
     
     # If no pattern matches, try to extract anything that looks like a video ID
     video_id_pattern = r'([a-zA-Z0-9_-]{11})'
@@ -23,15 +46,60 @@ def extract_video_id(url: str) -> str:
     
     raise ValueError(f"Could not extract video ID from URL: {url}")
 
+def canonical_video_key(url: str) -> str:
+    
+    # Different links to the same video should share one cache entry and one fetch
+    try:
+        return extract_video_id(url)
+    except ValueError:
+        return url.strip()
+
+def get_transcript_api() -> YouTubeTranscriptApi:
+    
+    # One client, and so one pooled HTTP session, for every fetch in the process
+    global _api
+    with _api_lock:
+        if not isinstance(_api, YouTubeTranscriptApi):
+            _api = YouTubeTranscriptApi()
+        return _api
+
+@timed("transcript_download")
+def _download_snippets(video_id: str, languages: Sequence[str]) -> List[Tuple[str, float, float]]:
+    
+    cache = get_transcript_cache()
+    try:
+        transcript = get_transcript_api().fetch(video_id, languages=languages)
+    except _PERMANENT_ERRORS as e:
+        if cache is not None:
+            cache.set_error(video_id, languages[0], f"{type(e).__name__} for video {video_id}")
+        raise
+    
+    snippets = [(entry.text, entry.start, entry.duration) for entry in transcript]
+    if cache is not None:
+        cache.set(video_id, getattr(transcript, "language_code", languages[0]), snippets)
+    return snippets
+
+def fetch_snippets(video_id: str, languages: Sequence[str] = TRANSCRIPT_LANGUAGES) -> List[Tuple[str, float, float]]:
+    
+    # Raw snippets from the transcript cache, or from YouTube at most once however many callers ask at the same time
+    languages = tuple(languages)
+    cache = get_transcript_cache()
+    if cache is not None:
+        cached = cache.get(video_id, languages)
+        if cached is not None:
+            if "error" in cached:
+                raise RuntimeError(cached["error"])
+            return cached["snippets"]
+    
+    return _transcript_coalescer.run((video_id, languages), lambda: _download_snippets(video_id, languages))
+
 def get_transcript(link: str) -> str:
     
     try:
         video_id = extract_video_id(link)
         print(f"Extracted video ID: {video_id}")
         
-        api = YouTubeTranscriptApi()
-        transcript = api.fetch(video_id)
-        full_text = " ".join([entry.text for entry in transcript])
+        full_text = " ".join(text for text, _, _ in fetch_snippets(video_id))
         
         print(f"Transcript extracted: {len(full_text)} characters")
         return full_text
@@ -39,16 +107,126 @@ def get_transcript(link: str) -> str:
     except Exception as e:
         return f"Error fetching transcript: {str(e)}"
 
-def get_transcript_simple(link: str) -> str:
+def _raw_snippets(link: str) -> Iterator[Tuple[str, float, float]]:
+    yield from fetch_snippets(extract_video_id(link))
+
+def iter_transcript_snippets(link: str, cleaning_stats: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, float, float]]:
+    
+    # Hands snippets on one by one so chunking and model calls can start before the caller has them all
+    if not TRANSCRIPT_CLEANING:
+        yield from _raw_snippets(link)
+        return
+    
+    cleaner = CaptionCleaner()
+    yield from clean_snippets(_raw_snippets(link), cleaner)
+    if cleaning_stats is not None:
+        cleaning_stats.update(cleaner.stats())
+
+@timed("transcript_fetch")
+def get_transcript_with_segments(link: str,
+                                 cleaning_stats: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[TranscriptSegments]]:
     
     try:
-        video_id = extract_video_id(link)
+        snippets = fetch_snippets(extract_video_id(link))
         
-        api = YouTubeTranscriptApi()
-        transcript = api.fetch(video_id)
-        full_text = " ".join([entry.text for entry in transcript])
+        # Caption noise goes before the segments are built, so offsets and timings stay consistent
+        if TRANSCRIPT_CLEANING:
+            cleaner = CaptionCleaner()
+            snippets = list(clean_snippets(snippets, cleaner))
+            if cleaning_stats is not None:
+                cleaning_stats.update(cleaner.stats())
         
-        return full_text
+        return TranscriptSegments.from_snippets(snippets)
         
     except Exception as e:
-        return f"Error fetching transcript: {str(e)}"
+        return f"Error fetching transcript: {str(e)}", None
+
+def get_transcript_simple(link: str) -> str:
+    
+    transcript, _ = get_transcript_with_segments(link)
+    return transcript
+
+class TranscriptPrefetcher:
+    
+    # Warms the transcript cache for videos waiting to be summarized. Fetches share the process-wide
+    # client and coalesce with any fetch the pipeline starts for the same video
+    def __init__(self, workers: int = TRANSCRIPT_PREFETCH_WORKERS, languages: Sequence[str] = TRANSCRIPT_LANGUAGES):
+        self.workers = workers
+        self.languages = tuple(languages)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcript-prefetch")
+        
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self.fetched = 0
+        self.skipped = 0
+        self.failed = 0
+    
+    def submit(self, url: str) -> Optional[Future]:
+        
+        cache = get_transcript_cache()
+        if cache is None:
+            return None
+        
+        # A link without a video ID is left for the pipeline, which reports it as that URL's error
+        try:
+            video_id = extract_video_id(url)
+        except ValueError:
+            return None
+        
+        with self._lock:
+            future = self._pending.get(video_id)
+            if future is not None:
+                return future
+            if cache.contains(video_id, self.languages):
+                self.skipped += 1
+                return None
+            
+            future = self.executor.submit(self._fetch, video_id)
+            self._pending[video_id] = future
+        
+        future.add_done_callback(lambda _: self._forget(video_id))
+        return future
+    
+    def _forget(self, video_id: str):
+        with self._lock:
+            self._pending.pop(video_id, None)
+    
+    def _fetch(self, video_id: str) -> bool:
+        
+        try:
+            fetch_snippets(video_id, self.languages)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"Prefetching transcript for {video_id} failed: {e}")
+            return False
+        
+        with self._lock:
+            self.fetched += 1
+        return True
+    
+    def prefetch(self, urls: Iterable[str]) -> List[Future]:
+        return [future for future in map(self.submit, urls) if future is not None]
+    
+    def wait(self):
+        
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            future.result()
+    
+    def stats(self) -> Dict[str, Any]:
+        
+        with self._lock:
+            return {"fetched": self.fetched, "skipped": self.skipped, "failed": self.failed,
+                    "pending": len(self._pending)}
+    
+    def close(self, wait: bool = True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close(wait=exc_type is None)
+        return False
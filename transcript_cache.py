@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from metrics import get_metrics
+
+TRANSCRIPT_CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", os.path.join("video_cache", "transcripts.db"))
+TRANSCRIPT_CACHE_TTL = float(os.getenv("TRANSCRIPT_CACHE_TTL", str(90 * 24 * 3600)))
+TRANSCRIPT_CACHE_ERROR_TTL = float(os.getenv("TRANSCRIPT_CACHE_ERROR_TTL", str(6 * 3600)))
+
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+
+def compress(data: bytes) -> Tuple[str, bytes]:
+    
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=10).compress(data)
+    return CODEC_ZLIB, zlib.compress(data, 6)
+
+def decompress(codec: str, blob: bytes) -> bytes:
+    
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Transcript was stored with zstd but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob)
+
+class TranscriptCache:
+    
+    # Raw caption snippets per (video ID, language), kept apart from summaries so a failed
+    # model run never costs another trip to YouTube
+    def __init__(self, path: str = TRANSCRIPT_CACHE_PATH, ttl: float = TRANSCRIPT_CACHE_TTL,
+                 error_ttl: float = TRANSCRIPT_CACHE_ERROR_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored_bytes = 0
+        self.raw_bytes = 0
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            "video_id TEXT NOT NULL, language TEXT NOT NULL, codec TEXT, data BLOB, error TEXT, "
+            "fetched REAL NOT NULL, PRIMARY KEY (video_id, language))"
+        )
+    
+    def get(self, video_id: str, languages: Sequence[str]) -> Optional[Dict[str, Any]]:
+        
+        # First language in preference order with a fresh entry; {"error": ...} for a remembered failure
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT language, codec, data, error, fetched FROM transcripts WHERE video_id = ? "
+                f"AND language IN ({','.join('?' * len(languages))})",
+                (video_id, *languages)
+            ).fetchall()
+        
+        entries = {row[0]: row[1:] for row in rows}
+        for language in languages:
+            if language not in entries:
+                continue
+            codec, data, error, fetched = entries[language]
+            ttl = self.error_ttl if error else self.ttl
+            if ttl > 0 and now - fetched > ttl:
+                continue
+            
+            self.hits += 1
+            get_metrics().cache_access("transcript", True)
+            if error:
+                return {"language": language, "error": error}
+            return {"language": language, "snippets": [tuple(s) for s in json.loads(decompress(codec, data))]}
+        
+        self.misses += 1
+        get_metrics().cache_access("transcript", False)
+        return None
+    
+    def set(self, video_id: str, language: str, snippets: List[Tuple[str, float, float]]):
+        
+        raw = json.dumps(snippets, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        codec, blob = compress(raw)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, NULL, ?)",
+                (video_id, language, codec, blob, time.time())
+            )
+            self.raw_bytes += len(raw)
+            self.stored_bytes += len(blob)
+    
+    def set_error(self, video_id: str, language: str, error: str):
+        
+        # Only for answers that will not change soon, such as captions being disabled
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, NULL, NULL, ?, ?)",
+                (video_id, language, error, time.time())
+            )
+    
+    def contains(self, video_id: str, languages: Sequence[str]) -> bool:
+        
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT 1 FROM transcripts WHERE video_id = ? AND error IS NULL "
+                f"AND language IN ({','.join('?' * len(languages))}) AND (? <= 0 OR fetched >= ?)",
+                (video_id, *languages, self.ttl, time.time() - self.ttl)
+            ).fetchone()
+        return row is not None
+    
+    def clear(self):
+        
+        with self._lock:
+            self._conn.execute("DELETE FROM transcripts")
+    
+    def stats(self) -> Dict[str, Any]:
+        
+        total = self.hits + self.misses
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM transcripts"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": entries,
+            "stored_bytes": size,
+            "codec": CODEC_ZSTD if zstandard is not None else CODEC_ZLIB,
+            "compression_ratio": round(self.stored_bytes / self.raw_bytes, 3) if self.raw_bytes else None
+        }
+    
+    def close(self):
+        
+        with self._lock:
+            self._conn.close()
+
+_transcript_cache = None
+_transcript_cache_lock = threading.Lock()
+
+def get_transcript_cache() -> Optional[TranscriptCache]:
+    
+    global _transcript_cache
+    if not TRANSCRIPT_CACHE_ENABLED:
+        return None
+    
+    with _transcript_cache_lock:
+        if _transcript_cache is None:
+            _transcript_cache = TranscriptCache()
+        return _transcript_cache
+
+def set_transcript_cache(cache: Optional[TranscriptCache]) -> Optional[TranscriptCache]:
+    
+    global _transcript_cache
+    with _transcript_cache_lock:
+        previous, _transcript_cache = _transcript_cache, cache
+        return previous
@@ -0,0 +1,140 @@
+import bisect
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from chunking import TranscriptChunker, count_tokens
+from metrics import timed
+from extractive import extractive_available, select_within_budget, textrank_scores, tfidf_matrix
+
+TRANSCRIPT_CLEANING = os.getenv("TRANSCRIPT_CLEANING", "1") not in ("0", "false", "False", "")
+TRANSCRIPT_STRIP_FILLERS = os.getenv("TRANSCRIPT_STRIP_FILLERS", "1") not in ("0", "false", "False", "")
+TRANSCRIPT_REDUCTION_RATIO = float(os.getenv("TRANSCRIPT_REDUCTION_RATIO", "1.0"))
+
+_NON_SPEECH_RE = re.compile(
+    r"\[[^\]]{0,40}\]|\((?:music|applause|laughter|laughs|laughing|inaudible|silence|cheering|cheers)[^)]{0,20}\)"
+    r"|[♪♫]+|>>",
+    re.IGNORECASE
+)
+_FILLER_RE = re.compile(r"\b(?:u+h+|u+m+|uhm+|e+rm+|hm+|mm+|mhm)\b[,.]?", re.IGNORECASE)
+_KEY_STRIP = ".,!?;:\"'"
+
+class CaptionCleaner:
+    
+    def __init__(self, strip_fillers: bool = TRANSCRIPT_STRIP_FILLERS, max_overlap_words: int = 40):
+        self.strip_fillers = strip_fillers
+        self.max_overlap_words = max_overlap_words
+        self._tail: List[str] = []
+        
+        self.raw_tokens = 0
+        self.clean_tokens = 0
+        self.snippets = 0
+        self.dropped_snippets = 0
+    
+    def _repeated_prefix(self, keys: List[str]) -> int:
+        
+        # Rolling captions repeat the end of the previous line at the start of the next one.
+        # Only start positions where the first word matches can begin an overlap
+        tail = self._tail
+        first = keys[0]
+        for position in range(max(0, len(tail) - len(keys)), len(tail)):
+            if tail[position] != first:
+                continue
+            overlap = len(tail) - position
+            if tail[position:] == keys[:overlap] and (overlap >= 2 or overlap == len(keys)):
+                return overlap
+        return 0
+    
+    def clean(self, text: str) -> str:
+        
+        self.snippets += 1
+        self.raw_tokens += count_tokens(text)
+        
+        text = _NON_SPEECH_RE.sub(" ", text)
+        if self.strip_fillers:
+            text = _FILLER_RE.sub(" ", text)
+        
+        words = text.split()
+        if not words:
+            self.dropped_snippets += 1
+            return ""
+        
+        keys = [word.lower().strip(_KEY_STRIP) for word in words]
+        overlap = self._repeated_prefix(keys) if self._tail else 0
+        words = words[overlap:]
+        if not words:
+            self.dropped_snippets += 1
+            return ""
+        
+        self._tail = (self._tail + keys[overlap:])[-self.max_overlap_words:]
+        cleaned = " ".join(words)
+        self.clean_tokens += count_tokens(cleaned)
+        return cleaned
+    
+    def stats(self) -> Dict[str, Any]:
+        return compression_stats(self.raw_tokens, self.clean_tokens, snippets=self.snippets,
+                                 dropped_snippets=self.dropped_snippets)
+
+def compression_stats(tokens_before: int, tokens_after: int, **extra) -> Dict[str, Any]:
+    
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "compression_ratio": round(tokens_after / tokens_before, 3) if tokens_before else 1.0
+    }
+    stats.update(extra)
+    return stats
+
+def clean_snippets(snippets: Iterable[Tuple[str, float, float]],
+                   cleaner: Optional[CaptionCleaner] = None) -> Iterator[Tuple[str, float, float]]:
+    
+    cleaner = cleaner or CaptionCleaner()
+    for text, start, duration in snippets:
+        cleaned = cleaner.clean(text)
+        if cleaned:
+            yield cleaned, start, duration
+
+@timed("reduction")
+def reduce_transcript(transcript: str, boundaries: Optional[Sequence[int]] = None,
+                      ratio: float = TRANSCRIPT_REDUCTION_RATIO,
+                      passage_tokens: int = 60) -> Tuple[str, Optional[List[int]], Dict[str, Any]]:
+    
+    # Keep the most central passages (TextRank over TF-IDF) up to `ratio` of the tokens, in video order
+    if ratio >= 1.0:
+        return transcript, list(boundaries) if boundaries is not None else None, compression_stats(0, 0)
+    
+    chunker = TranscriptChunker(max_tokens=passage_tokens, overlap_tokens=0, max_unit_tokens=passage_tokens // 2)
+    spans = chunker.split_spans(transcript, boundaries)
+    costs = [count_tokens(transcript[start:end]) for start, end in spans]
+    total = sum(costs)
+    
+    if len(spans) < 2 or not extractive_available():
+        if not extractive_available():
+            print("numpy is not installed, skipping extractive reduction")
+        return transcript, list(boundaries) if boundaries is not None else None, compression_stats(total, total)
+    
+    scores = textrank_scores(tfidf_matrix([transcript[start:end] for start, end in spans]))
+    kept = select_within_budget(scores, costs, int(total * ratio))
+    
+    parts = []
+    new_boundaries = [] if boundaries is not None else None
+    position = 0
+    for index in kept:
+        start, end = spans[index]
+        text = transcript[start:end].strip()
+        lead = len(transcript[start:end]) - len(transcript[start:end].lstrip())
+        if parts:
+            position += 1
+        
+        # Carry the caption boundaries inside each kept passage over to the reduced text
+        if new_boundaries is not None:
+            new_boundaries.append(position)
+            first = bisect.bisect_right(boundaries, start + lead)
+            last = bisect.bisect_left(boundaries, start + lead + len(text))
+            new_boundaries.extend(position + b - start - lead for b in boundaries[first:last])
+        
+        parts.append(text)
+        position += len(text)
+    
+    return " ".join(parts), new_boundaries, compression_stats(total, sum(costs[i] for i in kept), passages=len(spans),
+                                                              kept_passages=len(kept))
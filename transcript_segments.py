@@ -0,0 +1,114 @@
+import bisect
+import struct
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+_HEADER = struct.Struct("<4sI")
+_MAGIC = b"TSG1"
+
+def format_timestamp(seconds: float) -> str:
+    
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+class TranscriptSegments:
+    
+    def __init__(self, starts: array, durations: array, offsets: array):
+        self.starts = starts
+        self.durations = durations
+        self.offsets = offsets
+    
+    @classmethod
+    def from_snippets(cls, snippets: Iterable[Tuple[str, float, float]]) -> Tuple[str, "TranscriptSegments"]:
+        
+        starts = array("d")
+        durations = array("d")
+        offsets = array("q")
+        parts = []
+        position = 0
+        
+        for text, start, duration in snippets:
+            text = text.strip()
+            if not text:
+                continue
+            if parts:
+                position += 1
+            starts.append(start)
+            durations.append(duration)
+            offsets.append(position)
+            parts.append(text)
+            position += len(text)
+        
+        # Same " " join the plain transcript has always used, so offsets index straight into it
+        return " ".join(parts), cls(starts, durations, offsets)
+    
+    def __len__(self) -> int:
+        return len(self.starts)
+    
+    @property
+    def duration(self) -> float:
+        return self.starts[-1] + self.durations[-1] if len(self) else 0.0
+    
+    def boundaries(self) -> List[int]:
+        return self.offsets.tolist()
+    
+    def index_at_time(self, seconds: float) -> int:
+        return max(0, bisect.bisect_right(self.starts, seconds) - 1)
+    
+    def index_at_offset(self, offset: int) -> int:
+        return max(0, bisect.bisect_right(self.offsets, offset) - 1)
+    
+    def text_between(self, transcript: str, start_time: float, end_time: float) -> str:
+        
+        if not len(self):
+            return ""
+        
+        first = self.index_at_time(start_time)
+        last = bisect.bisect_left(self.starts, end_time)
+        end_offset = self.offsets[last] if last < len(self) else len(transcript)
+        return transcript[self.offsets[first]:end_offset].strip()
+    
+    def time_span(self, start_offset: int, end_offset: int) -> Tuple[float, float]:
+        
+        first = self.index_at_offset(start_offset)
+        last = self.index_at_offset(max(start_offset, end_offset - 1))
+        return self.starts[first], self.starts[last] + self.durations[last]
+    
+    def chunk_time_spans(self, transcript: str, chunks: List[str]) -> List[Optional[Tuple[float, float]]]:
+        
+        # Chunks are stored as text, so find each one in order to recover its offsets
+        spans = []
+        search_from = 0
+        for chunk in chunks:
+            position = transcript.find(chunk[:200], search_from) if len(self) else -1
+            if position < 0:
+                spans.append(None)
+                continue
+            spans.append(self.time_span(position, position + len(chunk)))
+            search_from = position + 1
+        return spans
+    
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_MAGIC, len(self)) + self.starts.tobytes() + self.durations.tobytes() + self.offsets.tobytes()
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TranscriptSegments":
+        
+        magic, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a transcript segment blob")
+        
+        position = _HEADER.size
+        columns = []
+        for typecode in ("d", "d", "q"):
+            column = array(typecode)
+            size = count * column.itemsize
+            column.frombytes(data[position:position + size])
+            position += size
+            columns.append(column)
+        
+        return cls(*columns)
@@ -1,77 +1,951 @@
 import pickle
 import os
+import re
+import sys
+import json
+import glob
+import time
+import argparse
+import sqlite3
 import hashlib
-from typing import Dict, List, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
+from metrics import get_metrics, timed
+from transcript_cache import compress, decompress
+from tools.yt_transcript import canonical_video_key
+from transcript_segments import TranscriptSegments
+
+CHAT_MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", "1000"))
+VIDEO_CACHE_MEMORY_BYTES = int(os.getenv("VIDEO_CACHE_MEMORY_BYTES", str(128 * 1024 * 1024)))
+VIDEO_CACHE_MMAP_BYTES = int(os.getenv("VIDEO_CACHE_MMAP_BYTES", "0"))
+VIDEO_CACHE_MAX_BYTES = int(os.getenv("VIDEO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+VIDEO_CACHE_MAX_ENTRIES = int(os.getenv("VIDEO_CACHE_MAX_ENTRIES", "0"))
+VIDEO_CACHE_MAX_AGE = float(os.getenv("VIDEO_CACHE_MAX_AGE", "0"))
+VIDEO_CACHE_EVICTION = os.getenv("VIDEO_CACHE_EVICTION", "lru")
+VIDEO_CACHE_COMPRESS_AFTER = float(os.getenv("VIDEO_CACHE_COMPRESS_AFTER", "0"))
+VIDEO_CACHE_COMPACT_INTERVAL = float(os.getenv("VIDEO_CACHE_COMPACT_INTERVAL", "3600"))
+
+_ARTIFACT_FILE_RE = re.compile(r"^([0-9a-f]{32})_(.+)$")
+
+def _entry_size(video_data: Dict) -> int:
+    
+    # What the loaded strings and segment arrays actually hold in memory, not their length in characters
+    size = sys.getsizeof(video_data["transcript"]) + sys.getsizeof(video_data["summary"]) + sys.getsizeof(video_data["url"])
+    size += sum(sys.getsizeof(chunk) for chunk in video_data["chunks"])
+    if video_data["segments"] is not None:
+        size += len(video_data["segments"]) * 24
+    return size
+
+def _pack(transcript: str, chunks: List[str]) -> bytes:
+    
+    # Chunks are slices of the transcript, so both compress together far better than apart
+    codec, blob = compress(json.dumps({"transcript": transcript, "chunks": chunks}).encode("utf-8"))
+    return codec.encode("ascii") + b"\0" + blob
+
+def _unpack(data: bytes) -> Tuple[str, List[str]]:
+    
+    codec, _, blob = bytes(data).partition(b"\0")
+    packed = json.loads(decompress(codec.decode("ascii"), blob))
+    return packed["transcript"], packed["chunks"]
 
 class VideoCache:
     
-    def __init__(self, cache_dir: str = "video_cache"):
+    def __init__(self, cache_dir: str = "video_cache", memory_bytes: int = VIDEO_CACHE_MEMORY_BYTES,
+                 mmap_bytes: int = VIDEO_CACHE_MMAP_BYTES):
         self.cache_dir = cache_dir
         os.makedirs(cache_dir, exist_ok=True)
+        
+        self.db_path = os.path.join(cache_dir, "videos.db")
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        
+        # Hot videos stay decoded in memory, bounded by their size in bytes rather than their count
+        self.memory_bytes = memory_bytes
+        self._memory: "OrderedDict[str, Tuple[Dict, str, int]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._memory_used = 0
+        self._local_writes = 0
+        self.memory_hits = 0
+        self.memory_misses = 0
+        self.memory_evictions = 0
+        
+        # Counted per video, so turns on one video never trigger trimming of another
+        self._appends_since_compaction: Dict[str, int] = {}
+        
+        # Loads are counted in memory and written out in batches so reads stay read-only most of the time
+        self._pending_access: Dict[str, int] = {}
+        self._access_lock = threading.Lock()
+        self._last_access_flush = 0.0
+        self._compaction_thread = None
+        self._compaction_stop = None
+        
+        self._init_schema()
+        self._migrate_pickle_files()
+        self._rekey_by_video_id()
+        self._migrate_chat_history()
+    
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        
+        # One connection per thread; WAL lets readers and a writer work side by side
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.mmap_bytes > 0:
+                # Large transcripts are then read straight from the page cache instead of copied through read()
+                conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            self._local.conn = conn
+        return conn
+    
+    def _init_schema(self):
+        
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_hash TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                transcript_length INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                transcript TEXT NOT NULL,
+                chunks TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_videos_timestamp ON videos(timestamp);
+            
+            CREATE TABLE IF NOT EXISTS chat_history (
+                video_hash TEXT PRIMARY KEY,
+                history TEXT NOT NULL
+            );
+            
+            CREATE TABLE IF NOT EXISTS chat_turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_hash TEXT NOT NULL,
+                turn TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chat_turns_video ON chat_turns(video_hash, id);
+            
+            CREATE TABLE IF NOT EXISTS summaries (
+                video_hash TEXT NOT NULL,
+                tone TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                PRIMARY KEY (video_hash, tone)
+            );
+            
+            CREATE TABLE IF NOT EXISTS artifacts (
+                video_hash TEXT NOT NULL,
+                name TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (video_hash, name)
+            );
+            
+            CREATE TABLE IF NOT EXISTS access (
+                video_hash TEXT PRIMARY KEY,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+    
+    def _migrate_pickle_files(self):
+        
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'pickle_migrated'").fetchone():
+            return
+        
+        migrated = 0
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            
+            # Another process may have finished the migration while we waited for the lock
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'pickle_migrated'").fetchone():
+                return
+            
+            for cache_path in glob.glob(os.path.join(self.cache_dir, "*_data.pkl")):
+                video_hash = os.path.basename(cache_path)[:-len("_data.pkl")]
+                try:
+                    with open(cache_path, 'rb') as f:
+                        video_data = pickle.load(f)
+                except Exception as e:
+                    print(f"Skipping unreadable cache file {cache_path}: {e}")
+                    continue
+                
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        video_hash,
+                        video_data["url"],
+                        video_data.get("timestamp") or datetime.now().isoformat(),
+                        video_data.get("transcript_length", len(video_data["transcript"])),
+                        video_data["summary"],
+                        video_data["transcript"],
+                        json.dumps(video_data.get("chunks") or [])
+                    )
+                )
+                migrated += 1
+            
+            for cache_path in glob.glob(os.path.join(self.cache_dir, "*_chat.pkl")):
+                video_hash = os.path.basename(cache_path)[:-len("_chat.pkl")]
+                try:
+                    with open(cache_path, 'rb') as f:
+                        chat_history = pickle.load(f)
+                except Exception as e:
+                    print(f"Skipping unreadable cache file {cache_path}: {e}")
+                    continue
+                
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO chat_history VALUES (?, ?)",
+                    (video_hash, json.dumps(chat_history))
+                )
+            
+            self._conn.execute(
+                "INSERT INTO meta VALUES ('pickle_migrated', ?)", (datetime.now().isoformat(),)
+            )
+        
+        if migrated:
+            print(f"Migrated {migrated} cached videos from pickle files to {self.db_path}")
+    
+    def _rekey_by_video_id(self):
+        
+        # Entries written before keys were canonical are hashed from the raw URL
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'keyed_by_video_id'").fetchone():
+            return
+        
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'keyed_by_video_id'").fetchone():
+                return
+            
+            rows = self._conn.execute("SELECT video_hash, url FROM videos ORDER BY timestamp").fetchall()
+            for old_hash, url in rows:
+                new_hash = self._get_video_hash(url)
+                if new_hash == old_hash:
+                    continue
+                
+                # Rows are visited oldest first, so the newest copy of a video wins
+                self._conn.execute("DELETE FROM videos WHERE video_hash = ?", (new_hash,))
+                self._conn.execute("UPDATE videos SET video_hash = ? WHERE video_hash = ?", (new_hash, old_hash))
+                self._conn.execute("DELETE FROM artifacts WHERE video_hash = ?", (new_hash,))
+                self._conn.execute("UPDATE artifacts SET video_hash = ? WHERE video_hash = ?", (new_hash, old_hash))
+                
+                if self._conn.execute("SELECT 1 FROM chat_turns WHERE video_hash = ?", (old_hash,)).fetchone():
+                    self._conn.execute("DELETE FROM chat_turns WHERE video_hash = ?", (new_hash,))
+                    self._conn.execute("UPDATE chat_turns SET video_hash = ? WHERE video_hash = ?", (new_hash, old_hash))
+                
+                if self._conn.execute("SELECT 1 FROM chat_history WHERE video_hash = ?", (old_hash,)).fetchone():
+                    self._conn.execute("DELETE FROM chat_history WHERE video_hash = ?", (new_hash,))
+                    self._conn.execute("UPDATE chat_history SET video_hash = ? WHERE video_hash = ?", (new_hash, old_hash))
+            
+            self._conn.execute(
+                "INSERT INTO meta VALUES ('keyed_by_video_id', ?)", (datetime.now().isoformat(),)
+            )
+    
+    def _migrate_chat_history(self):
+        
+        # Whole-history blobs become one row per turn, so a new answer is a single append
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'chat_turns_migrated'").fetchone():
+            return
+        
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'chat_turns_migrated'").fetchone():
+                return
+            
+            for video_hash, history in self._conn.execute("SELECT video_hash, history FROM chat_history").fetchall():
+                self._conn.executemany(
+                    "INSERT INTO chat_turns (video_hash, turn) VALUES (?, ?)",
+                    [(video_hash, json.dumps(turn)) for turn in json.loads(history)]
+                )
+            self._conn.execute("DELETE FROM chat_history")
+            
+            self._conn.execute(
+                "INSERT INTO meta VALUES ('chat_turns_migrated', ?)", (datetime.now().isoformat(),)
+            )
     
     def _get_video_hash(self, video_url: str) -> str:
-        return hashlib.md5(video_url.encode()).hexdigest()
+        return hashlib.md5(canonical_video_key(video_url).encode()).hexdigest()
+    
+    def _memory_get(self, video_hash: str) -> Optional[Dict]:
+        
+        with self._memory_lock:
+            entry = self._memory.get(video_hash)
+            writes = self._local_writes
+        if entry is None:
+            return None
+        video_data, timestamp, _ = entry
+        
+        # data_version only moves when another connection commits, so until it does every entry this
+        # thread has already checked is current; otherwise one indexed lookup compares the row's timestamp
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if getattr(self._local, "seen", None) != (version, writes):
+            self._local.seen = (version, writes)
+            self._local.checked = set()
+        
+        if video_hash not in self._local.checked:
+            row = self._conn.execute("SELECT timestamp FROM videos WHERE video_hash = ?", (video_hash,)).fetchone()
+            if row is None or row[0] != timestamp:
+                self._memory_discard(video_hash)
+                return None
+            self._local.checked.add(video_hash)
+        
+        with self._memory_lock:
+            if video_hash in self._memory:
+                self._memory.move_to_end(video_hash)
+        return video_data
+    
+    def _memory_put(self, video_hash: str, video_data: Dict, writes: int):
+        
+        size = _entry_size(video_data)
+        if size > self.memory_bytes:
+            return
+        
+        with self._memory_lock:
+            # A save that landed while this copy was being read makes it stale before it is stored
+            if writes != self._local_writes:
+                return
+            
+            previous = self._memory.pop(video_hash, None)
+            if previous is not None:
+                self._memory_used -= previous[2]
+            self._memory[video_hash] = (video_data, video_data["timestamp"], size)
+            self._memory_used += size
+            
+            while self._memory_used > self.memory_bytes:
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_used -= evicted_size
+                self.memory_evictions += 1
+    
+    def _memory_discard(self, video_hash: str):
+        
+        with self._memory_lock:
+            entry = self._memory.pop(video_hash, None)
+            if entry is not None:
+                self._memory_used -= entry[2]
+            self._local_writes += 1
     
-    def _get_cache_path(self, video_hash: str, cache_type: str) -> str:
-        return os.path.join(self.cache_dir, f"{video_hash}_{cache_type}.pkl")
+    def memory_stats(self) -> Dict[str, Any]:
+        
+        total = self.memory_hits + self.memory_misses
+        with self._memory_lock:
+            return {
+                "entries": len(self._memory),
+                "bytes": self._memory_used,
+                "max_bytes": self.memory_bytes,
+                "hits": self.memory_hits,
+                "misses": self.memory_misses,
+                "hit_ratio": round(self.memory_hits / total, 4) if total else 0.0,
+                "evictions": self.memory_evictions
+            }
+    
+    def clear_memory(self):
+        
+        with self._memory_lock:
+            self._memory.clear()
+            self._memory_used = 0
+            self._local_writes += 1
+    
+    @timed("video_cache", op="save")
+    def save_video_data(self, video_url: str, transcript: str, summary: str, chunks: List[str] = None,
+                        segments: Optional[TranscriptSegments] = None, tone: Optional[str] = None,
+                        notes: Optional[Dict] = None):
+        video_hash = self._get_video_hash(video_url)
+        
+        # The write lock is taken up front: a read-only transaction cannot be upgraded once another writer commits
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            previous = self._conn.execute(
+                "SELECT transcript, packed.data FROM videos "
+                "LEFT JOIN artifacts AS packed ON packed.video_hash = videos.video_hash AND packed.name = 'packed' "
+                "WHERE videos.video_hash = ?",
+                (video_hash,)
+            ).fetchone()
+            changed = previous is not None and (_unpack(previous[1])[0] if previous[1] is not None
+                                                else previous[0]) != transcript
+            
+            self._conn.execute(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    video_hash,
+                    video_url,
+                    datetime.now().isoformat(),
+                    len(transcript),
+                    summary,
+                    transcript,
+                    json.dumps(chunks or [])
+                )
+            )
+            
+            # Indexes, chapters, notes and summaries all point into or describe the old transcript,
+            # so a different one starts them over; an unchanged one only drops its packed copy
+            if changed:
+                self._conn.execute("DELETE FROM artifacts WHERE video_hash = ?", (video_hash,))
+                self._conn.execute("DELETE FROM summaries WHERE video_hash = ?", (video_hash,))
+            else:
+                self._conn.execute("DELETE FROM artifacts WHERE video_hash = ? AND name = 'packed'", (video_hash,))
+            self._conn.execute(
+                "INSERT INTO access VALUES (?, ?, 0) ON CONFLICT(video_hash) DO UPDATE SET last_access = excluded.last_access",
+                (video_hash, time.time())
+            )
+            
+            if segments is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO artifacts VALUES (?, 'segments', ?)",
+                    (video_hash, segments.to_bytes())
+                )
+            
+            if tone is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                    (video_hash, tone, summary, datetime.now().isoformat())
+                )
+            
+            # Only notes covering every part are worth reusing for other styles
+            if notes is not None and notes.get("complete", True):
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO artifacts VALUES (?, 'notes', ?)",
+                    (video_hash, json.dumps(notes).encode("utf-8"))
+                )
+        
+        self._memory_discard(video_hash)
+        # Embedding matrices are files named after the video, so they are removed along with its other artifacts
+        if changed:
+            for path, _ in self._artifact_files().get(video_hash, []):
+                _remove_file(path)
     
-    def save_video_data(self, video_url: str, transcript: str, summary: str, chunks: List[str] = None):
+    @timed("video_cache", op="load")
+    def load_video_data(self, video_url: str) -> Optional[Dict]:
         video_hash = self._get_video_hash(video_url)
         
+        if self.memory_bytes > 0:
+            video_data = self._memory_get(video_hash)
+            get_metrics().cache_access("video_memory", video_data is not None)
+            if video_data is not None:
+                self.memory_hits += 1
+                get_metrics().cache_access("video", True)
+                self._record_access(video_hash)
+                return dict(video_data)
+            self.memory_misses += 1
+        
+        with self._memory_lock:
+            writes = self._local_writes
+        # One statement, so a row and its packed copy always come from the same snapshot
+        row = self._conn.execute(
+            "SELECT url, transcript, summary, chunks, timestamp, transcript_length, segments.data, packed.data "
+            "FROM videos "
+            "LEFT JOIN artifacts AS segments ON segments.video_hash = videos.video_hash AND segments.name = 'segments' "
+            "LEFT JOIN artifacts AS packed ON packed.video_hash = videos.video_hash AND packed.name = 'packed' "
+            "WHERE videos.video_hash = ?",
+            (video_hash,)
+        ).fetchone()
+        
+        get_metrics().cache_access("video", row is not None)
+        if row is None:
+            return None
+        self._record_access(video_hash)
+        
+        transcript, chunks = row[1], json.loads(row[3])
+        if row[7] is not None:
+            transcript, chunks = _unpack(row[7])
+        
         video_data = {
-            "url": video_url,
+            "url": row[0],
             "transcript": transcript,
-            "summary": summary,
-            "chunks": chunks or [],
-            "timestamp": datetime.now().isoformat(),
-            "transcript_length": len(transcript)
+            "summary": row[2],
+            "chunks": chunks,
+            "timestamp": row[4],
+            "transcript_length": row[5],
+            "segments": TranscriptSegments.from_bytes(row[6]) if row[6] else None
         }
         
-        cache_path = self._get_cache_path(video_hash, "data")
-        with open(cache_path, 'wb') as f:
-            pickle.dump(video_data, f)
+        if self.memory_bytes > 0:
+            self._memory_put(video_hash, video_data, writes)
+        return dict(video_data)
     
-    def load_video_data(self, video_url: str) -> Optional[Dict]:
+    def save_summary(self, video_url: str, tone: str, summary: str):
         video_hash = self._get_video_hash(video_url)
-        cache_path = self._get_cache_path(video_hash, "data")
         
-        if os.path.exists(cache_path):
-            with open(cache_path, 'rb') as f:
-                return pickle.load(f)
-        return None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+            (video_hash, tone, summary, datetime.now().isoformat())
+        )
+    
+    def load_summary(self, video_url: str, tone: str) -> Optional[str]:
+        video_hash = self._get_video_hash(video_url)
+        
+        row = self._conn.execute(
+            "SELECT summary FROM summaries WHERE video_hash = ? AND tone = ?", (video_hash, tone)
+        ).fetchone()
+        
+        get_metrics().cache_access("summary", row is not None)
+        if row is None:
+            return None
+        self._record_access(video_hash)
+        return row[0]
+    
+    def list_summaries(self, video_url: str) -> Dict[str, str]:
+        video_hash = self._get_video_hash(video_url)
+        
+        rows = self._conn.execute(
+            "SELECT tone, summary FROM summaries WHERE video_hash = ? ORDER BY timestamp", (video_hash,)
+        ).fetchall()
+        return dict(rows)
+    
+    def save_notes(self, video_url: str, notes: Dict):
+        if notes.get("complete", True):
+            self.save_artifact(video_url, "notes", json.dumps(notes).encode("utf-8"))
+    
+    def load_notes(self, video_url: str) -> Optional[Dict]:
+        
+        data = self.load_artifact(video_url, "notes")
+        return json.loads(data) if data else None
+    
+    def save_chapters(self, video_url: str, chapters: List[Dict]):
+        self.save_artifact(video_url, "chapters", json.dumps(chapters).encode("utf-8"))
+    
+    def load_chapters(self, video_url: str) -> Optional[List[Dict]]:
+        
+        data = self.load_artifact(video_url, "chapters")
+        return json.loads(data) if data else None
+    
+    def save_artifact(self, video_url: str, name: str, data: bytes):
+        video_hash = self._get_video_hash(video_url)
+        
+        self._conn.execute(
+            "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)", (video_hash, name, data)
+        )
+    
+    def load_artifact(self, video_url: str, name: str) -> Optional[bytes]:
+        video_hash = self._get_video_hash(video_url)
+        
+        row = self._conn.execute(
+            "SELECT data FROM artifacts WHERE video_hash = ? AND name = ?", (video_hash, name)
+        ).fetchone()
+        
+        return row[0] if row else None
+    
+    def artifact_path(self, video_url: str, name: str) -> str:
+        
+        # Large artifacts such as embedding matrices live next to the database so they can be memory-mapped
+        return os.path.join(self.cache_dir, f"{self._get_video_hash(video_url)}_{name}")
     
     def save_chat_history(self, video_url: str, chat_history: List[Dict]):
         video_hash = self._get_video_hash(video_url)
-        cache_path = self._get_cache_path(video_hash, "chat")
         
-        with open(cache_path, 'wb') as f:
-            pickle.dump(chat_history, f)
+        # Replaces the whole history; answering a question only needs append_chat_turn
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM chat_turns WHERE video_hash = ?", (video_hash,))
+            self._conn.executemany(
+                "INSERT INTO chat_turns (video_hash, turn) VALUES (?, ?)",
+                [(video_hash, json.dumps(turn)) for turn in chat_history]
+            )
+    
+    @timed("video_cache", op="append_chat_turn")
+    def append_chat_turn(self, video_url: str, turn: Dict):
+        video_hash = self._get_video_hash(video_url)
+        
+        # One INSERT is atomic, so processes chatting about the same video interleave turns without losing any
+        self._conn.execute(
+            "INSERT INTO chat_turns (video_hash, turn) VALUES (?, ?)", (video_hash, json.dumps(turn))
+        )
+        
+        appends = self._appends_since_compaction.get(video_hash, 0) + 1
+        self._appends_since_compaction[video_hash] = appends
+        if appends >= 50:
+            self.compact_chat_history(video_url)
+    
+    def compact_chat_history(self, video_url: str, max_turns: int = CHAT_MAX_TURNS) -> int:
+        video_hash = self._get_video_hash(video_url)
+        
+        self._appends_since_compaction.pop(video_hash, None)
+        cursor = self._conn.execute(
+            "DELETE FROM chat_turns WHERE video_hash = ? AND id <= ("
+            "SELECT id FROM chat_turns WHERE video_hash = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (video_hash, video_hash, max_turns)
+        )
+        return cursor.rowcount
     
-    def load_chat_history(self, video_url: str) -> List[Dict]:
+    @timed("video_cache", op="load_chat_history")
+    def load_chat_history(self, video_url: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
         video_hash = self._get_video_hash(video_url)
-        cache_path = self._get_cache_path(video_hash, "chat")
         
-        if os.path.exists(cache_path):
-            with open(cache_path, 'rb') as f:
-                return pickle.load(f)
-        return []
+        # Newest turns first from the index, handed back oldest first
+        rows = self._conn.execute(
+            "SELECT turn FROM chat_turns WHERE video_hash = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (video_hash, -1 if limit is None else limit, offset)
+        ).fetchall()
+        
+        return [json.loads(row[0]) for row in reversed(rows)]
+    
+    def count_chat_turns(self, video_url: str) -> int:
+        video_hash = self._get_video_hash(video_url)
+        
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM chat_turns WHERE video_hash = ?", (video_hash,)
+        ).fetchone()[0]
     
     def is_cached(self, video_url: str) -> bool:
-        return self.load_video_data(video_url) is not None
-    
-    def list_cached_videos(self) -> List[Dict]:
-        cached_videos = []
-        
-        for filename in os.listdir(self.cache_dir):
-            if filename.endswith("_data.pkl"):
-                cache_path = os.path.join(self.cache_dir, filename)
-                with open(cache_path, 'rb') as f:
-                    video_data = pickle.load(f)
-                    cached_videos.append({
-                        "url": video_data["url"],
-                        "timestamp": video_data["timestamp"],
-                        "length": video_data["transcript_length"]
-                    })
-        
-        return sorted(cached_videos, key=lambda x: x["timestamp"], reverse=True)
+        video_hash = self._get_video_hash(video_url)
+        
+        return self._conn.execute(
+            "SELECT 1 FROM videos WHERE video_hash = ?", (video_hash,)
+        ).fetchone() is not None
+    
+    def count_cached_videos(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+    
+    def list_cached_videos(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        
+        rows = self._conn.execute(
+            "SELECT url, timestamp, transcript_length FROM videos ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset)
+        ).fetchall()
+        
+        return [
+            {"url": url, "timestamp": timestamp, "length": length}
+            for url, timestamp, length in rows
+        ]
+    
+    def _record_access(self, video_hash: str):
+        
+        with self._access_lock:
+            self._pending_access[video_hash] = self._pending_access.get(video_hash, 0) + 1
+            due = len(self._pending_access) >= 100 or time.time() - self._last_access_flush >= 30
+        if due:
+            self.flush_access()
+    
+    def flush_access(self):
+        
+        with self._access_lock:
+            pending, self._pending_access = self._pending_access, {}
+            self._last_access_flush = time.time()
+        if not pending:
+            return
+        
+        # Hits add up across processes; the newest access time wins
+        now = time.time()
+        try:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "INSERT INTO access VALUES (?, ?, ?) ON CONFLICT(video_hash) DO UPDATE SET "
+                    "last_access = MAX(last_access, excluded.last_access), hits = hits + excluded.hits",
+                    [(video_hash, now, hits) for video_hash, hits in pending.items()]
+                )
+        except sqlite3.OperationalError as e:
+            print(f"Could not record cache access: {e}")
+    
+    def _entries(self) -> List[Dict[str, Any]]:
+        
+        rows = self._conn.execute(
+            "SELECT videos.video_hash, videos.timestamp, access.last_access, COALESCE(access.hits, 0), "
+            "LENGTH(CAST(videos.transcript AS BLOB)) + LENGTH(CAST(videos.chunks AS BLOB)) "
+            "+ LENGTH(CAST(videos.summary AS BLOB)) + LENGTH(videos.url), "
+            "(SELECT COALESCE(SUM(LENGTH(data)), 0) FROM artifacts WHERE artifacts.video_hash = videos.video_hash), "
+            "(SELECT COALESCE(SUM(LENGTH(CAST(turn AS BLOB))), 0) FROM chat_turns WHERE chat_turns.video_hash = videos.video_hash), "
+            "(SELECT COALESCE(SUM(LENGTH(CAST(summary AS BLOB))), 0) FROM summaries WHERE summaries.video_hash = videos.video_hash), "
+            "EXISTS (SELECT 1 FROM artifacts WHERE artifacts.video_hash = videos.video_hash AND artifacts.name = 'packed') "
+            "FROM videos LEFT JOIN access ON access.video_hash = videos.video_hash"
+        ).fetchall()
+        
+        files = self._artifact_files()
+        entries = []
+        for video_hash, timestamp, last_access, hits, row_bytes, artifact_bytes, chat_bytes, summary_bytes, packed in rows:
+            if last_access is None:
+                # Saved before access was tracked
+                last_access = datetime.fromisoformat(timestamp).timestamp()
+            entries.append({
+                "video_hash": video_hash,
+                "timestamp": timestamp,
+                "last_access": last_access,
+                "hits": hits,
+                "bytes": row_bytes + artifact_bytes + chat_bytes + summary_bytes
+                         + sum(size for _, size in files.get(video_hash, [])),
+                "packed": bool(packed)
+            })
+        return entries
+    
+    def _artifact_files(self) -> Dict[str, List[Tuple[str, int]]]:
+        
+        # Memory-mapped artifacts such as embedding matrices, grouped by the video they belong to
+        files: Dict[str, List[Tuple[str, int]]] = {}
+        for entry in os.scandir(self.cache_dir):
+            match = _ARTIFACT_FILE_RE.match(entry.name)
+            if match and entry.is_file() and not entry.name.endswith(".pkl"):
+                files.setdefault(match.group(1), []).append((entry.path, entry.stat().st_size))
+        return files
+    
+    def _evict(self, entry: Dict[str, Any]) -> bool:
+        
+        video_hash = entry["video_hash"]
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            
+            # Skipped if another process re-saved or used the video since the candidates were picked
+            cursor = self._conn.execute(
+                "DELETE FROM videos WHERE video_hash = ? AND timestamp = ? AND NOT EXISTS ("
+                "SELECT 1 FROM access WHERE access.video_hash = videos.video_hash AND access.last_access > ?)",
+                (video_hash, entry["timestamp"], entry["last_access"])
+            )
+            if cursor.rowcount == 0:
+                return False
+            
+            for table in ("artifacts", "summaries", "chat_turns", "access"):
+                self._conn.execute(f"DELETE FROM {table} WHERE video_hash = ?", (video_hash,))
+        
+        self._memory_discard(video_hash)
+        for path, _ in self._artifact_files().get(video_hash, []):
+            _remove_file(path)
+        return True
+    
+    def _pack_entry(self, entry: Dict[str, Any]) -> int:
+        
+        video_hash = entry["video_hash"]
+        row = self._conn.execute(
+            "SELECT transcript, chunks FROM videos WHERE video_hash = ? AND timestamp = ?",
+            (video_hash, entry["timestamp"])
+        ).fetchone()
+        if row is None:
+            return 0
+        
+        packed = _pack(row[0], json.loads(row[1]))
+        saved = len(row[0].encode("utf-8")) + len(row[1].encode("utf-8")) - len(packed)
+        if saved <= 0:
+            return 0
+        
+        # The emptied row and its packed copy land in one commit, so readers see one or the other
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            cursor = self._conn.execute(
+                "UPDATE videos SET transcript = '', chunks = '[]' WHERE video_hash = ? AND timestamp = ?",
+                (video_hash, entry["timestamp"])
+            )
+            if cursor.rowcount == 0:
+                return 0
+            self._conn.execute("INSERT OR REPLACE INTO artifacts VALUES (?, 'packed', ?)", (video_hash, packed))
+        return saved
+    
+    def _remove_orphans(self) -> Tuple[int, int]:
+        
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = 0
+            for table in ("artifacts", "summaries", "chat_turns", "access"):
+                rows += self._conn.execute(
+                    f"DELETE FROM {table} WHERE video_hash NOT IN (SELECT video_hash FROM videos)"
+                ).rowcount
+        
+        known = {row[0] for row in self._conn.execute("SELECT video_hash FROM videos")}
+        files = 0
+        for video_hash, paths in self._artifact_files().items():
+            if video_hash not in known:
+                files += sum(_remove_file(path) for path, _ in paths)
+        return rows, files
+    
+    def _pickled_video_hash(self, video_hash: str) -> Optional[str]:
+        
+        # Rows were re-keyed by video ID after the migration, so a pickle is matched through the URL it holds
+        try:
+            with open(os.path.join(self.cache_dir, f"{video_hash}_data.pkl"), "rb") as f:
+                return self._get_video_hash(pickle.load(f)["url"])
+        except Exception:
+            return None
+    
+    def _remove_migrated_pickles(self) -> int:
+        
+        # Pickle files already copied into the database are only duplicates now. One the migration
+        # skipped as unreadable has no row behind it and is left alone
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'pickle_migrated'").fetchone()
+        if row is None:
+            return 0
+        
+        migrated_at = datetime.fromisoformat(row[0]).timestamp()
+        stored = {
+            "_chat.pkl": {row[0] for row in self._conn.execute("SELECT DISTINCT video_hash FROM chat_turns")},
+            "_data.pkl": {row[0] for row in self._conn.execute("SELECT video_hash FROM videos")}
+        }
+        
+        # Chat files first, while the data file that names their video is still there
+        removed = 0
+        for suffix in ("_chat.pkl", "_data.pkl"):
+            for path in glob.glob(os.path.join(self.cache_dir, f"*{suffix}")):
+                if os.path.getmtime(path) > migrated_at:
+                    continue
+                video_hash = os.path.basename(path)[:-len(suffix)]
+                if video_hash in stored[suffix] or self._pickled_video_hash(video_hash) in stored[suffix]:
+                    removed += _remove_file(path)
+        return removed
+    
+    def _database_bytes(self) -> int:
+        return sum(os.path.getsize(path) for path in (self.db_path, self.db_path + "-wal") if os.path.exists(path))
+    
+    def stats(self) -> Dict[str, Any]:
+        
+        self.flush_access()
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(entry["bytes"] for entry in entries),
+            "packed": sum(entry["packed"] for entry in entries),
+            "database_bytes": self._database_bytes(),
+            "memory": self.memory_stats()
+        }
+    
+    def compact(self, max_bytes: int = VIDEO_CACHE_MAX_BYTES, max_entries: int = VIDEO_CACHE_MAX_ENTRIES,
+                max_age: float = VIDEO_CACHE_MAX_AGE, policy: str = VIDEO_CACHE_EVICTION,
+                compress_after: float = VIDEO_CACHE_COMPRESS_AFTER, vacuum: bool = False,
+                dry_run: bool = False) -> Dict[str, Any]:
+        
+        # Each video is removed or packed in its own short transaction: readers in other processes are
+        # never blocked and writers wait for one video at most
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy {policy!r}, expected 'lru' or 'lfu'")
+        
+        start_time = time.time()
+        database_bytes = self._database_bytes()
+        self.flush_access()
+        entries = self._entries()
+        report = {
+            "entries_before": len(entries),
+            "bytes_before": sum(entry["bytes"] for entry in entries),
+            "expired": 0,
+            "evicted": 0,
+            "packed": 0,
+            "packed_bytes_saved": 0,
+            "orphan_rows_removed": 0,
+            "files_removed": 0,
+            "vacuumed": False,
+            "dry_run": dry_run
+        }
+        
+        now = time.time()
+        expired = [entry for entry in entries if max_age > 0 and now - entry["last_access"] > max_age]
+        kept = [entry for entry in entries if not (max_age > 0 and now - entry["last_access"] > max_age)]
+        
+        if policy == "lfu":
+            kept.sort(key=lambda entry: (entry["hits"], entry["last_access"]))
+        else:
+            kept.sort(key=lambda entry: entry["last_access"])
+        
+        # Least valuable first until both limits hold
+        total_bytes = sum(entry["bytes"] for entry in kept)
+        evicted = 0
+        while evicted < len(kept) and ((max_entries > 0 and len(kept) - evicted > max_entries)
+                                       or (max_bytes > 0 and total_bytes > max_bytes)):
+            total_bytes -= kept[evicted]["bytes"]
+            evicted += 1
+        evicted, kept = kept[:evicted], kept[evicted:]
+        
+        if dry_run:
+            report.update(expired=len(expired), evicted=len(evicted), entries=len(kept), bytes=total_bytes,
+                          database_bytes=database_bytes, seconds=round(time.time() - start_time, 3))
+            return report
+        
+        report["expired"] = sum(self._evict(entry) for entry in expired)
+        report["evicted"] = sum(self._evict(entry) for entry in evicted)
+        
+        if compress_after > 0:
+            for entry in kept:
+                if not entry["packed"] and now - entry["last_access"] > compress_after:
+                    saved = self._pack_entry(entry)
+                    report["packed"] += saved > 0
+                    report["packed_bytes_saved"] += saved
+        
+        report["orphan_rows_removed"], report["files_removed"] = self._remove_orphans()
+        report["files_removed"] += self._remove_migrated_pickles()
+        
+        if vacuum:
+            try:
+                self._conn.execute("VACUUM")
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                report["vacuumed"] = True
+            except sqlite3.OperationalError as e:
+                print(f"Skipping VACUUM: {e}")
+        
+        entries = self._entries()
+        report.update(entries=len(entries), bytes=sum(entry["bytes"] for entry in entries),
+                      database_bytes_before=database_bytes, database_bytes=self._database_bytes(),
+                      seconds=round(time.time() - start_time, 3))
+        
+        metrics = get_metrics()
+        metrics.inc("video_cache_evictions_total", report["expired"], reason="age")
+        metrics.inc("video_cache_evictions_total", report["evicted"], reason=policy)
+        return report
+    
+    def start_compaction(self, interval: float = VIDEO_CACHE_COMPACT_INTERVAL, **policy) -> threading.Thread:
+        
+        # Compacts right away and then every `interval` seconds on a daemon thread with its own connection
+        if self._compaction_thread is not None:
+            return self._compaction_thread
+        
+        self._compaction_stop = threading.Event()
+        
+        def run():
+            while True:
+                try:
+                    report = self.compact(**policy)
+                    if report["expired"] or report["evicted"] or report["packed"]:
+                        print(f"Video cache compacted: {report['expired']} expired, {report['evicted']} evicted, "
+                              f"{report['packed']} packed; {report['entries']} videos, {report['bytes']} bytes left")
+                except sqlite3.Error as e:
+                    print(f"Video cache compaction failed: {e}")
+                if self._compaction_stop.wait(interval):
+                    return
+        
+        self._compaction_thread = threading.Thread(target=run, name="video-cache-compaction", daemon=True)
+        self._compaction_thread.start()
+        return self._compaction_thread
+    
+    def stop_compaction(self, timeout: Optional[float] = None):
+        
+        if self._compaction_thread is None:
+            return
+        self._compaction_stop.set()
+        self._compaction_thread.join(timeout)
+        self._compaction_thread = None
+
+def _remove_file(path: str) -> bool:
+    
+    # Another process compacting the same directory may have got there first
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+def main(argv: Optional[List[str]] = None):
+    
+    parser = argparse.ArgumentParser(description="Inspect the video cache or apply its retention policy")
+    parser.add_argument("command", choices=("stats", "compact"))
+    parser.add_argument("--cache-dir", default="video_cache")
+    parser.add_argument("--max-bytes", type=int, default=VIDEO_CACHE_MAX_BYTES, help="0 for no size limit")
+    parser.add_argument("--max-entries", type=int, default=VIDEO_CACHE_MAX_ENTRIES, help="0 for no entry limit")
+    parser.add_argument("--max-age", type=float, default=VIDEO_CACHE_MAX_AGE,
+                        help="Evict videos unused for this many seconds, 0 to keep them")
+    parser.add_argument("--policy", choices=("lru", "lfu"), default=VIDEO_CACHE_EVICTION)
+    parser.add_argument("--compress-after", type=float, default=VIDEO_CACHE_COMPRESS_AFTER,
+                        help="Compress transcripts unused for this many seconds, 0 to leave them as text")
+    parser.add_argument("--vacuum", action="store_true", help="Give freed pages back to the filesystem")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be evicted")
+    args = parser.parse_args(argv)
+    
+    cache = VideoCache(args.cache_dir)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+        return
+    
+    report = cache.compact(max_bytes=args.max_bytes, max_entries=args.max_entries, max_age=args.max_age,
+                           policy=args.policy, compress_after=args.compress_after, vacuum=args.vacuum,
+                           dry_run=args.dry_run)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,41 @@
 import re
-from typing import List, Dict, Any, Optional
-from llm_endpoint import call_model_single
+import os
+import bisect
+from typing import Callable, List, Dict, Any, Optional
+from llm_endpoint import call_model_single, call_model_stream
+from chunking import count_tokens, truncate_to_tokens
 from video_cache import VideoCache
+from metrics import timed
+from transcript_segments import TranscriptSegments, format_timestamp
+from lexical_index import BM25Index, tokenize
+from semantic_index import SemanticIndex, fuse_rankings, get_embedder, semantic_available
+from chapters import chapter_at_offset, chapter_label
+
+INDEX_ARTIFACT = "bm25_v1"
+CHAT_RETRIEVAL = os.getenv("CHAT_RETRIEVAL", "lexical")
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "2500"))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "600"))
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "2"))
+CHAT_LOAD_TURNS = int(os.getenv("CHAT_LOAD_TURNS", "50"))
+
+_CLOCK_RE = re.compile(r"\b(?:(\d{1,2}):)?(\d{1,2}):(\d{2})\b")
+_MINUTE_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*(?:m|min|mins|minute|minutes)\b|\bminute\s+(\d+(?:\.\d+)?)\b")
+_CHAPTER_RE = re.compile(r"\bchapter\s+(\d+)\b")
+_FIRST_SENTENCE_RE = re.compile(r"^(.+?[.!?])(?:\s|$)", re.DOTALL)
+
+_SMALL_TALK_REPLIES = {
+    "thanks": "You're welcome! Ask me anything else about the video.",
+    "thank": "You're welcome! Ask me anything else about the video.",
+    "thx": "You're welcome! Ask me anything else about the video.",
+    "hi": "Hi! Ask me anything about the video.",
+    "hello": "Hi! Ask me anything about the video.",
+    "hey": "Hi! Ask me anything about the video.",
+}
 
 class VideoDetailBot:
     
-    def __init__(self):
-        self.cache = VideoCache()
+    def __init__(self, retrieval: str = CHAT_RETRIEVAL, cache: Optional[VideoCache] = None):
+        self.cache = cache or VideoCache()
         self.current_video_data = None
         self.chat_history = []
         
@@ -23,14 +52,38 @@ class VideoDetailBot:
             "when they talk about", "the section about",
             "minute", "timestamp", "time"
         ]
+        
+        # Seconds of transcript sent to the model around a time the user asks about
+        self.time_window = 120
+        self.chunk_times = []
+        self.chunk_offsets = []
+        self.chapters = []
+        
+        self.index = None
+        self.semantic_index = None
+        self.top_k = 5
+        
+        # Token budgets for the transcript excerpts and the conversation so far in each prompt
+        self.context_tokens = CHAT_CONTEXT_TOKENS
+        self.history_tokens = CHAT_HISTORY_TOKENS
+        self.recent_turns = CHAT_RECENT_TURNS
+        self.last_turn_stats = {}
+        
+        # "lexical" (BM25 only), "semantic" (embeddings only) or "hybrid" (both, rank-fused)
+        self.retrieval = retrieval
+        if retrieval != "lexical" and not semantic_available():
+            print("NumPy is not installed, falling back to lexical retrieval")
+            self.retrieval = "lexical"
     
-    def load_video(self, video_url: str, transcript: str = None, summary: str = None, chunks: List[str] = None):
+    def load_video(self, video_url: str, transcript: str = None, summary: str = None, chunks: List[str] = None,
+                   segments: Optional[TranscriptSegments] = None):
         
         cached_data = self.cache.load_video_data(video_url)
         
         if cached_data:
             self.current_video_data = cached_data
-            self.chat_history = self.cache.load_chat_history(video_url)
+            # Only recent turns matter for follow-ups; older ones stay on disk
+            self.chat_history = self.cache.load_chat_history(video_url, limit=CHAT_LOAD_TURNS)
             print("Video loaded from cache. You can now ask detailed questions!")
         else:
             if transcript and summary:
@@ -39,17 +92,78 @@ class VideoDetailBot:
                     "transcript": transcript,
                     "summary": summary,
                     "chunks": chunks or [],
-                    "transcript_length": len(transcript)
+                    "transcript_length": len(transcript),
+                    "segments": segments
                 }
-                self.cache.save_video_data(video_url, transcript, summary, chunks)
+                self.cache.save_video_data(video_url, transcript, summary, chunks, segments)
                 self.chat_history = []
                 print("Video cached. You can now ask detailed questions!")
             else:
                 print("No video data available")
                 return False
         
+        transcript = self.current_video_data["transcript"]
+        chunks = self.current_video_data.get("chunks", [])
+        segments = self.current_video_data.get("segments")
+        
+        self.chunk_offsets = []
+        search_from = 0
+        for chunk in chunks:
+            position = transcript.find(chunk[:200], search_from)
+            self.chunk_offsets.append(max(position, search_from))
+            search_from = max(position, search_from) + 1
+        
+        if segments is not None:
+            self.chunk_times = segments.chunk_time_spans(transcript, chunks)
+        else:
+            self.chunk_times = []
+        
+        self.index = self.load_index(video_url)
+        self.chapters = self.cache.load_chapters(video_url) or []
+        self.semantic_index = self.load_semantic_index(video_url) if self.retrieval != "lexical" else None
         return True
     
+    def load_index(self, video_url: str) -> BM25Index:
+        
+        data = self.cache.load_artifact(video_url, INDEX_ARTIFACT)
+        if data is not None:
+            return BM25Index.from_bytes(data)
+        
+        segments = self.current_video_data.get("segments")
+        boundaries = segments.boundaries() if segments is not None else None
+        index = BM25Index.build(self.current_video_data["transcript"], boundaries)
+        
+        self.cache.save_artifact(video_url, INDEX_ARTIFACT, index.to_bytes())
+        return index
+    
+    def load_semantic_index(self, video_url: str) -> SemanticIndex:
+        
+        embedder = get_embedder()
+        path = self.cache.artifact_path(video_url, f"embeddings_{embedder.name}.npy")
+        
+        if os.path.exists(path):
+            semantic_index = SemanticIndex.load(path, embedder)
+            if len(semantic_index) == len(self.index):
+                return semantic_index
+        
+        # Embed the same passages BM25 indexes so both rankings share document ids
+        transcript = self.current_video_data["transcript"]
+        passages = [transcript[start:end] for start, end in (self.index.span(i) for i in range(len(self.index)))]
+        semantic_index = SemanticIndex.build(passages, embedder)
+        semantic_index.save(path)
+        return SemanticIndex.load(path, embedder)
+    
+    def search_passages(self, query: str):
+        
+        if self.retrieval == "lexical" or self.semantic_index is None:
+            return self.index.search(query, k=self.top_k) if self.index is not None else []
+        
+        semantic_hits = self.semantic_index.search(query, k=self.top_k * 2)
+        if self.retrieval == "semantic":
+            return semantic_hits[:self.top_k]
+        
+        return fuse_rankings([self.index.search(query, k=self.top_k * 2), semantic_hits], k=self.top_k)
+    
     def should_activate_ai(self, user_input: str) -> bool:
         
         user_input_lower = user_input.lower()
@@ -63,48 +177,188 @@ class VideoDetailBot:
         
         return has_detail_trigger or starts_with_question or has_question_mark
     
-    def find_relevant_parts(self, query: str) -> str:
+    def parse_time_reference(self, query: str) -> Optional[float]:
+        
+        match = _CLOCK_RE.search(query)
+        if match:
+            hours, minutes, seconds = match.groups()
+            return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+        
+        match = _MINUTE_RE.search(query.lower())
+        if match:
+            return float(match.group(1) or match.group(2)) * 60
+        
+        return None
+    
+    def section_label(self, index: int) -> str:
+        
+        if index < len(self.chunk_times) and self.chunk_times[index]:
+            start, end = self.chunk_times[index]
+            return f"Section {index + 1} ({format_timestamp(start)}-{format_timestamp(end)})"
+        return f"Section {index + 1}"
+    
+    def excerpt_label(self, offset: int) -> str:
+        
+        label = "Excerpt"
+        chapter = chapter_at_offset(self.chapters, offset)
+        if chapter is not None:
+            label = chapter_label(chapter)
+        elif self.chunk_offsets:
+            label = self.section_label(max(0, bisect.bisect_right(self.chunk_offsets, offset) - 1))
+        
+        segments = self.current_video_data.get("segments")
+        if segments is not None and len(segments):
+            label += f", around {format_timestamp(segments.starts[segments.index_at_offset(offset)])}"
+        return label
+    
+    @timed("chat_retrieval")
+    def find_relevant_parts(self, query: str, max_tokens: Optional[int] = None) -> str:
         
         if not self.current_video_data:
             return "No video loaded"
         
+        max_tokens = max_tokens or self.context_tokens
         transcript = self.current_video_data["transcript"]
-        chunks = self.current_video_data.get("chunks", [])
+        segments = self.current_video_data.get("segments")
         
-        query_words = query.lower().split()
-        relevant_sections = []
+        # "What did they say around 42:10" only needs the transcript around that moment
+        if segments is not None and len(segments):
+            seconds = self.parse_time_reference(query)
+            if seconds is not None and seconds <= segments.duration:
+                half_window = self.time_window / 2
+                window = segments.text_between(transcript, seconds - half_window, seconds + half_window)
+                if window:
+                    start = max(0, seconds - half_window)
+                    label = f"Transcript from {format_timestamp(start)} to {format_timestamp(seconds + half_window)}: "
+                    return label + truncate_to_tokens(window, max_tokens - count_tokens(label))
         
-        search_sections = chunks if chunks else [transcript]
+        # "What happens in chapter 3" is answered from that chapter alone
+        match = _CHAPTER_RE.search(query.lower())
+        if match and 1 <= int(match.group(1)) <= len(self.chapters):
+            return self.chapter_context(self.chapters[int(match.group(1)) - 1], query, max_tokens)
         
-        for i, section in enumerate(search_sections):
-            section_lower = section.lower()
-            
-            matches = sum(1 for word in query_words if word in section_lower)
+        hits = self.search_passages(query)
+        
+        # Otherwise the chapter holding the best passage is described before the excerpts
+        chapter_header = ""
+        if hits and self.chapters:
+            chapter = chapter_at_offset(self.chapters, self.index.span(hits[0][0])[0])
+            if chapter is not None and chapter.get("summary"):
+                chapter_header = truncate_to_tokens(f"{chapter_label(chapter)}, summary: {chapter['summary']}",
+                                                    max_tokens // 4)
+                max_tokens -= count_tokens(chapter_header)
+        
+        if hits:
+            # Best passages first until the budget is spent, always at least one
+            excerpts = []
+            spent = 0
+            for doc_id, _ in hits:
+                start, end = self.index.span(doc_id)
+                excerpt = f"{self.excerpt_label(start)}: {transcript[start:end]}"
+                tokens = count_tokens(excerpt)
+                if excerpts and spent + tokens > max_tokens:
+                    continue
+                excerpts.append((start, excerpt))
+                spent += tokens
             
-            if matches > 0:
-                relevant_sections.append({
-                    "section": section,
-                    "matches": matches,
-                    "index": i
-                })
-        
-        relevant_sections.sort(key=lambda x: x["matches"], reverse=True)
-        
-        if relevant_sections:
-            top_sections = relevant_sections[:3]
-            context = "\\n\\n".join([f"Section {s['index'] + 1}: {s['section']}" for s in top_sections])
-            return context
+            # Keep the excerpts in video order so the model reads them as a story
+            context = "\n\n".join([excerpt for _, excerpt in sorted(excerpts)])
+            return f"{chapter_header}\n\n{context}" if chapter_header else context
         else:
-            summary = self.current_video_data["summary"]
-            transcript_preview = transcript[:2000] + "..." if len(transcript) > 2000 else transcript
-            return f"Summary: {summary}\\n\\nTranscript Preview: {transcript_preview}"
+            summary = truncate_to_tokens(self.current_video_data["summary"], max_tokens // 2)
+            transcript_preview = truncate_to_tokens(transcript[:20000], max_tokens - count_tokens(summary))
+            return f"Summary: {summary}\n\nTranscript Preview: {transcript_preview}"
+    
+    def chapter_context(self, chapter: Dict[str, Any], query: str, max_tokens: int) -> str:
+        
+        transcript = self.current_video_data["transcript"]
+        header = chapter_label(chapter)
+        if chapter.get("summary"):
+            header = truncate_to_tokens(f"{header}, summary: {chapter['summary']}", max_tokens // 3)
+        budget = max_tokens - count_tokens(header)
+        
+        # The best passages inside the chapter, or its opening when the question names nothing else
+        excerpts = []
+        spent = 0
+        hits = self.index.search(query, k=len(self.index)) if self.index is not None else []
+        for doc_id, _ in hits:
+            start, end = self.index.span(doc_id)
+            if not chapter["start_offset"] <= start < chapter["end_offset"]:
+                continue
+            tokens = count_tokens(transcript[start:end])
+            if spent + tokens > budget:
+                break
+            excerpts.append((start, transcript[start:end]))
+            spent += tokens
+        
+        if not excerpts:
+            text = transcript[chapter["start_offset"]:chapter["end_offset"]]
+            return f"{header}\n\n{truncate_to_tokens(text, budget)}"
+        return header + "\n\n" + "\n\n".join(excerpt for _, excerpt in sorted(excerpts))
+    
+    def compact_history(self, max_tokens: Optional[int] = None) -> str:
+        
+        # Recent turns close to verbatim, older ones squeezed to their question and the answer's
+        # first sentence, and the oldest dropped once the budget runs out
+        max_tokens = max_tokens if max_tokens is not None else self.history_tokens
+        if not self.chat_history or max_tokens <= 0:
+            return ""
+        
+        lines = []
+        spent = 0
+        turns = self.chat_history[::-1]
+        for age, turn in enumerate(turns):
+            answer = " ".join(turn.get("assistant", "").split())
+            if age >= self.recent_turns:
+                match = _FIRST_SENTENCE_RE.match(answer)
+                answer = match.group(1) if match else answer
+                answer = truncate_to_tokens(answer, 60)
+            else:
+                answer = truncate_to_tokens(answer, max_tokens // (2 * max(1, self.recent_turns)))
+            
+            line = f"User: {turn.get('user', '')}\nAssistant: {answer}"
+            tokens = count_tokens(line)
+            if spent + tokens > max_tokens:
+                break
+            lines.append(line)
+            spent += tokens
+        
+        return "\n".join(lines[::-1])
+    
+    def retrieval_query(self, user_query: str) -> str:
+        
+        # Follow-ups like "and the second one?" say too little to search on, so borrow the previous question
+        if len(tokenize(user_query)) < 3 and self.chat_history:
+            return f"{self.chat_history[-1].get('user', '')} {user_query}"
+        return user_query
     
-    def get_detailed_explanation(self, user_query: str) -> str:
+    def small_talk_reply(self, user_input: str) -> Optional[str]:
+        
+        # Acknowledgements and greetings need no transcript and no model call
+        if self.should_activate_ai(user_input):
+            return None
+        
+        words = re.findall(r"[a-z']+", user_input.lower())
+        if not words or len(words) > 4:
+            return None
+        if words[0] in _SMALL_TALK_REPLIES:
+            return _SMALL_TALK_REPLIES[words[0]]
+        if words[0] in ("ok", "okay", "cool", "great", "nice", "got", "awesome", "perfect", "k"):
+            return "Glad that helped! Ask me anything else about the video."
+        return None
+    
+    def get_detailed_explanation(self, user_query: str, on_delta: Optional[Callable[[str], None]] = None) -> str:
         
         if not self.current_video_data:
             return "Please load a video first before asking questions."
         
-        relevant_context = self.find_relevant_parts(user_query)
+        relevant_context = self.find_relevant_parts(self.retrieval_query(user_query))
+        conversation = self.compact_history()
+        conversation_section = f"""
+Conversation so far (for follow-up questions):
+
+{conversation}
+""" if conversation else ""
         
         system_prompt = f"""
 You are a helpful assistant that provides detailed explanations about YouTube videos.
@@ -112,7 +366,7 @@ You are a helpful assistant that provides detailed explanations about YouTube vi
 The user is asking about a specific part or topic from a video. Here's the relevant context from the video:
 
 {relevant_context}
-
+{conversation_section}
 User's question: {user_query}
 
 Provide a detailed, helpful explanation that directly answers their question based on the video content.
@@ -120,7 +374,16 @@ If the question is about something not covered in the video, say so clearly.
 Be conversational and helpful, but stick to what's actually in the video.
 """
         
-        result = call_model_single(user_query, system_prompt)
+        self.last_turn_stats = {
+            "prompt_tokens": count_tokens(system_prompt) + count_tokens(user_query),
+            "context_tokens": count_tokens(relevant_context),
+            "history_tokens": count_tokens(conversation)
+        }
+        
+        if on_delta is not None:
+            result = call_model_stream(user_query, system_prompt, on_delta)
+        else:
+            result = call_model_single(user_query, system_prompt)
         
         if "error" in result:
             return f"Sorry, I couldn't process your question: {result['error']}"
@@ -128,24 +391,34 @@ Be conversational and helpful, but stick to what's actually in the video.
         if "choices" in result and len(result["choices"]) > 0:
             response = result["choices"][0]["message"]["content"]
             
-            self.chat_history.append({
+            turn = {
                 "user": user_query,
                 "assistant": response,
-                "timestamp": str(datetime.now())
-            })
+                "timestamp": str(datetime.now()),
+                "usage": result.get("usage", {}),
+                "timing": result.get("timing", {}),
+                "prompt_tokens": self.last_turn_stats["prompt_tokens"]
+            }
+            self.chat_history.append(turn)
+            self.chat_history = self.chat_history[-CHAT_LOAD_TURNS:]
             
             if self.current_video_data:
-                self.cache.save_chat_history(self.current_video_data["url"], self.chat_history)
+                self.cache.append_chat_turn(self.current_video_data["url"], turn)
             
             return response
         else:
             return "Sorry, I couldn't generate a response."
     
-    def handle_user_input(self, user_input: str) -> str:
+    def handle_user_input(self, user_input: str, on_delta: Optional[Callable[[str], None]] = None) -> str:
         
         if user_input.lower() in ['quit', 'exit', 'bye']:
             return "chat_exit"
         
-        return self.get_detailed_explanation(user_input)
+        reply = self.small_talk_reply(user_input)
+        if reply is not None:
+            self.last_turn_stats = {"prompt_tokens": 0, "context_tokens": 0, "history_tokens": 0}
+            return reply
+        
+        return self.get_detailed_explanation(user_input, on_delta)
     
 from datetime import datetime